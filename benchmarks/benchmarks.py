@@ -0,0 +1,411 @@
+"""Benchmarks of the tracks on synthetic data.
+
+The benchmarks generate synthetic bigWig files, BED records, and GTF
+records offline, and time the data selection, the artist creation, and
+Figure.savefig of each track separately. The results are stored as JSON,
+so that the results of two versions can be compared using
+compare_results.
+
+Usage (with raesymatto installed, e.g. pip install -e .):
+    python benchmarks/benchmarks.py results.json --features 1000 100000
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+import warnings
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import matplotlib as mpl
+import numpy as np
+import pandas as pd
+
+import pyBigWig
+
+import raesymatto
+from raesymatto import visualizations
+from raesymatto.genes import GeneModelIndex
+from raesymatto.intervals import BedIndex, get_intervals
+
+# the synthetic chromosome
+CHROMOSOME = 'chr1'
+CHROMOSOME_LENGTH = 250_000_000
+
+# bw draws the bins of the zoom levels and bw_bases every base
+TRACKS = ('bw','bw_bases','bed','boxes','loops','gene_models')
+FEATURES = (1_000,100_000,1_000_000)
+WINDOWS = (10_000,1_000_000,10_000_000)
+
+# rows of a synthetic transcript: exons and the CDSs between them
+EXONS = 5
+
+def make_bigwig(path:str,n:int,length:int=CHROMOSOME_LENGTH,
+                seed:int=0) -> str:
+    """Writes a synthetic bigWig file.
+
+    The chromosome is covered by n intervals of random lengths with
+    random, peaky values.
+
+    Args:
+        path (str): Output file.
+        n (int): Number of intervals.
+        length (int): Length of the chromosome.
+        seed (int): Random seed.
+
+    Returns:
+        str: Path of the bigWig file.
+
+    """
+    rng = np.random.default_rng(seed)
+    ends = np.sort(rng.choice(length-1,n-1,replace=False)+1)
+    starts = np.concatenate(([0],ends)).astype(np.int64)
+    ends = np.append(ends,length).astype(np.int64)
+    values = rng.gamma(0.5,2.0,n)
+
+    bw = pyBigWig.open(path,'w')
+    bw.addHeader([(CHROMOSOME,length)])
+    bw.addEntries([CHROMOSOME]*n,starts,ends=ends,values=values)
+    bw.close()
+    return path
+
+def make_bed(n:int,length:int=CHROMOSOME_LENGTH,max_length:int=5000,
+             seed:int=0) -> pd.DataFrame:
+    """Returns synthetic BED records.
+
+    Args:
+        n (int): Number of records.
+        length (int): Length of the chromosome.
+        max_length (int): Maximum length of a record.
+        seed (int): Random seed.
+
+    Returns:
+        pd.DataFrame: Records in BED6 format sorted by the start.
+
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1,max_length,n)
+    starts = np.sort(rng.integers(0,length-max_length,n))
+    return pd.DataFrame({0:CHROMOSOME,
+                         1:starts,
+                         2:starts+lengths,
+                         3:np.char.add('r',np.arange(n).astype(str)),
+                         4:rng.integers(0,1000,n),
+                         5:rng.choice(np.array(['+','-']),n)})
+
+def make_genes(n:int,length:int=CHROMOSOME_LENGTH,
+               seed:int=0) -> pd.DataFrame:
+    """Returns synthetic GTF records.
+
+    Each transcript has EXONS exons and the CDSs of its inner exons, and
+    every other transcript is an isoform of the preceding gene.
+
+    Args:
+        n (int): Approximate number of records.
+        length (int): Length of the chromosome.
+        seed (int): Random seed.
+
+    Returns:
+        pd.DataFrame: Records in GTF format.
+
+    """
+    rng = np.random.default_rng(seed)
+    n_transcripts = max(n//(2*EXONS-2),1)
+
+    exon_lengths = rng.integers(50,2000,(n_transcripts,EXONS))
+    intron_lengths = rng.integers(100,20000,(n_transcripts,EXONS))
+    steps = exon_lengths+intron_lengths
+    offsets = np.cumsum(steps,axis=1)-steps
+    starts = (rng.integers(0,length-offsets[:,-1].max()-2000,
+                           n_transcripts)[:,None]+offsets)
+    ends = starts+exon_lengths
+
+    transcripts = np.repeat(np.arange(n_transcripts),EXONS)
+    exons = pd.DataFrame({'start':starts.ravel(),'end':ends.ravel(),
+                          'transcript':transcripts,'feature':'exon'})
+    inner = np.tile(np.isin(np.arange(EXONS),[0,EXONS-1],invert=True),
+                    n_transcripts)
+    cds = exons[inner].assign(feature='CDS')
+    genes = (pd.concat((exons,cds),ignore_index=True)
+             .sort_values(['transcript','start'],kind='stable'))
+
+    transcript = genes['transcript'].values
+    gene_ids = np.char.add('G',(transcript//2).astype(str))
+    strands = rng.choice(np.array(['+','-']),n_transcripts)
+    return pd.DataFrame({'seqname':CHROMOSOME,
+                         'feature':genes['feature'].values,
+                         'start':genes['start'].values,
+                         'end':genes['end'].values,
+                         'strand':strands[transcript],
+                         'transcript_id':np.char.add('T',
+                                                     transcript.astype(str)),
+                         'gene_id':gene_ids,
+                         'gene_name':np.char.add(gene_ids,'_name')})
+
+def make_data(track:str,n:int,work_dir:str,seed:int=0):
+    """Returns the synthetic data of a track.
+
+    The bigWig files are written to work_dir once and reused, whereas the
+    BED and GTF records are indexed in memory.
+
+    Args:
+        track (str): Track type, see TRACKS.
+        n (int): Number of features.
+        work_dir (str): Directory of the bigWig files.
+        seed (int): Random seed.
+
+    Returns:
+        Union[pyBigWig.pyBigWig,BedIndex,GeneModelIndex]: Data.
+
+    """
+    if track in ('bw','bw_bases'):
+        path = os.path.join(work_dir,'synthetic_%d_%d.bw'%(n,seed))
+        if not os.path.exists(path):
+            make_bigwig(path+'.tmp',n,seed=seed)
+            os.replace(path+'.tmp',path)
+        return pyBigWig.open(path)
+    if track in ('bed','boxes'):
+        return BedIndex(make_bed(n,seed=seed))
+    if track == 'loops':
+        return BedIndex(make_bed(n,max_length=1_000_000,seed=seed))
+    if track == 'gene_models':
+        return GeneModelIndex(make_genes(n,seed=seed))
+    raise ValueError('Unknown track type: %s'%track)
+
+def get_stages(track:str,data,ax:mpl.axes.Axes,start:int,
+               end:int) -> Tuple[Callable[[],object],Callable[[object],None]]:
+    """Returns the data selection and the drawing of a track.
+
+    Args:
+        track (str): Track type, see TRACKS.
+        data: Data, see make_data.
+        ax (mpl.axes.Axes): Axes to be used.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+
+    Returns:
+        Tuple[Callable[[],object],Callable[[object],None]]: Function
+            selecting the data of the window, and function drawing it.
+
+    """
+    if track == 'bw':
+        nbins = visualizations.get_pixel_width(ax)
+        return (lambda: visualizations.fetch_bw(data,CHROMOSOME,start,end,
+                                                1,nbins,'max'),
+                lambda selected: visualizations.draw_bw(
+                    ax,CHROMOSOME,start,end,data,nbins=nbins,data=selected))
+    if track == 'bw_bases':
+        return (lambda: visualizations.fetch_bw(data,CHROMOSOME,start,end),
+                lambda selected: visualizations.draw_bw(
+                    ax,CHROMOSOME,start,end,data,data=selected))
+    if track in ('bed','boxes','loops'):
+        draw = {'bed':visualizations.draw_bed,
+                'boxes':visualizations.draw_boxes,
+                'loops':visualizations.draw_loops}[track]
+        return (lambda: get_intervals(data,CHROMOSOME,start,end),
+                lambda selected: draw(ax,CHROMOSOME,start,end,selected))
+    if track == 'gene_models':
+        def select() -> pd.DataFrame:
+            """Returns the GTF records of the transcripts in the window."""
+            transcripts = data.query(CHROMOSOME,start,end)
+            first = data.offsets[transcripts]
+            counts = data.offsets[transcripts+1]-first
+            rows = (np.repeat(first-np.cumsum(counts)+counts,counts)+
+                    np.arange(counts.sum()))
+            return data.genes.take(rows)
+        return (select,
+                lambda selected: visualizations.draw_gene_models(
+                    ax,CHROMOSOME,start,end,selected))
+    raise ValueError('Unknown track type: %s'%track)
+
+def run_case(track:str,data,window:int,repeat:int=5,
+             figsize:Tuple[float,float]=(8,1),dpi:int=100,
+             seed:int=0) -> dict:
+    """Benchmarks a track on a window.
+
+    The stages are timed repeat times on random windows, and the peak
+    memory use of each stage is measured on an additional, untimed run.
+    The memory use is traced using tracemalloc, which covers the NumPy
+    arrays but not the buffers of pyBigWig.
+
+    Args:
+        track (str): Track type, see TRACKS.
+        data: Data, see make_data.
+        window (int): Length of the window.
+        repeat (int): Number of timed runs.
+        figsize (Tuple[float,float]): Figure size.
+        dpi (int): Resolution.
+        seed (int): Random seed of the windows.
+
+    Returns:
+        dict: Median and minimum seconds, and peak bytes, of the stages
+            'select', 'draw', and 'savefig'.
+
+    """
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0,CHROMOSOME_LENGTH-window,repeat+1)
+
+    def run(start:int,measure:Callable[[],float]) -> List[float]:
+        """Runs the stages on a fresh figure."""
+        fig = mpl.figure.Figure(figsize=figsize,dpi=dpi)
+        ax = fig.subplots()
+        select,draw = get_stages(track,data,ax,int(start),int(start)+window)
+        measured = [measure()]
+        selected = select()
+        measured.append(measure())
+        draw(selected)
+        measured.append(measure())
+        fig.savefig(io.BytesIO(),format='png',dpi=dpi)
+        measured.append(measure())
+        return measured
+
+    seconds = []
+    for start in starts[:-1]:
+        seconds.append(np.diff(run(start,time.perf_counter)))
+
+    def peak() -> float:
+        """Returns the peak memory use and resets it."""
+        _,peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return peak_bytes
+
+    tracemalloc.start()
+    try:
+        peaks = run(starts[-1],peak)[1:]
+    finally:
+        tracemalloc.stop()
+
+    seconds = np.array(seconds)
+    return {stage:{'median':float(np.median(seconds[:,idx])),
+                   'min':float(seconds[:,idx].min()),
+                   'peak_bytes':int(peaks[idx])}
+            for idx,stage in enumerate(('select','draw','savefig'))}
+
+def run_benchmarks(path:Optional[str]=None,
+                   tracks:Iterable[str]=TRACKS,
+                   features:Iterable[int]=FEATURES,
+                   windows:Iterable[int]=WINDOWS,repeat:int=5,
+                   work_dir:str='.',seed:int=0) -> dict:
+    """Benchmarks the tracks on synthetic data of various sizes.
+
+    Args:
+        path (Optional[str]): Output JSON file, if any.
+        tracks (Iterable[str]): Track types, see TRACKS.
+        features (Iterable[int]): Numbers of features on the chromosome.
+            The GTF records of 10^7 features take about 6 GB of memory.
+        windows (Iterable[int]): Window lengths.
+        repeat (int): Number of timed runs of each case.
+        work_dir (str): Directory of the synthetic bigWig files.
+        seed (int): Random seed.
+
+    Returns:
+        dict: Versions of the environment and the results of the cases.
+
+    """
+    mpl.use('Agg')
+    os.makedirs(work_dir,exist_ok=True)
+
+    results = []
+    for track in tracks:
+        for n in features:
+            data = make_data(track,n,work_dir,seed)
+            for window in windows:
+                result = run_case(track,data,window,repeat,seed=seed)
+                results.append({'track':track,'features':n,
+                                'window':window,**result})
+            if track in ('bw','bw_bases'):
+                data.close()
+            # release the data before generating the next
+            del data
+
+    benchmark = {'raesymatto':raesymatto.__version__,
+                 'python':platform.python_version(),
+                 'numpy':np.__version__,
+                 'pandas':pd.__version__,
+                 'matplotlib':mpl.__version__,
+                 'platform':platform.platform(),
+                 'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'repeat':repeat,
+                 'results':results}
+    if path is not None:
+        with open(path,'w',encoding='utf-8') as f:
+            json.dump(benchmark,f,indent=1)
+    return benchmark
+
+def get_table(benchmark:dict) -> pd.DataFrame:
+    """Returns the results as a table.
+
+    Args:
+        benchmark (dict): Results, see run_benchmarks.
+
+    Returns:
+        pd.DataFrame: Median seconds and peak bytes of the stages
+            by track, number of features, and window length.
+
+    """
+    rows = []
+    for result in benchmark['results']:
+        row = {key:result[key] for key in ('track','features','window')}
+        for stage in ('select','draw','savefig'):
+            row[stage] = result[stage]['median']
+            row[stage+'_peak_bytes'] = result[stage]['peak_bytes']
+        rows.append(row)
+    return pd.DataFrame(rows).set_index(['track','features','window'])
+
+def compare_results(baseline:str,current:str,
+                    threshold:float=1.2) -> pd.DataFrame:
+    """Compares the results of two benchmark runs.
+
+    Args:
+        baseline (str): JSON file of the baseline results.
+        current (str): JSON file of the current results.
+        threshold (float): Ratio of the median seconds above which a stage
+            is considered a regression.
+
+    Returns:
+        pd.DataFrame: Ratios of the median seconds and the peak bytes
+            (current/baseline) of the common cases, and whether any of
+            the stages regressed.
+
+    """
+    tables = []
+    for path in (baseline,current):
+        with open(path,encoding='utf-8') as f:
+            tables.append(get_table(json.load(f)))
+    ratios = (tables[1]/tables[0]).dropna(how='all')
+    ratios['regression'] = (ratios[['select','draw','savefig']] >
+                            threshold).any(axis=1)
+    return ratios
+
+def main(args:Optional[List[str]]=None) -> dict:
+    """Runs the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output',help='output JSON file')
+    parser.add_argument('--tracks',nargs='+',default=TRACKS,
+                        choices=TRACKS)
+    parser.add_argument('--features',nargs='+',type=int,default=FEATURES)
+    parser.add_argument('--windows',nargs='+',type=int,default=WINDOWS)
+    parser.add_argument('--repeat',type=int,default=5)
+    parser.add_argument('--work-dir',default='.',
+                        help='directory of the synthetic bigWig files')
+    parser.add_argument('--baseline',
+                        help='JSON file of results to compare against')
+    args = parser.parse_args(args)
+
+    # empty windows are expected
+    logging.getLogger().setLevel(logging.ERROR)
+    warnings.simplefilter('ignore',UserWarning)
+
+    benchmark = run_benchmarks(args.output,args.tracks,args.features,
+                               args.windows,args.repeat,args.work_dir)
+    with pd.option_context('display.width',200,'display.max_rows',None):
+        print(get_table(benchmark))
+        if args.baseline is not None:
+            print(compare_results(args.baseline,args.output))
+    return benchmark
+
+if __name__ == '__main__':
+    main()
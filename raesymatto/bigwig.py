@@ -0,0 +1,389 @@
+"""Pooled and cached access to bigWig files."""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+import pyBigWig
+
+# bins of at most this many bases are summarized from the intervals
+EXACT_BIN_SIZE = 1024
+# minimum number of fine tile bins per bin for larger bins
+FINE_BINS = 8
+
+# sources opened using open_bigwig by path
+_SOURCES = {}
+_SOURCES_LOCK = threading.Lock()
+
+class BigWigSource:
+    """Thread-safe bigWig file with a pool of handles and a region cache.
+
+    Can be used in place of a pyBigWig object in draw_bw. Handles are not
+    shared between threads; instead, each thread borrows a handle from
+    a pool of at most max_handles handles.
+
+    Binned summaries are fetched in tiles of tile_bins bins whose size
+    is a power of two and which are aligned to the chromosome coordinates,
+    and per-base values and intervals in aligned tiles of values_tile
+    bases. The decoded tiles are kept in an LRU cache bounded by
+    cache_bytes, so that panning and zooming around a locus or redrawing
+    a figure reuse the tiles already fetched. A requested window is
+    summarized from the intervals or from tiles of bins several times
+    finer than its bins, see get_bins.
+
+    Args:
+        path (str): Path or URL of a bigWig file.
+        max_handles (int): Maximum number of open handles.
+        cache_bytes (int): Maximum size of the cached data in bytes.
+        tile_bins (int): Number of bins in a tile.
+        values_tile (int): Number of bases in a tile of per-base values.
+
+    """
+    def __init__(self,path:str,max_handles:int=4,
+                 cache_bytes:int=256*1024**2,tile_bins:int=1024,
+                 values_tile:int=1<<16) -> None:
+        """
+        """
+        self.path = path
+        self.max_handles = max_handles
+        self.cache_bytes = cache_bytes
+        self.tile_bins = tile_bins
+        self.values_tile = values_tile
+
+        self.handles = []
+        self.n_handles = 0
+        self.handles_available = threading.Condition()
+
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        with self.handle() as bw:
+            self.chromosomes = bw.chroms()
+
+    def __enter__(self) -> 'BigWigSource':
+        """
+        """
+        return self
+
+    def __exit__(self,*args) -> None:
+        """
+        """
+        self.close()
+
+    @contextmanager
+    def handle(self) -> Iterator[pyBigWig.pyBigWig]:
+        """Borrows a handle from the pool."""
+        with self.handles_available:
+            while not self.handles and self.n_handles >= self.max_handles:
+                self.handles_available.wait()
+            if self.handles:
+                bw = self.handles.pop()
+            else:
+                self.n_handles += 1
+                bw = None
+        if bw is None:
+            try:
+                bw = pyBigWig.open(self.path)
+            except BaseException:
+                with self.handles_available:
+                    self.n_handles -= 1
+                    self.handles_available.notify()
+                raise
+        try:
+            yield bw
+        finally:
+            with self.handles_available:
+                self.handles.append(bw)
+                self.handles_available.notify()
+
+    def close(self) -> None:
+        """Closes the pooled handles and clears the cache.
+
+        A source shared by open_bigwig is no longer shared, so that the
+        path is opened anew, e.g. after the file has changed.
+        """
+        with _SOURCES_LOCK:
+            if _SOURCES.get(self.path) is self:
+                del _SOURCES[self.path]
+        with self.handles_available:
+            for bw in self.handles:
+                bw.close()
+            self.n_handles -= len(self.handles)
+            self.handles = []
+        self.clear_cache()
+
+    def chroms(self,chromosome:Optional[str]=None):
+        """Returns chromosome lengths, see pyBigWig.chroms."""
+        if chromosome is None:
+            return dict(self.chromosomes)
+        return self.chromosomes.get(chromosome)
+
+    def cache_info(self) -> dict:
+        """Returns cache hits, misses, entries, and size in bytes."""
+        with self.cache_lock:
+            return {'hits':self.hits,'misses':self.misses,
+                    'entries':len(self.cache),'bytes':self.nbytes,
+                    'max_bytes':self.cache_bytes}
+
+    def clear_cache(self) -> None:
+        """Clears the cache."""
+        with self.cache_lock:
+            self.cache.clear()
+            self.nbytes = 0
+
+    def _cached(self,key:tuple,fetch) -> np.ndarray:
+        """Returns cached data or fetches and caches it."""
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+
+        value = fetch()
+
+        with self.cache_lock:
+            if key not in self.cache and value.nbytes <= self.cache_bytes:
+                self.cache[key] = value
+                self.nbytes += value.nbytes
+                while self.nbytes > self.cache_bytes:
+                    _,evicted = self.cache.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+        return value
+
+    def values(self,chromosome:str,start:int,end:int) -> np.ndarray:
+        """Returns per-base values, see pyBigWig.values.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+
+        """
+        length = self.chromosomes.get(chromosome)
+        if length is None or not 0 <= start < end <= length:
+            # let pyBigWig report the invalid region
+            with self.handle() as bw:
+                return np.array(bw.values(chromosome,start,end),
+                                dtype=np.float32)
+
+        first_tile = start//self.values_tile
+        last_tile = (end-1)//self.values_tile
+        values = np.concatenate([self._values_tile(chromosome,tile)
+                                 for tile in range(first_tile,
+                                                   last_tile+1)])
+        offset = start-first_tile*self.values_tile
+        return values[offset:offset+end-start]
+
+    def _values_tile(self,chromosome:str,tile:int) -> np.ndarray:
+        """Returns a tile of per-base values."""
+        def fetch() -> np.ndarray:
+            tile_start = tile*self.values_tile
+            tile_end = min(tile_start+self.values_tile,
+                           self.chromosomes[chromosome])
+            with self.handle() as bw:
+                return np.array(bw.values(chromosome,tile_start,tile_end),
+                                dtype=np.float32)
+        return self._cached(('values',chromosome,tile),fetch)
+
+    def stats(self,chromosome:str,start:int,end:int,type:str='mean',
+              nBins:int=1,exact:bool=False) -> list:
+        """Returns summaries, see pyBigWig.stats.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+            type (str): Summary.
+            nBins (int): Number of bins.
+            exact (bool): Compute exact summaries instead of using zoom
+                levels.
+
+        """
+        def fetch() -> np.ndarray:
+            with self.handle() as bw:
+                return np.array(bw.stats(chromosome,start,end,type=type,
+                                         nBins=nBins,exact=exact),
+                                dtype=float)
+        return list(self._cached(('stats',chromosome,start,end,type,nBins,
+                                  exact),fetch))
+
+    def _tile(self,chromosome:str,resolution:int,tile:int,
+              summary:str) -> np.ndarray:
+        """Returns a tile of binned summaries."""
+        def fetch() -> np.ndarray:
+            tile_start = tile*resolution*self.tile_bins
+            tile_end = min(tile_start+resolution*self.tile_bins,
+                           self.chromosomes[chromosome])
+            # the bins are aligned to the resolution, and the partial bin
+            # at the end of the chromosome is fetched separately
+            full_end = tile_start+(tile_end-tile_start)//resolution*resolution
+            values = []
+            with self.handle() as bw:
+                if full_end > tile_start:
+                    values.extend(bw.stats(chromosome,tile_start,full_end,
+                                           type=summary,
+                                           nBins=(full_end-tile_start)//
+                                           resolution))
+                if full_end < tile_end:
+                    values.extend(bw.stats(chromosome,full_end,tile_end,
+                                           type=summary))
+            return np.array(values,dtype=np.float32)
+        return self._cached(('tile',chromosome,resolution,tile,summary),
+                            fetch)
+
+    def _intervals(self,chromosome:str,start:int,end:int) -> np.ndarray:
+        """Returns the intervals of a region clipped to it using tiles."""
+        def fetch(tile:int) -> np.ndarray:
+            tile_start = tile*self.values_tile
+            tile_end = min(tile_start+self.values_tile,
+                           self.chromosomes[chromosome])
+            with self.handle() as bw:
+                intervals = bw.intervals(chromosome,tile_start,tile_end)
+            # intervals spanning the tile boundaries are split between tiles
+            intervals = np.array(intervals or [],dtype=float).reshape(-1,3)
+            intervals[:,:2] = np.clip(intervals[:,:2],tile_start,tile_end)
+            return intervals
+
+        intervals = np.concatenate([
+            self._cached(('intervals',chromosome,tile),
+                         lambda tile=tile: fetch(tile))
+            for tile in range(start//self.values_tile,
+                              (end-1)//self.values_tile+1)])
+        intervals[:,:2] = np.clip(intervals[:,:2],start,end)
+        return intervals[intervals[:,1] > intervals[:,0]]
+
+    def _fine_bins(self,chromosome:str,start:int,end:int,resolution:int,
+                   stat_types:list) -> Tuple[np.ndarray,dict]:
+        """Returns the fine bins of a region clipped to it using tiles."""
+        tile_size = resolution*self.tile_bins
+        first_tile = start//tile_size
+        last_tile = (end-1)//tile_size
+        bin_starts = np.arange(first_tile*self.tile_bins,
+                               (last_tile+1)*self.tile_bins)*resolution
+        bins = np.column_stack([bin_starts,bin_starts+resolution])
+        keep = (bins[:,1] > start) & (bins[:,0] < end)
+        bins = np.clip(bins[keep],start,end)
+
+        fine = {}
+        for stat_type in stat_types:
+            data = np.full(bin_starts.shape[0],np.nan)
+            for tile in range(first_tile,last_tile+1):
+                tile_data = self._tile(chromosome,resolution,tile,stat_type)
+                offset = (tile-first_tile)*self.tile_bins
+                data[offset:offset+tile_data.shape[0]] = tile_data
+            fine[stat_type] = data[keep]
+        return bins,fine
+
+    def get_bins(self,chromosome:str,start:int,end:int,nbins:int,
+                 summary:str='max') -> Tuple[np.ndarray,np.ndarray]:
+        """Returns binned data using cached tiles.
+
+        See raesymatto.visualizations.get_bw_bins. The bins are those of
+        pyBigWig.stats. Bins of at most EXACT_BIN_SIZE bases are summarized
+        from the cached intervals, thus, they match the exact summaries.
+        Larger bins are summarized from the cached tiles of bins at least
+        FINE_BINS times finer. Fine bins straddling two bins are split
+        between them by the bases covered for the mean, and are assigned
+        to the bin containing their center for the maximum and the
+        minimum.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+            nbins (int): Number of bins. Capped at the region length.
+            summary (str): 'max', 'mean', 'min', or 'minmax'.
+
+        """
+        if summary not in ('max','mean','min','minmax'):
+            raise ValueError('Unknown summary: %s'%summary)
+
+        nbins = max(min(int(nbins),end-start),1)
+        edges = np.linspace(start,end,nbins+1)
+        # the integer bin boundaries used by pyBigWig
+        bounds = start+(end-start)*np.arange(nbins+1)//nbins
+        stat_types = ['min','max'] if summary == 'minmax' else [summary]
+
+        data_start = max(start,0)
+        data_end = min(end,self.chromosomes[chromosome])
+        if data_end <= data_start:
+            return edges,np.full((nbins,len(stat_types)),np.nan)
+
+        exact = (end-start)/nbins <= EXACT_BIN_SIZE
+        if exact:
+            intervals = self._intervals(chromosome,data_start,data_end)
+            fine_bins = intervals[:,:2]
+            fine = {stat_type:intervals[:,2] for stat_type in stat_types}
+            coverage = np.ones(intervals.shape[0])
+        else:
+            # the largest power of two not larger than the fine bins
+            resolution = 1<<int(np.floor(np.log2((end-start)/nbins/
+                                                 FINE_BINS)))
+            fine_bins,fine = self._fine_bins(
+                chromosome,data_start,data_end,resolution,
+                stat_types+(['coverage'] if summary == 'mean' else []))
+            coverage = np.nan_to_num(fine.get('coverage',0.0))
+
+        index,pieces,lengths = _split(fine_bins[:,0],fine_bins[:,1],bounds)
+        if exact:
+            extreme_index,extreme_bins = index,pieces
+        else:
+            # the extrema of straddling fine bins are not split
+            extreme_index = np.arange(fine_bins.shape[0])
+            extreme_bins = np.searchsorted(bounds,fine_bins.mean(axis=1),
+                                           'right')-1
+
+        values = []
+        for stat_type in stat_types:
+            if stat_type == 'mean':
+                # bins without data are 0/0
+                weights = lengths*coverage[index]
+                with np.errstate(invalid='ignore',divide='ignore'):
+                    binned = (np.bincount(pieces,weights*np.nan_to_num(
+                        fine['mean'][index]),minlength=nbins)/
+                              np.bincount(pieces,weights,minlength=nbins))
+            else:
+                binned = np.full(nbins,np.nan)
+                reduce = np.fmax if stat_type == 'max' else np.fmin
+                reduce.at(binned,extreme_bins,
+                          fine[stat_type][extreme_index])
+            values.append(binned)
+
+        return edges,np.column_stack(values)
+
+def _split(starts:np.ndarray,ends:np.ndarray,
+           bounds:np.ndarray) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Splits non-empty intervals within the bounds at the bounds.
+
+    Returns the interval, the bin, and the length of each piece.
+
+    """
+    first = np.searchsorted(bounds,starts,'right')-1
+    last = np.searchsorted(bounds,ends,'left')-1
+    counts = last-first+1
+    index = np.repeat(np.arange(starts.shape[0]),counts)
+    bins = (np.arange(index.shape[0])-
+            np.repeat(np.cumsum(counts)-counts,counts)+first[index])
+    lengths = (np.minimum(ends[index],bounds[bins+1])-
+               np.maximum(starts[index],bounds[bins]))
+    return index,bins,lengths
+
+def open_bigwig(path:str,**kwargs) -> BigWigSource:
+    """Returns a BigWigSource shared by all the callers using the same path.
+
+    Args:
+        path (str): Path or URL of a bigWig file.
+        kwargs: Additional arguments passed to BigWigSource when the path
+            is opened for the first time.
+
+    """
+    with _SOURCES_LOCK:
+        if path not in _SOURCES:
+            _SOURCES[path] = BigWigSource(path,**kwargs)
+        return _SOURCES[path]
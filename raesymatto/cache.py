@@ -0,0 +1,249 @@
+"""Binary cache of annotation indices."""
+import errno
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Callable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+import raesymatto
+from raesymatto.genes import GeneModelIndex
+from raesymatto.intervals import BedIndex, BedpeIndex
+from raesymatto.store import map_arrays
+
+# bump when the layout of the indices changes
+CACHE_VERSION = 1
+
+def read_bed(path:str) -> pd.DataFrame:
+    """Reads a BED file.
+
+    Args:
+        path (str): Path to a (possibly compressed) BED file.
+
+    """
+    return pd.read_csv(path,sep='\t',header=None,comment='#')
+
+def read_genes(path:str) -> pd.DataFrame:
+    """Reads a GTF file using gtfparse.
+
+    Args:
+        path (str): Path to a (possibly compressed) GTF file.
+
+    """
+    from gtfparse import read_gtf
+
+    genes = read_gtf(path)
+    # recent versions of gtfparse return polars data frames
+    if not isinstance(genes,pd.DataFrame):
+        genes = genes.to_pandas()
+    return genes
+
+class _CachePickler(pickle.Pickler):
+    """Pickles an index storing its arrays as .npy files."""
+    def __init__(self,f,directory:str) -> None:
+        """
+        """
+        super().__init__(f,protocol=pickle.HIGHEST_PROTOCOL)
+        self.directory = directory
+        self.n_arrays = 0
+
+    def persistent_id(self,obj) -> Optional[str]:
+        """
+        """
+        if not isinstance(obj,np.ndarray):
+            return None
+        filename = '%d.npy'%self.n_arrays
+        self.n_arrays += 1
+        np.save(os.path.join(self.directory,filename),obj,
+                allow_pickle=False)
+        return filename
+
+class _CacheUnpickler(pickle.Unpickler):
+    """Unpickles an index memory-mapping its arrays."""
+    def __init__(self,f,directory:str) -> None:
+        """
+        """
+        super().__init__(f)
+        self.directory = directory
+
+    def persistent_load(self,pid:str) -> np.ndarray:
+        """
+        """
+        return np.load(os.path.join(self.directory,pid),mmap_mode='r')
+
+def _manifest(path:str) -> dict:
+    """Returns the manifest describing a source file."""
+    stat = os.stat(path)
+    return {'version':CACHE_VERSION,
+            'raesymatto':raesymatto.__version__,
+            'source':os.path.abspath(path),
+            'size':stat.st_size,
+            'mtime':stat.st_mtime_ns}
+
+def _read_manifest(directory:str) -> Optional[dict]:
+    """Returns the manifest of a cache or None if it cannot be read."""
+    try:
+        with open(os.path.join(directory,'manifest.json'),
+                  encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError,ValueError):
+        return None
+
+def _is_valid(directory:str,path:str) -> bool:
+    """Checks whether the cache is up-to-date with its source file.
+
+    Any change of the size or the modification time invalidates the cache,
+    as a partial comparison of the contents could miss an edit.
+
+    """
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        return False
+
+    stat = os.stat(path)
+    return (manifest.get('version') == CACHE_VERSION and
+            manifest.get('raesymatto') == raesymatto.__version__ and
+            manifest.get('size') == stat.st_size and
+            manifest.get('mtime') == stat.st_mtime_ns)
+
+def _replace_directory(source:str,target:str) -> bool:
+    """Renames a directory unless the target exists and is not empty."""
+    try:
+        os.replace(source,target)
+    except OSError as e:
+        if e.errno not in (errno.EEXIST,errno.ENOTEMPTY):
+            raise
+        return False
+    return True
+
+def save_index(index:Union[BedIndex,GeneModelIndex],directory:str,
+               manifest:Optional[dict]=None) -> None:
+    """Saves an index into a cache directory.
+
+    Data frames are stored as dictionary-encoded column tables and every
+    array is stored as a separate .npy file. The cache is written into
+    a unique temporary directory which is then renamed, so that readers
+    never see a partially written cache. If the directory already holds
+    a cache with the same manifest, e.g. written by a concurrent builder,
+    it is kept as such.
+
+    Args:
+        index (Union[BedIndex,GeneModelIndex]): Index.
+        directory (str): Cache directory. Replaced if it exists.
+        manifest (Optional[dict]): Manifest stored along with the index.
+
+    """
+    parent,name = os.path.split(os.path.abspath(directory))
+    tmp_directory = tempfile.mkdtemp(prefix=name+'.tmp',dir=parent)
+    try:
+        with open(os.path.join(tmp_directory,'index.pickle'),'wb') as f:
+            _CachePickler(f,tmp_directory).dump(
+                map_arrays(index,lambda array:array))
+        with open(os.path.join(tmp_directory,'manifest.json'),'w',
+                  encoding='utf-8') as f:
+            json.dump(manifest if manifest is not None else {},f,indent=1)
+
+        if _replace_directory(tmp_directory,directory):
+            return
+        if manifest is not None and _read_manifest(directory) == manifest:
+            return
+
+        # move the outdated cache aside, in one step, before replacing it
+        outdated = tempfile.mkdtemp(prefix=name+'.old',dir=parent)
+        try:
+            os.replace(directory,outdated)
+        except FileNotFoundError:
+            pass
+        # if a concurrent builder won the race, then its cache is kept
+        _replace_directory(tmp_directory,directory)
+        shutil.rmtree(outdated,ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_directory,ignore_errors=True)
+
+def open_index(directory:str) -> Union[BedIndex,GeneModelIndex]:
+    """Opens an index from a cache directory.
+
+    The arrays are memory-mapped and read-only.
+
+    Args:
+        directory (str): Cache directory.
+
+    """
+    with open(os.path.join(directory,'index.pickle'),'rb') as f:
+        return _CacheUnpickler(f,directory).load()
+
+def load_cached(path:str,build:Callable[[str],Union[BedIndex,
+                                                   GeneModelIndex]],
+                cache_dir:Optional[str]=None
+                ) -> Union[BedIndex,GeneModelIndex]:
+    """Returns an index of a file using the cache.
+
+    The index is built and cached if the cache does not exist or if the
+    source file has changed since (its size or modification time
+    differs). If the cache cannot be written, then the
+    built index is returned as such.
+
+    Args:
+        path (str): Source file.
+        build (Callable[[str],Union[BedIndex,GeneModelIndex]]): Function
+            building the index from the source file.
+        cache_dir (Optional[str]): Cache directory. Defaults to the source
+            file with the suffix .raesymatto.
+
+    """
+    if cache_dir is None:
+        cache_dir = path+'.raesymatto'
+
+    if _is_valid(cache_dir,path):
+        return open_index(cache_dir)
+
+    logging.info('Building the cache %s',cache_dir)
+    index = build(path)
+    try:
+        save_index(index,cache_dir,_manifest(path))
+    except OSError as e:
+        # e.g. a read-only directory
+        logging.warning('Cannot write the cache %s: %s',cache_dir,e)
+        return index
+
+    return open_index(cache_dir)
+
+def load_bed(path:str,cache_dir:Optional[str]=None) -> BedIndex:
+    """Returns a BED index of a BED file using the cache.
+
+    Args:
+        path (str): Path to a (possibly compressed) BED file.
+        cache_dir (Optional[str]): Cache directory. Defaults to the source
+            file with the suffix .raesymatto.
+
+    """
+    return load_cached(path,lambda path:BedIndex(read_bed(path)),cache_dir)
+
+def load_bedpe(path:str,cache_dir:Optional[str]=None) -> BedpeIndex:
+    """Returns a BEDPE index of a BEDPE file using the cache.
+
+    Args:
+        path (str): Path to a (possibly compressed) BEDPE file.
+        cache_dir (Optional[str]): Cache directory. Defaults to the source
+            file with the suffix .raesymatto.
+
+    """
+    return load_cached(path,lambda path:BedpeIndex(read_bed(path)),
+                       cache_dir)
+
+def load_genes(path:str,cache_dir:Optional[str]=None) -> GeneModelIndex:
+    """Returns a gene model index of a GTF file using the cache.
+
+    Args:
+        path (str): Path to a (possibly compressed) GTF file.
+        cache_dir (Optional[str]): Cache directory. Defaults to the source
+            file with the suffix .raesymatto.
+
+    """
+    return load_cached(path,lambda path:GeneModelIndex(read_genes(path)),
+                       cache_dir)
@@ -0,0 +1,197 @@
+"""Command-line interface.
+
+Only the standard library is imported until a command runs, and the
+rendering modules are imported after forcing the Agg backend.
+
+Usage:
+    raesymatto render layout.json chr1:1,000,000-1,200,000 -o figures
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import re
+import sys
+from typing import List, Optional, Tuple
+
+# chromosome:start-end, thousands separators are allowed
+REGION = re.compile(r'^([^:\s]+):([\d,_]+)-([\d,_]+)$')
+
+# sources which are not resolved against the directory of the layout
+URL = re.compile(r'^[a-z]+://')
+
+def parse_region(region:str) -> Tuple[str,int,int]:
+    """Parses a region given as chromosome:start-end.
+
+    Args:
+        region (str): Region.
+
+    """
+    match = REGION.match(region.strip())
+    if match is None:
+        raise argparse.ArgumentTypeError('Invalid region: %s'%region)
+    chromosome,start,end = match.groups()
+    start = int(re.sub('[,_]','',start))
+    end = int(re.sub('[,_]','',end))
+    if end <= start:
+        raise argparse.ArgumentTypeError('Empty region: %s'%region)
+    return chromosome,start,end
+
+def read_regions(path:str) -> List[Tuple[str,int,int]]:
+    """Reads regions from the first three columns of a BED file.
+
+    Args:
+        path (str): Path to a BED file.
+
+    """
+    regions = []
+    with open(path,encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith(('#','track',
+                                                    'browser')):
+                continue
+            fields = line.split('\t')
+            regions.append((fields[0],int(fields[1]),int(fields[2])))
+    return regions
+
+def read_layout(path:str) -> dict:
+    """Reads a track layout from a JSON or YAML file.
+
+    YAML files (.yaml or .yml) require PyYAML, which is installed using
+    pip install raesymatto[yaml]. Relative paths of the sources are
+    resolved against the directory of the layout file.
+
+    Args:
+        path (str): Path to a layout file, see render.draw_layout.
+
+    """
+    with open(path,encoding='utf-8') as f:
+        if path.endswith(('.yaml','.yml')):
+            try:
+                import yaml
+            except ImportError as error:
+                raise ImportError(('YAML layouts require PyYAML, install '
+                                   'it using pip install raesymatto[yaml]')
+                                  ) from error
+
+            layout = yaml.safe_load(f)
+        else:
+            layout = json.load(f)
+
+    directory = os.path.dirname(os.path.abspath(path))
+
+    def resolve(source):
+        """Resolves a relative path against the layout directory."""
+        if isinstance(source,list):
+            return [resolve(item) for item in source]
+        if isinstance(source,str) and not URL.match(source):
+            return os.path.join(directory,os.path.expanduser(source))
+        return source
+
+    for track in layout['tracks']:
+        for layer in (track if isinstance(track,list) else [track]):
+            if 'source' in layer:
+                layer['source'] = resolve(layer['source'])
+    return layout
+
+def render_command(args:argparse.Namespace) -> int:
+    """Renders regions into image files.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments, see main.
+
+    Returns:
+        int: Exit status; 1 if any of the regions failed.
+
+    """
+    import matplotlib
+
+    matplotlib.use('Agg')
+
+    from raesymatto import profiling, render
+
+    layout = read_layout(args.layout)
+    if args.format is not None:
+        layout['format'] = args.format
+    if args.dpi is not None:
+        layout['dpi'] = args.dpi
+
+    regions = list(args.regions)
+    for path in args.regions_file or []:
+        regions.extend(read_regions(path))
+    if not regions:
+        logging.error('No regions given')
+        return 2
+
+    os.makedirs(args.out_dir,exist_ok=True)
+    with (profiling.profile() if args.profile
+          else contextlib.nullcontext()) as profiler:
+        results = render.render_regions(layout,regions,args.out_dir,
+                                        args.workers,prefetch=args.prefetch,
+                                        as_frame=False)
+
+    for result in results:
+        if result['path'] is not None:
+            print(result['path'])
+    if profiler is not None:
+        print(profiler.summary().to_string(),file=sys.stderr)
+    return int(any(result['error'] is not None for result in results))
+
+def main(args:Optional[List[str]]=None) -> int:
+    """Runs the command-line interface.
+
+    Args:
+        args (Optional[List[str]]): Arguments. Defaults to sys.argv.
+
+    Returns:
+        int: Exit status.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='raesymatto',description='Raesymatto: visualize genomic data')
+    parser.add_argument('-v','--verbose',action='store_true',
+                        help='log progress')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    render_parser = commands.add_parser(
+        'render',help='render regions into image files',
+        description='Renders regions of a track layout into image files '
+                    'named chromosome_start_end.format.')
+    render_parser.add_argument('layout',
+                               help='track layout file (JSON or YAML)')
+    render_parser.add_argument('regions',nargs='*',type=parse_region,
+                               help='regions as chromosome:start-end')
+    render_parser.add_argument('-r','--regions-file',action='append',
+                               help='BED file of regions')
+    render_parser.add_argument('-o','--out-dir',default='.',
+                               help='output directory')
+    render_parser.add_argument('-f','--format',
+                               help='output format, e.g. png or pdf')
+    render_parser.add_argument('--dpi',type=int,help='resolution')
+    render_parser.add_argument('-j','--workers',type=int,default=1,
+                               help='number of worker processes')
+    render_parser.add_argument('--prefetch',type=int,
+                               help='number of regions fetched ahead '
+                                    '(default: 2), requires -j 1')
+    render_parser.add_argument('--profile',action='store_true',
+                               help='print the time spent per track, '
+                                    'requires -j 1')
+    render_parser.set_defaults(function=render_command)
+
+    args = parser.parse_args(args)
+    if args.command == 'render':
+        # prefetching and profiling happen in the current process only
+        if args.workers > 1 and args.prefetch:
+            render_parser.error('--prefetch requires -j 1')
+        if args.workers > 1 and args.profile:
+            render_parser.error('--profile requires -j 1')
+        if args.prefetch is None:
+            args.prefetch = 2 if args.workers == 1 else 0
+    logging.basicConfig(level=logging.INFO if args.verbose
+                        else logging.WARNING,
+                        format='%(levelname)s: %(message)s')
+    return args.function(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
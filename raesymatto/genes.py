@@ -0,0 +1,105 @@
+"""Gene model queries on GTF data."""
+import numpy as np
+import pandas as pd
+
+from raesymatto.intervals import BedIndex
+
+class GeneModelIndex:
+    """Transcript index for fast gene model queries on GTF data.
+
+    The index is built once and can be passed to draw_gene_models in place
+    of the GTF DataFrame. Rows are grouped into contiguous per-transcript
+    slices and the transcript spans are indexed using BedIndex, so that
+    a region query does not scan the GTF DataFrame. Rows without
+    a transcript_id (e.g. gene records) are skipped.
+
+    Args:
+        genes (pd.DataFrame): Gene definitions in General Transfer
+            Format (GTF).
+
+    """
+    def __init__(self,genes:pd.DataFrame) -> None:
+        """
+        """
+        genes = genes[genes['transcript_id'].notna() &
+                      (genes['transcript_id'] != '')]
+        self.genes = (genes.sort_values('transcript_id',kind='stable')
+                      .reset_index(drop=True))
+
+        # ndarrays, not the extension arrays of string columns
+        transcript_ids = self.genes['transcript_id'].to_numpy(dtype=object)
+        self.offsets = np.unique(np.concatenate(
+            ([0],
+             np.flatnonzero(transcript_ids[1:] != transcript_ids[:-1])+1,
+             [len(transcript_ids)]))).astype(int)
+
+        self.feature = self.genes['feature'].to_numpy(dtype=object)
+        self.start = self.genes['start'].to_numpy()
+        self.end = self.genes['end'].to_numpy()
+
+        first = self.offsets[:-1]
+        self.transcripts = pd.DataFrame(
+            {'seqname':self.genes['seqname'].to_numpy(dtype=object)[first],
+             'start':np.minimum.reduceat(self.start,first),
+             'end':np.maximum.reduceat(self.end,first),
+             'transcript_id':transcript_ids[first],
+             'strand':self.genes['strand'].to_numpy(dtype=object)[first],
+             'start_max':np.maximum.reduceat(self.start,first),
+             'end_min':np.minimum.reduceat(self.end,first)})
+        self.transcript_index = BedIndex(self.transcripts)
+
+    def __len__(self) -> int:
+        """Returns the number of transcripts."""
+        return self.transcripts.shape[0]
+
+    def query(self,chromosome:str,start:int,end:int) -> np.ndarray:
+        """Returns transcripts overlapping the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+
+        Returns:
+            np.ndarray: Transcript positions sorted by transcript_id.
+
+        """
+        return self.transcript_index.query_positions(chromosome,start,end)
+
+    def rows(self,transcript:int) -> slice:
+        """Returns the rows of a transcript.
+
+        Args:
+            transcript (int): Transcript position.
+
+        Returns:
+            slice: Rows in the sorted GTF DataFrame and feature arrays.
+
+        """
+        return slice(self.offsets[transcript],self.offsets[transcript+1])
+
+def get_transcripts(genes:pd.DataFrame,chromosome:str,start:int,
+                    end:int) -> pd.DataFrame:
+    """Returns the GTF rows of the transcripts overlapping the region.
+
+    Only the rows of the chromosome are grouped, so that a GeneModelIndex
+    of the region can be built without indexing the whole GTF DataFrame.
+    Use a GeneModelIndex for repeated queries.
+
+    Args:
+        genes (pd.DataFrame): Gene definitions in General Transfer
+            Format (GTF).
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+
+    Returns:
+        pd.DataFrame: Rows of the overlapping transcripts.
+
+    """
+    genes = genes[(genes['seqname'] == chromosome).values]
+    spans = genes.groupby('transcript_id',sort=False).agg(
+        {'start':'min','end':'max'})
+    transcript_ids = spans.index[(spans['start'].values <= end) &
+                                 (spans['end'].values >= start)]
+    return genes[genes['transcript_id'].isin(transcript_ids).values]
@@ -0,0 +1,332 @@
+"""Interval queries on BED data."""
+import heapq
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+class BedIndex:
+    """Per-chromosome index for fast overlap queries on BED data.
+
+    The index is built once and can be passed to the draw functions in
+    place of the BED DataFrame. Intervals are sorted by start coordinate
+    and, together with the maximum interval length, the overlapping
+    intervals are found using binary search in O(log n + k) time.
+
+    Args:
+        bed (pd.DataFrame): Data in Browser Extensible Data (BED) format.
+
+    """
+    def __init__(self,bed:pd.DataFrame) -> None:
+        """
+        """
+        self.bed = bed
+        self.index = {}
+
+        lower = np.minimum(bed.iloc[:,1].values,bed.iloc[:,2].values)
+        upper = np.maximum(bed.iloc[:,1].values,bed.iloc[:,2].values)
+
+        for chromosome,positions in (bed.groupby(bed.iloc[:,0].values,
+                                                 sort=False)
+                                     .indices.items()):
+            positions = positions[np.argsort(lower[positions],
+                                             kind='stable')]
+            self.index[chromosome] = {
+                'positions':positions,
+                'start':lower[positions],
+                'end':upper[positions],
+                'max_length':(upper[positions]-lower[positions]).max()}
+
+    def __len__(self) -> int:
+        """Returns the number of intervals."""
+        return self.bed.shape[0]
+
+    def query_positions(self,chromosome:str,start:int,end:int) -> np.ndarray:
+        """Returns the row positions of intervals overlapping the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+
+        Returns:
+            np.ndarray: Sorted row positions in the BED DataFrame.
+
+        """
+        if chromosome not in self.index:
+            return np.zeros(0,dtype=int)
+
+        index = self.index[chromosome]
+        first = np.searchsorted(index['start'],start-index['max_length'],
+                                side='left')
+        last = np.searchsorted(index['start'],end,side='right')
+        mask = index['end'][first:last] >= start
+
+        return np.sort(index['positions'][first:last][mask])
+
+    def query(self,chromosome:str,start:int,end:int) -> pd.DataFrame:
+        """Returns intervals overlapping the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+
+        """
+        return self.bed.take(self.query_positions(chromosome,start,end))
+
+class BedpeIndex:
+    """Per-chromosome index of both anchors of BEDPE data.
+
+    Paired intervals, e.g. chromatin loops, are indexed using a BedIndex
+    on each anchor and on the span of the intrachromosomal pairs, so that
+    the pairs with one or both anchors in a region, or spanning it, are
+    found using binary search.
+
+    Args:
+        bedpe (pd.DataFrame): Data in BEDPE format; chrom1, start1, end1,
+            chrom2, start2, end2, and optional columns such as name and
+            score.
+
+    """
+    def __init__(self,bedpe:pd.DataFrame) -> None:
+        """
+        """
+        self.bedpe = bedpe
+
+        chromosomes = [bedpe.iloc[:,0].values,bedpe.iloc[:,3].values]
+        self.anchors = tuple(
+            BedIndex(pd.DataFrame({0:chromosome,
+                                   1:bedpe.iloc[:,column+1].values,
+                                   2:bedpe.iloc[:,column+2].values}))
+            for chromosome,column in zip(chromosomes,(0,3)))
+
+        cis = np.flatnonzero(chromosomes[0] == chromosomes[1])
+        self.cis = cis
+        self.spans = BedIndex(pd.DataFrame(
+            {0:chromosomes[0][cis],
+             1:np.minimum(bedpe.iloc[cis,1].values,
+                          bedpe.iloc[cis,4].values),
+             2:np.maximum(bedpe.iloc[cis,2].values,
+                          bedpe.iloc[cis,5].values)}))
+
+    def __len__(self) -> int:
+        """Returns the number of pairs."""
+        return self.bedpe.shape[0]
+
+    def query_positions(self,chromosome:str,start:int,end:int,
+                        anchors:str='any') -> np.ndarray:
+        """Returns the row positions of pairs in the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+            anchors (str): 'any' (either anchor overlaps the region),
+                'both' (both anchors overlap the region), or 'span' (the
+                span of an intrachromosomal pair overlaps the region).
+
+        Returns:
+            np.ndarray: Sorted row positions in the BEDPE DataFrame.
+
+        """
+        if anchors == 'span':
+            return np.sort(self.cis[self.spans.query_positions(
+                chromosome,start,end)])
+
+        first,second = (index.query_positions(chromosome,start,end)
+                        for index in self.anchors)
+        if anchors == 'any':
+            return np.union1d(first,second)
+        if anchors == 'both':
+            return np.intersect1d(first,second,assume_unique=True)
+        raise ValueError('Unknown anchors: %s'%anchors)
+
+    def query(self,chromosome:str,start:int,end:int,
+              anchors:str='any') -> pd.DataFrame:
+        """Returns pairs in the region, see query_positions.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+            anchors (str): 'any', 'both', or 'span'.
+
+        """
+        return self.bedpe.take(self.query_positions(chromosome,start,end,
+                                                    anchors))
+
+def get_intervals(bed:Union[pd.DataFrame,BedIndex],chromosome:str,
+                  start:int,end:int) -> pd.DataFrame:
+    """Returns intervals overlapping the region.
+
+    Args:
+        bed (Union[pd.DataFrame,BedIndex]): Data in Browser Extensible
+            Data (BED) format or an index built from it. Other objects
+            with a query method, such as raesymatto.tabix.TabixBed,
+            are also accepted.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+
+    """
+    if not isinstance(bed,pd.DataFrame):
+        return bed.query(chromosome,start,end)
+
+    return bed[(bed.iloc[:,0] == chromosome) &
+               (((bed.iloc[:,1] >= start) &
+                 (bed.iloc[:,1] <= end)) |
+                ((bed.iloc[:,2] >= start) &
+                 (bed.iloc[:,2] <= end)) |
+                ((start >= bed.iloc[:,[1,2]].min(axis=1)) &
+                 (end <= bed.iloc[:,[1,2]].max(axis=1))))]
+
+def pack_intervals(starts:np.ndarray,ends:np.ndarray,
+                   max_rows:Optional[int]=None) -> np.ndarray:
+    """Assigns intervals into non-overlapping rows.
+
+    Intervals are expected to be sorted by start coordinate. Each interval
+    is placed into the first row whose last interval ends before the
+    interval starts. Free rows are tracked using priority queues so that
+    the layout takes O(n log n) time.
+
+    Args:
+        starts (np.ndarray): Start coordinates.
+        ends (np.ndarray): End coordinates.
+        max_rows (Optional[int]): Maximum number of rows. Intervals that
+            do not fit into the first max_rows-1 rows are collapsed into
+            the last row.
+
+    Returns:
+        np.ndarray: Row of each interval.
+
+    """
+    if max_rows is not None and max_rows < 1:
+        raise ValueError('max_rows has to be positive')
+
+    rows = np.zeros(len(starts),dtype=int)
+    busy = [] # (end, row) of rows in use
+    free = [] # rows available for the current interval
+    n_rows = 0
+
+    for idx,(start,end) in enumerate(zip(starts,ends)):
+        while busy and busy[0][0] < start:
+            heapq.heappush(free,heapq.heappop(busy)[1])
+        if free:
+            row = heapq.heappop(free)
+        elif max_rows is not None and n_rows >= max_rows-1:
+            rows[idx] = max_rows-1
+            continue
+        else:
+            row = n_rows
+            n_rows += 1
+        heapq.heappush(busy,(end,row))
+        rows[idx] = row
+
+    return rows
+
+def merge_intervals(rows:np.ndarray,starts:np.ndarray,ends:np.ndarray,
+                    gap:float=0) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Merges overlapping or nearby intervals on the same row.
+
+    Intervals separated by at most gap are merged, e.g. using the width
+    of a pixel as gap merges the intervals that cannot be told apart when
+    drawn.
+
+    Args:
+        rows (np.ndarray): Row of each interval.
+        starts (np.ndarray): Start coordinates.
+        ends (np.ndarray): End coordinates.
+        gap (float): Maximum distance between merged intervals.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray,np.ndarray]: Rows, start coordinates,
+            and end coordinates of the merged intervals sorted by row and
+            start coordinate.
+
+    """
+    order = np.lexsort((starts,rows))
+    rows = np.asarray(rows)[order]
+    starts = np.asarray(starts)[order]
+    ends = np.asarray(ends)[order]
+    if rows.shape[0] == 0:
+        return rows,starts,ends
+
+    # running maximum of the end coordinates within each row, the rows
+    # are offset so that a single cumulative maximum suffices
+    new_row = np.diff(rows,prepend=rows[0]-1) != 0
+    offsets = ((np.cumsum(new_row)-1)*
+               (float(ends.max())-float(starts.min())+gap+1))
+    reach = np.maximum.accumulate(ends+offsets)-offsets
+
+    groups = np.flatnonzero(new_row |
+                            (starts > np.roll(reach,1)+gap))
+    return (rows[groups],starts[groups],
+            np.maximum.reduceat(ends,groups))
+
+def bin_intervals(starts:np.ndarray,ends:np.ndarray,edges:np.ndarray,
+                  scores:Optional[np.ndarray]=None,
+                  summary:str='coverage') -> np.ndarray:
+    """Summarizes the intervals overlapping each bin.
+
+    The coverage and the sum are computed by counting the interval starts
+    and ends on the sorted coordinates, and the maximum by scattering the
+    scores into a sparse table of power-of-two ranges, so that the cost is
+    O(n log n) in the number of intervals regardless of their lengths.
+
+    Args:
+        starts (np.ndarray): Start coordinates.
+        ends (np.ndarray): End coordinates (exclusive).
+        edges (np.ndarray): Sorted bin edges.
+        scores (Optional[np.ndarray]): Scores, required by 'sum' and 'max'.
+        summary (str): 'coverage' (number of overlapping intervals),
+            'sum', or 'max' of the scores of the overlapping intervals.
+
+    Returns:
+        np.ndarray: Summary of each bin. The maximum of a bin without
+            intervals is NaN.
+
+    """
+    starts = np.asarray(starts,dtype=float)
+    ends = np.asarray(ends,dtype=float)
+    edges = np.asarray(edges,dtype=float)
+    n_bins = edges.shape[0]-1
+
+    if summary in ('coverage','sum'):
+        # intervals starting before the end of a bin minus those ending
+        # before its start
+        start_order = np.argsort(starts,kind='stable')
+        end_order = np.argsort(ends,kind='stable')
+        started = np.searchsorted(starts[start_order],edges[1:],'left')
+        ended = np.searchsorted(ends[end_order],edges[:-1],'right')
+        if summary == 'coverage':
+            return (started-ended).astype(float)
+        scores = np.asarray(scores,dtype=float)
+        return (np.concatenate(([0],np.cumsum(scores[start_order])))[started]-
+                np.concatenate(([0],np.cumsum(scores[end_order])))[ended])
+    if summary != 'max':
+        raise ValueError('Unknown summary: %s'%summary)
+
+    # the first and the last bin overlapping each interval
+    lower = np.maximum(np.searchsorted(edges,starts,'right')-1,0)
+    upper = np.minimum(np.searchsorted(edges,ends,'left')-1,n_bins-1)
+    overlapping = ((starts < edges[-1]) & (ends > edges[0]) &
+                   (lower <= upper))
+    lower = lower[overlapping]
+    upper = upper[overlapping]
+    scores = np.asarray(scores,dtype=float)[overlapping]
+
+    # level k of the table holds the maxima of the ranges of 2^k bins,
+    # each interval is covered by two possibly overlapping ranges
+    levels = np.frexp(upper-lower+1)[1]-1
+    n_levels = int(levels.max())+1 if levels.shape[0] > 0 else 1
+    table = np.full((n_levels,n_bins),-np.inf)
+    np.maximum.at(table,(levels,lower),scores)
+    np.maximum.at(table,(levels,upper-(1<<levels)+1),scores)
+    for level in range(n_levels-1,0,-1):
+        half = 1<<(level-1)
+        np.maximum(table[level-1],table[level],out=table[level-1])
+        np.maximum(table[level-1,half:],table[level,:-half],
+                   out=table[level-1,half:])
+
+    return np.where(np.isneginf(table[0]),np.nan,table[0])
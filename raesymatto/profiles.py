@@ -0,0 +1,316 @@
+"""Signal profiles around many genomic regions."""
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import pyBigWig
+
+from raesymatto.bigwig import BigWigSource
+
+# maximum length of a span fetched using a single request
+MAX_SPAN = 1<<22
+
+# maximum number of regions in a task
+CHUNK_SIZE = 4096
+
+# bigWig files opened by the current worker process, see _open
+_HANDLES = {}
+
+def get_bin_edges(regions:pd.DataFrame,mode:str='reference-point',
+                  reference:str='center',upstream:int=5000,
+                  downstream:int=5000,body_length:int=5000,
+                  bin_size:int=50) -> Tuple[np.ndarray,np.ndarray]:
+    """Returns the bins of the regions.
+
+    Regions on the minus strand (the sixth BED column, if any) are
+    mirrored, so that their upstream flank is to the right.
+
+    Args:
+        regions (pd.DataFrame): Regions in BED format.
+        mode (str): 'reference-point' (a window around a point of each
+            region) or 'scale-regions' (each region is scaled to
+            body_length).
+        reference (str): Reference point; 'start', 'end', or 'center'.
+        upstream (int): Length of the upstream flank.
+        downstream (int): Length of the downstream flank.
+        body_length (int): Length of the scaled regions.
+        bin_size (int): Length of a bin.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: Genomic bin edges of each region
+            (regions x bins+1) from the left to the right, and the bin
+            edges relative to the reference point (or to the region start
+            in the scaled coordinates) from upstream to downstream.
+
+    """
+    if mode not in ('reference-point','scale-regions'):
+        raise ValueError('Unknown mode: %s'%mode)
+    if reference not in ('start','end','center'):
+        raise ValueError('Unknown reference: %s'%reference)
+
+    starts = regions.iloc[:,1].to_numpy(dtype=np.int64)
+    ends = regions.iloc[:,2].to_numpy(dtype=np.int64)
+    minus = (regions.iloc[:,5].to_numpy() == '-' if regions.shape[1] > 5
+             else np.zeros(regions.shape[0],dtype=bool))
+
+    n_upstream = -(-upstream//bin_size)
+    n_downstream = -(-downstream//bin_size)
+    n_body = max(-(-body_length//bin_size),1)
+    # number of the flanking bins to the left of the reference point
+    # or of the region
+    n_left = np.where(minus,n_downstream,n_upstream)[:,None]
+
+    if mode == 'reference-point':
+        relative = np.arange(-n_upstream,n_downstream+1)*bin_size
+        if reference == 'center':
+            points = (starts+ends)//2
+        else:
+            points = np.where(minus == (reference == 'start'),ends,starts)
+        steps = np.arange(relative.shape[0])[None,:]-n_left
+        edges = points[:,None]+steps*bin_size
+    else:
+        relative = np.concatenate((np.arange(-n_upstream,0)*bin_size,
+                                   np.linspace(0,body_length,n_body+1),
+                                   body_length+np.arange(1,n_downstream+1)*
+                                   bin_size))
+        steps = np.arange(relative.shape[0])[None,:]-n_left
+        lengths = (ends-starts)[:,None]
+        edges = np.select(
+            [steps < 0,steps <= n_body],
+            [starts[:,None]+steps*bin_size,
+             starts[:,None]+np.rint(lengths*steps/n_body).astype(np.int64)],
+            ends[:,None]+(steps-n_body)*bin_size)
+
+    return edges.astype(np.int64),relative
+
+def get_spans(starts:np.ndarray,ends:np.ndarray,
+              max_span:int=MAX_SPAN) -> Tuple[np.ndarray,np.ndarray,
+                                              np.ndarray]:
+    """Groups overlapping windows into spans fetched at once.
+
+    Args:
+        starts (np.ndarray): Start coordinates of the windows.
+        ends (np.ndarray): End coordinates of the windows.
+        max_span (int): Maximum length of a span. Longer windows form
+            spans of their own.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray,np.ndarray]: Span of each window, and
+            start and end coordinates of the spans.
+
+    """
+    spans = np.zeros(len(starts),dtype=int)
+    span_starts = []
+    span_ends = []
+    for idx in np.argsort(starts,kind='stable'):
+        if (span_ends and starts[idx] <= span_ends[-1] and
+            max(ends[idx],span_ends[-1])-span_starts[-1] <= max_span):
+            span_ends[-1] = max(ends[idx],span_ends[-1])
+        else:
+            span_starts.append(starts[idx])
+            span_ends.append(ends[idx])
+        spans[idx] = len(span_starts)-1
+    return (spans,np.array(span_starts,dtype=np.int64),
+            np.array(span_ends,dtype=np.int64))
+
+def summarize_bins(values:np.ndarray,lower:np.ndarray,upper:np.ndarray,
+                   summary:str='mean') -> np.ndarray:
+    """Summarizes per-base values in bins.
+
+    Args:
+        values (np.ndarray): Per-base values. Missing values are NaN.
+        lower (np.ndarray): Offsets of the bin starts.
+        upper (np.ndarray): Offsets of the bin ends.
+        summary (str): 'mean', 'max', or 'min'.
+
+    Returns:
+        np.ndarray: Summaries with the shape of lower. Bins without data
+            are NaN.
+
+    """
+    values = np.asarray(values)
+    # the reductions cost the total length of the bins, whereas
+    # the cumulative sums cost the length of the values
+    cumulative = (upper-lower).sum() > values.shape[0]
+    # reduce over the pairs (lower, upper), the missing sentinel allows
+    # the bins ending at the end of the values
+    values = np.append(values,np.nan)
+    missing = np.isnan(values)
+    pairs = np.column_stack((lower.ravel(),upper.ravel())).ravel()
+
+    def reduce_bins(function,array,empty) -> np.ndarray:
+        """Reduces the array over the bins."""
+        reduced = function.reduceat(array,pairs,
+                                    dtype=float)[::2].reshape(lower.shape)
+        return np.where(upper > lower,reduced,empty)
+
+    if cumulative:
+        counts = np.concatenate(([0],np.cumsum(~missing)))
+        counts = counts[upper]-counts[lower]
+    else:
+        counts = reduce_bins(np.add,~missing,0)
+
+    if summary == 'mean':
+        if cumulative:
+            sums = np.concatenate(([0],np.cumsum(np.where(missing,0,values),
+                                                 dtype=float)))
+            sums = sums[upper]-sums[lower]
+        else:
+            sums = reduce_bins(np.add,np.where(missing,0,values),0)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            summaries = sums/counts
+    elif summary in ('max','min'):
+        summaries = reduce_bins(np.fmax if summary == 'max' else np.fmin,
+                                values,np.nan)
+    else:
+        raise ValueError('Unknown summary: %s'%summary)
+
+    return np.where(counts > 0,summaries,np.nan)
+
+def fetch_bins(bw:Union[pyBigWig.pyBigWig,BigWigSource],chromosome:str,
+               edges:np.ndarray,summary:str='mean') -> np.ndarray:
+    """Fetches binned bigWig data of many regions on a chromosome.
+
+    Overlapping regions are grouped into spans, and the per-base values of
+    each span are fetched using a single request.
+
+    Args:
+        bw (Union[pyBigWig.pybigWig,BigWigSource]): bigWig object.
+        chromosome (str): Chromosome of interest.
+        edges (np.ndarray): Bin edges of the regions (regions x bins+1),
+            see get_bin_edges.
+        summary (str): 'mean', 'max', or 'min'.
+
+    Returns:
+        np.ndarray: Binned data (regions x bins, float32).
+
+    """
+    if isinstance(bw,BigWigSource):
+        with bw.handle() as handle:
+            return fetch_bins(handle,chromosome,edges,summary)
+
+    binned = np.full((edges.shape[0],edges.shape[1]-1),np.nan,
+                     dtype=np.float32)
+    length = bw.chroms(chromosome)
+    if length is None or edges.shape[0] == 0:
+        return binned
+
+    edges = np.clip(edges,0,length)
+    spans,span_starts,span_ends = get_spans(edges[:,0],edges[:,-1])
+    for span,(span_start,span_end) in enumerate(zip(span_starts,
+                                                    span_ends)):
+        if span_end <= span_start:
+            continue
+        if pyBigWig.numpy:
+            values = bw.values(chromosome,int(span_start),int(span_end),
+                               numpy=True)
+        else:
+            values = np.array(bw.values(chromosome,int(span_start),
+                                        int(span_end)),dtype=float)
+        rows = np.flatnonzero(spans == span)
+        offsets = edges[rows]-span_start
+        binned[rows] = summarize_bins(values,offsets[:,:-1],offsets[:,1:],
+                                      summary)
+
+    return binned
+
+def _open(path:str) -> pyBigWig.pyBigWig:
+    """Returns a bigWig file opened by the current process."""
+    if path not in _HANDLES:
+        _HANDLES[path] = pyBigWig.open(path)
+    return _HANDLES[path]
+
+def _matrix_task(path:str,chromosome:str,edges:np.ndarray,
+                 summary:str) -> np.ndarray:
+    """Fetches binned bigWig data in a worker process."""
+    return fetch_bins(_open(path),chromosome,edges,summary)
+
+def compute_matrix(bws:List[Union[str,pyBigWig.pyBigWig,BigWigSource]],
+                   regions:pd.DataFrame,mode:str='reference-point',
+                   reference:str='center',upstream:int=5000,
+                   downstream:int=5000,body_length:int=5000,
+                   bin_size:int=50,summary:str='mean',
+                   workers:int=1) -> Tuple[np.ndarray,np.ndarray]:
+    """Computes binned signal around many regions.
+
+    In the reference-point mode, each region is represented by a window
+    around its start, end, or center. In the scale-regions mode, each
+    region is scaled to body_length and flanked by the unscaled upstream
+    and downstream windows. The regions on the minus strand are mirrored.
+
+    The regions are processed by chromosome and in chunks of CHUNK_SIZE
+    regions. With more than one worker, the chunks are processed on
+    a process pool and the bigWig files have to be given as paths.
+
+    Args:
+        bws (List[Union[str,pyBigWig.pyBigWig,BigWigSource]]): Paths of
+            bigWig files or bigWig objects.
+        regions (pd.DataFrame): Regions in BED format.
+        mode (str): 'reference-point' or 'scale-regions'.
+        reference (str): Reference point; 'start', 'end', or 'center'.
+        upstream (int): Length of the upstream flank.
+        downstream (int): Length of the downstream flank.
+        body_length (int): Length of the scaled regions.
+        bin_size (int): Length of a bin.
+        summary (str): Bin summary; 'mean', 'max', or 'min'.
+        workers (int): Number of worker processes.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: Binned signal (samples x regions x
+            bins, float32) with the bins from upstream to downstream, and
+            the relative bin edges (see get_bin_edges). Bins without data
+            are NaN.
+
+    """
+    if summary not in ('mean','max','min'):
+        raise ValueError('Unknown summary: %s'%summary)
+
+    edges,relative = get_bin_edges(regions,mode,reference,upstream,
+                                   downstream,body_length,bin_size)
+    minus = (regions.iloc[:,5].to_numpy() == '-' if regions.shape[1] > 5
+             else np.zeros(regions.shape[0],dtype=bool))
+    matrix = np.full((len(bws),regions.shape[0],relative.shape[0]-1),
+                     np.nan,dtype=np.float32)
+
+    chromosomes = regions.iloc[:,0].astype(str).to_numpy()
+    chunks = []
+    for chromosome in pd.unique(chromosomes):
+        positions = np.flatnonzero(chromosomes == chromosome)
+        for first in range(0,positions.shape[0],CHUNK_SIZE):
+            chunks.append((chromosome,positions[first:first+CHUNK_SIZE]))
+    tasks = [(sample,chromosome,positions)
+             for sample in range(len(bws))
+             for chromosome,positions in chunks]
+
+    if workers > 1:
+        if not all(isinstance(bw,str) for bw in bws):
+            raise ValueError('bigWig files have to be given as paths '
+                             'when workers > 1')
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                _matrix_task,
+                [bws[sample] for sample,_,_ in tasks],
+                [chromosome for _,chromosome,_ in tasks],
+                [edges[positions] for _,_,positions in tasks],
+                [summary]*len(tasks))
+            for (sample,_,positions),binned in zip(tasks,results):
+                matrix[sample,positions] = binned
+    else:
+        opened = {}
+        for sample,chromosome,positions in tasks:
+            bw = bws[sample]
+            if isinstance(bw,str):
+                if bw not in opened:
+                    opened[bw] = pyBigWig.open(bw)
+                bw = opened[bw]
+            matrix[sample,positions] = fetch_bins(bw,chromosome,
+                                                  edges[positions],summary)
+        for bw in opened.values():
+            bw.close()
+
+    # the bins from upstream to downstream
+    matrix[:,minus] = matrix[:,minus,::-1]
+
+    return matrix,relative
@@ -0,0 +1,255 @@
+"""Opt-in profiling of the tracks.
+
+The draw functions are instrumented with checkpoints which split the time
+of a call into phases: 'query' (reading the data of the region),
+'layout' (e.g. packing the intervals into rows), 'build' (creating
+the artists), and 'render' (Figure.savefig). The checkpoints cost
+a single check unless a profiler is active.
+
+Usage:
+    with profiling.profile() as profiler:
+        render_region(layout,'chr1',1000000,2000000,'region.png')
+    print(profiler.summary())
+
+Only the calls made by the current process are recorded, i.e. not those
+of the worker processes of render_regions.
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+PHASES = ('query','layout','build','render')
+
+# active profilers
+_PROFILERS = []
+_PROFILERS_LOCK = threading.Lock()
+
+# records of the calls being profiled in the current thread
+_LOCAL = threading.local()
+
+class Profiler:
+    """Records of the profiled calls.
+
+    Each record is a dict with the name of the function, the region
+    (chromosome, start, end; None if not applicable), the total seconds,
+    the seconds of each phase (phases), the number of features read
+    (features), the number of artists created (artists), and the name of
+    the thread.
+
+    Args:
+        callback (Optional[Callable[[dict],None]]): Function called with
+            each record, e.g. log_record.
+
+    """
+    def __init__(self,callback:Optional[Callable[[dict],None]]=None
+                 ) -> None:
+        """
+        """
+        self.callback = callback
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self,record:dict) -> None:
+        """Adds a record.
+
+        Args:
+            record (dict): Record of a call.
+
+        """
+        with self._lock:
+            self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def table(self) -> pd.DataFrame:
+        """Returns the records as a table.
+
+        Returns:
+            pd.DataFrame: A row per call with the seconds of each phase.
+
+        """
+        import pandas as pd
+
+        with self._lock:
+            records = list(self.records)
+        return pd.DataFrame(
+            [{**{key:value for key,value in record.items()
+                 if key != 'phases'},
+              **{phase:record['phases'].get(phase,0.0) for phase in PHASES}}
+             for record in records],
+            columns=['name','chromosome','start','end','seconds',*PHASES,
+                     'features','artists','thread'])
+
+    def summary(self,by:str='name') -> pd.DataFrame:
+        """Returns the total seconds, features, and artists.
+
+        Args:
+            by (str): Column the calls are grouped by, e.g. 'name' or
+                'chromosome'.
+
+        Returns:
+            pd.DataFrame: Number of calls and the totals by group, sorted
+                by the total seconds.
+
+        """
+        table = self.table()
+        summary = table.groupby(by).agg(
+            calls=('seconds','size'),seconds=('seconds','sum'),
+            **{phase:(phase,'sum') for phase in PHASES},
+            features=('features','sum'),artists=('artists','sum'))
+        return summary.sort_values('seconds',ascending=False)
+
+@contextlib.contextmanager
+def profile(callback:Optional[Callable[[dict],None]]=None
+            ) -> Iterator[Profiler]:
+    """Profiles the calls made within the context.
+
+    Args:
+        callback (Optional[Callable[[dict],None]]): Function called with
+            each record, see Profiler.
+
+    Returns:
+        Iterator[Profiler]: Profiler collecting the records.
+
+    """
+    profiler = Profiler(callback)
+    with _PROFILERS_LOCK:
+        _PROFILERS.append(profiler)
+    try:
+        yield profiler
+    finally:
+        with _PROFILERS_LOCK:
+            _PROFILERS.remove(profiler)
+
+def log_record(record:dict) -> None:
+    """Logs a record, see Profiler.
+
+    Args:
+        record (dict): Record of a call.
+
+    """
+    logging.info('%s %s:%s-%s %.3f s (%s) features=%s artists=%s',
+                 record['name'],record['chromosome'],record['start'],
+                 record['end'],record['seconds'],
+                 ', '.join('%s %.3f s'%item
+                           for item in record['phases'].items()),
+                 record['features'],record['artists'],
+                 extra={'profile':record})
+
+@contextlib.contextmanager
+def track(name:str,ax=None,chromosome:Optional[str]=None,
+          start:Optional[int]=None,end:Optional[int]=None,
+          phase:str='build') -> Iterator[None]:
+    """Profiles a call.
+
+    Calls made within another profiled call are included in the
+    latter.
+
+    Args:
+        name (str): Name of the call.
+        ax (Optional[mpl.axes.Axes]): Axes whose new artists are counted.
+        chromosome (Optional[str]): Chromosome of interest.
+        start (Optional[int]): Start coordinate.
+        end (Optional[int]): End coordinate.
+        phase (str): Phase of the time after the last checkpoint,
+            see mark.
+
+    """
+    stack = _get_stack()
+    if not _PROFILERS or stack:
+        # a nested call is a part of the current phase of the outer call
+        stack.append(None)
+        try:
+            yield
+        finally:
+            stack.pop()
+        return
+
+    children = len(ax.get_children()) if ax is not None else 0
+    record = {'name':name,'chromosome':chromosome,'start':start,
+              'end':end,'seconds':0.0,'phases':{},'features':None,
+              'artists':None,'thread':threading.current_thread().name}
+    started = checkpoint = time.perf_counter()
+    stack.append([record,checkpoint])
+    try:
+        yield
+    finally:
+        _,checkpoint = stack.pop()
+        now = time.perf_counter()
+        _add_phase(record,phase,now-checkpoint)
+        record['seconds'] = now-started
+        if ax is not None:
+            record['artists'] = len(ax.get_children())-children
+        for profiler in list(_PROFILERS):
+            profiler.add(record)
+
+def profiled(function:Optional[Callable]=None,
+             phase:str='build') -> Callable:
+    """Profiles the calls of a draw function, see track.
+
+    The region and the axes are taken from the arguments chromosome,
+    start, end, and ax, if any. Can be used as @profiled or
+    @profiled(phase=...).
+
+    Args:
+        function (Optional[Callable]): Function to be profiled.
+        phase (str): Phase of the time after the last checkpoint.
+
+    """
+    if function is None:
+        return functools.partial(profiled,phase=phase)
+
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args,**kwargs):
+        if not _PROFILERS:
+            return function(*args,**kwargs)
+        arguments = signature.bind_partial(*args,**kwargs).arguments
+        with track(function.__name__,arguments.get('ax'),
+                   arguments.get('chromosome'),arguments.get('start'),
+                   arguments.get('end'),phase):
+            return function(*args,**kwargs)
+
+    return wrapper
+
+def mark(phase:str,features:Optional[int]=None) -> None:
+    """Ends a phase of the current call.
+
+    The time since the previous checkpoint is added to the phase.
+
+    Args:
+        phase (str): Phase, see PHASES.
+        features (Optional[int]): Number of features read, if known.
+
+    """
+    if not _PROFILERS:
+        return
+    stack = _get_stack()
+    if not stack or stack[-1] is None:
+        return
+    record,checkpoint = stack[-1]
+    now = time.perf_counter()
+    _add_phase(record,phase,now-checkpoint)
+    stack[-1][1] = now
+    if features is not None:
+        record['features'] = (record['features'] or 0)+int(features)
+
+def _add_phase(record:dict,phase:str,seconds:float) -> None:
+    """Adds seconds to a phase of a record."""
+    record['phases'][phase] = record['phases'].get(phase,0.0)+seconds
+
+def _get_stack() -> List[Optional[list]]:
+    """Returns the calls being profiled in the current thread."""
+    if not hasattr(_LOCAL,'stack'):
+        _LOCAL.stack = []
+    return _LOCAL.stack
@@ -0,0 +1,817 @@
+"""Batch rendering of genomic regions.
+
+pandas and the data modules are imported when a track needs them, so that
+rendering bigWig tracks does not import pandas.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import (TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional,
+                    Tuple, Union)
+
+import matplotlib as mpl
+
+from raesymatto import profiling, visualizations
+from raesymatto.utils import is_dataframe
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# track type: (draw function, name of the data argument, kind of data)
+TRACKS = {'region_information':(visualizations.draw_region_information,
+                                None,None),
+          'bw':(visualizations.draw_bw,'bw','bw'),
+          'bw_heatmap':(visualizations.draw_bw_heatmap,'bws','bws'),
+          'bed':(visualizations.draw_bed,'bed','bed'),
+          'boxes':(visualizations.draw_boxes,'bed','bed'),
+          'loops':(visualizations.draw_loops,'bed','bed'),
+          'bedpe':(visualizations.draw_loops,'bed','bedpe'),
+          'gene_models':(visualizations.draw_gene_models,'genes','genes')}
+
+# track types whose draw functions update the artists of a previous call
+# in place, see visualizations.draw_bed
+IN_PLACE_TRACKS = ('bed','gene_models')
+
+# decimals of the subplot parameters of the tight layout, far below
+# a pixel, so that layouts of equal extents are equal, see tight_layout
+LAYOUT_DECIMALS = 6
+
+# data sources opened by the current process, see open_source
+_SOURCES = {}
+_SOURCES_LOCK = threading.Lock()
+
+# figure used by the current worker process, see _init_worker
+_FIGURE = None
+
+def open_source(kind:str,source):
+    """Returns a data source usable by the draw functions.
+
+    Paths are opened only once per process and the opened sources are
+    reused for subsequent regions. bigWig files are opened as shared
+    BigWigSource objects. BED and GTF files with a tabix index (.tbi) are
+    queried from the disk, and the indices (BedIndex and GeneModelIndex,
+    respectively) of other BED and GTF files are loaded from the cache
+    next to the file, see raesymatto.cache.load_cached. BEDPE files and
+    data frames are indexed using BedpeIndex. Other objects, such as
+    data frames and indices, are returned as such.
+
+    Args:
+        kind (str): Kind of data; 'bw', 'bed', 'bedpe', 'genes', or 'bws'
+            (a list of bigWig paths or objects).
+        source: Path or a data object.
+
+    """
+    if kind == 'bws':
+        return [open_source('bw',item) for item in source]
+    if kind == 'bedpe' and is_dataframe(source):
+        from raesymatto.intervals import BedpeIndex
+
+        return BedpeIndex(source)
+    if not isinstance(source,str):
+        return source
+
+    with _SOURCES_LOCK:
+        if (kind,source) not in _SOURCES:
+            _SOURCES[(kind,source)] = _open(kind,source)
+        return _SOURCES[(kind,source)]
+
+def _open(kind:str,source:str):
+    """Opens a data source."""
+    if kind == 'bw':
+        from raesymatto.bigwig import open_bigwig
+
+        return open_bigwig(source)
+    if kind not in ('bed','bedpe','genes'):
+        raise ValueError('Unknown kind of data: %s'%kind)
+
+    from raesymatto import cache, tabix
+
+    if kind == 'bed' and os.path.exists(source+'.tbi'):
+        return tabix.TabixBed(source)
+    if kind == 'bed':
+        return cache.load_bed(source)
+    if kind == 'bedpe':
+        return cache.load_bedpe(source)
+    if kind == 'genes' and os.path.exists(source+'.tbi'):
+        return tabix.TabixGenes(source)
+    return cache.load_genes(source)
+
+def close_sources(paths:Optional[Iterable[str]]=None) -> None:
+    """Closes the data sources opened by the current process.
+
+    Args:
+        paths (Optional[Iterable[str]]): Close only the sources opened from
+            these paths. Defaults to all the sources.
+
+    """
+    if paths is not None:
+        paths = set(paths)
+    with _SOURCES_LOCK:
+        for key in list(_SOURCES):
+            if paths is not None and key[1] not in paths:
+                continue
+            source = _SOURCES.pop(key)
+            if key[0] == 'bw':
+                source.close()
+
+def get_regions(regions:Union[pd.DataFrame,Iterable[tuple]]
+                ) -> List[Tuple[str,int,int]]:
+    """Returns regions as a list of (chromosome, start, end) tuples.
+
+    Args:
+        regions (Union[pd.DataFrame,Iterable[tuple]]): Regions in BED
+            format or an iterable of (chromosome, start, end) tuples.
+
+    """
+    if is_dataframe(regions):
+        regions = regions.iloc[:,:3].itertuples(index=False)
+    return [(str(region[0]),int(region[1]),int(region[2]))
+            for region in regions]
+
+def get_layers(track:Union[dict,List[dict]]) -> List[dict]:
+    """Returns the layers of a track.
+
+    Args:
+        track (Union[dict,List[dict]]): Track or a list of layers drawn
+            on the same axes.
+
+    """
+    return [track] if isinstance(track,dict) else list(track)
+
+def fetch_layout(axes:List[mpl.axes.Axes],tracks:List[List[dict]],
+                 chromosome:str,start:int,end:int,
+                 workers:Optional[int]=None,
+                 widths:Optional[List[int]]=None
+                 ) -> Dict[Tuple[int,int],tuple]:
+    """Fetches the data of a track layout concurrently.
+
+    The data requests of every bigWig layer, and the region queries of
+    the BED and GTF layers read from the disk (e.g. raesymatto.tabix
+    readers), are run on a thread pool, so that the wall-clock time
+    approaches that of the slowest request. BigWigSource objects are
+    thread-safe, whereas the requests sharing a raw pyBigWig object or
+    a reader are run sequentially in the same thread. In-memory data
+    frames and indices are not queried in advance.
+
+    Args:
+        axes (List[mpl.axes.Axes]): Axes of the tracks.
+        tracks (List[List[dict]]): Layers of the tracks.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        workers (Optional[int]): Number of threads. Defaults to the number
+            of independent requests.
+        widths (Optional[List[int]]): Widths of the axes in pixels used by
+            the layers with nbins='auto'. Defaults to the current widths.
+
+    Returns:
+        Dict[Tuple[int,int],tuple]: Data (see fetch_bw) or the records of
+            the region (pd.DataFrame) by track and layer index.
+
+    """
+    # group the requests by the object serving them
+    groups = {}
+    for track_idx,(ax,layers) in enumerate(zip(axes,tracks)):
+        for layer_idx,layer in enumerate(layers):
+            options = layer.get('options',{})
+            kind = TRACKS.get(layer['type'],(None,None,None))[2]
+            if kind in ('bed','genes'):
+                from raesymatto.genes import GeneModelIndex
+                from raesymatto.intervals import BedIndex
+
+                source = open_source(kind,layer['source'])
+                if not (is_dataframe(source) or
+                        isinstance(source,(BedIndex,GeneModelIndex))):
+                    groups.setdefault(id(source),[]).append(
+                        ((track_idx,layer_idx),
+                         (source.query,chromosome,start,end)))
+                continue
+            if layer['type'] != 'bw' or 'data' in options:
+                continue
+            from raesymatto.bigwig import BigWigSource
+
+            bw = open_source('bw',layer['source'])
+            nbins = options.get('nbins')
+            if nbins == 'auto':
+                nbins = (visualizations.get_pixel_width(ax) if widths is None
+                         else widths[track_idx])
+            key = ((track_idx,layer_idx) if isinstance(bw,BigWigSource)
+                   else id(bw))
+            groups.setdefault(key,[]).append(
+                ((track_idx,layer_idx),
+                 (visualizations.fetch_bw,bw,chromosome,start,end,
+                  options.get('skip',1),nbins,options.get('summary','max'))))
+
+    def fetch(requests):
+        results = []
+        for layer,(function,*args) in requests:
+            with profiling.track(function.__qualname__,None,chromosome,
+                                 start,end,'query'):
+                results.append((layer,function(*args)))
+        return results
+
+    if not groups:
+        return {}
+    with ThreadPoolExecutor(max_workers=(workers if workers is not None
+                                         else len(groups))) as executor:
+        results = executor.map(fetch,groups.values())
+        return dict(result for group in results for result in group)
+
+def create_axes(fig:mpl.figure.Figure,
+                tracks:List[List[dict]]) -> List[mpl.axes.Axes]:
+    """Creates the axes of the tracks.
+
+    Args:
+        fig (mpl.figure.Figure): Figure to be used.
+        tracks (List[List[dict]]): Layers of the tracks.
+
+    """
+    return list(fig.subplots(len(tracks),1,squeeze=False,
+                             gridspec_kw={'height_ratios':
+                                          [layers[0].get('height',1)
+                                           for layers in tracks]})[:,0])
+
+def draw_layer(ax:mpl.axes.Axes,layer:dict,chromosome:str,start:int,
+               end:int,data:Optional[Union[tuple,pd.DataFrame]]=None,
+               artists:Optional[dict]=None) -> Optional[dict]:
+    """Draws a layer of a track.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        layer (dict): Track, see draw_layout.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        data (Optional[Union[tuple,pd.DataFrame]]): Data already fetched,
+            see fetch_layout. Records of the region replace the source.
+        artists (Optional[dict]): Artists returned by the previous call of
+            a layer of IN_PLACE_TRACKS on the same axes, which are updated
+            in place.
+
+    Returns:
+        Optional[dict]: Drawn artists by role for IN_PLACE_TRACKS.
+
+    """
+    if layer['type'] not in TRACKS:
+        raise ValueError('Unknown track type: %s'%layer['type'])
+    draw,argument,kind = TRACKS[layer['type']]
+    options = dict(layer.get('options',{}))
+    if kind in ('bed','genes') and data is not None:
+        options[argument] = data
+    elif argument is not None:
+        options[argument] = open_source(kind,layer['source'])
+    if kind == 'bw' and data is not None:
+        options['data'] = data
+    if layer['type'] in IN_PLACE_TRACKS:
+        return draw(ax,chromosome,start,end,artists=artists,**options)
+    draw(ax,chromosome,start,end,**options)
+    return None
+
+def rasterize_track(ax:mpl.axes.Axes,layout:dict,
+                    layers:List[dict]) -> None:
+    """Applies the rasterization policy of a track, see draw_layout.
+
+    Args:
+        ax (mpl.axes.Axes): Axes of the track.
+        layout (dict): Track layout.
+        layers (List[dict]): Layers of the track.
+
+    """
+    policy = layers[0].get('rasterize',layout.get('rasterize',True))
+    if policy is True:
+        policy = {}
+    if policy not in (False,None):
+        visualizations.rasterize_dense(ax,**policy)
+
+def draw_layout(fig:mpl.figure.Figure,layout:dict,chromosome:str,
+                start:int,end:int) -> List[mpl.axes.Axes]:
+    """Draws a track layout on a figure.
+
+    A layout is a dictionary with the keys 'tracks' (list of tracks),
+    and optionally 'figsize', 'dpi', 'format', 'rcparams',
+    'fetch_workers' (see fetch_layout), and 'rasterize'. A track is
+    a dictionary with the keys 'type' (see TRACKS), 'source' (path or data
+    object), 'height' (relative height), 'options' (additional arguments
+    passed to the draw function), 'legend' (arguments passed to
+    Axes.legend), and 'rasterize'. A list of tracks is drawn on the same
+    axes.
+
+    The rasterization policy of a track (or of all the tracks in the
+    layout) is True (the default thresholds), False, or a dictionary of
+    arguments passed to visualizations.rasterize_dense, which rasterizes
+    the data of dense tracks in vector formats at the dpi of the layout.
+
+    The bigWig data of all the tracks is fetched concurrently before
+    drawing.
+
+    Args:
+        fig (mpl.figure.Figure): Figure to be used.
+        layout (dict): Track layout.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+
+    """
+    tracks = [get_layers(track) for track in layout['tracks']]
+    axes = create_axes(fig,tracks)
+
+    data = fetch_layout(axes,tracks,chromosome,start,end,
+                        layout.get('fetch_workers'))
+
+    for track_idx,(ax,layers) in enumerate(zip(axes,tracks)):
+        for layer_idx,layer in enumerate(layers):
+            draw_layer(ax,layer,chromosome,start,end,
+                       data.get((track_idx,layer_idx)))
+        rasterize_track(ax,layout,layers)
+        if 'legend' in layers[0]:
+            ax.legend(**layers[0]['legend'])
+
+    return list(axes)
+
+def tight_layout(fig:mpl.figure.Figure) -> None:
+    """Adjusts the subplot parameters as Figure.tight_layout.
+
+    Unlike Figure.tight_layout, leaves no layout engine on the figure,
+    which would make Figure.savefig draw the figure an extra time. The
+    subplot parameters are rounded to LAYOUT_DECIMALS decimals, as their
+    last bits depend on the extents of the texts within the axes.
+
+    Args:
+        fig (mpl.figure.Figure): Figure to be used.
+
+    """
+    mpl.layout_engine.TightLayoutEngine().execute(fig)
+    fig.subplots_adjust(**{name:round(float(value),LAYOUT_DECIMALS)
+                           for name,value in get_subplotpars(fig).items()})
+
+def get_subplotpars(fig:mpl.figure.Figure) -> Dict[str,float]:
+    """Returns the subplot parameters of a figure.
+
+    Args:
+        fig (mpl.figure.Figure): Figure to be used.
+
+    """
+    return {name:getattr(fig.subplotpars,name)
+            for name in ('left','bottom','right','top','wspace','hspace')}
+
+def render_region(layout:dict,chromosome:str,start:int,end:int,
+                  path:str) -> None:
+    """Renders a region into a file.
+
+    Args:
+        layout (dict): Track layout, see draw_layout.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        path (str): Output file.
+
+    """
+    with mpl.rc_context(layout.get('rcparams',{})):
+        fig = mpl.figure.Figure(figsize=layout.get('figsize',(8,4)))
+        draw_layout(fig,layout,chromosome,start,end)
+        with profiling.track('figure',None,chromosome,start,end,'render'):
+            tight_layout(fig)
+            profiling.mark('layout')
+            fig.savefig(path,dpi=layout.get('dpi',300))
+
+class GenomeBrowserFigure:
+    """Figure of a track layout which is moved between regions in place.
+
+    The figure and its axes are created once. Moving to another region
+    updates the existing artists where possible: bigWig tracks replace
+    the data of their filled areas, the region information is shifted
+    as long as the region length does not change, and the collections and
+    gene names of the BED and gene model tracks are updated in place (see
+    IN_PLACE_TRACKS). The artists of the other tracks are replaced on the
+    existing axes. Each region is drawn on the axes positions of a new
+    figure (e.g. the data of the layers with nbins='auto' is binned to
+    those widths) and then laid out using tight_layout, unless the layout
+    has fixed 'margins' (arguments passed to Figure.subplots_adjust), so
+    that the output of a region does not depend on the regions drawn
+    before it. The layout is computed again only when the extents of the
+    tick labels, texts, or other decorations beyond the axes change,
+    see _get_layout_key. BED and GTF data frames are indexed once.
+
+    Args:
+        layout (dict): Track layout, see draw_layout.
+
+    """
+    def __init__(self,layout:dict) -> None:
+        """
+        """
+        self.layout = layout
+        self.tracks = [[self._index(layer) for layer in get_layers(track)]
+                       for track in layout['tracks']]
+
+        with mpl.rc_context(layout.get('rcparams',{})):
+            self.fig = mpl.figure.Figure(figsize=layout.get('figsize',(8,4)))
+        # subplot parameters of a new figure, each region is drawn starting
+        # from them so that its output does not depend on the previous ones
+        self.subplotpars = get_subplotpars(self.fig)
+        self._reset()
+
+    @staticmethod
+    def _index(layer:dict) -> dict:
+        """Replaces a data frame source with its index."""
+        kind = TRACKS.get(layer['type'],(None,None,None))[2]
+        source = layer.get('source')
+        if not is_dataframe(source):
+            return layer
+
+        from raesymatto.genes import GeneModelIndex
+        from raesymatto.intervals import BedIndex, BedpeIndex
+
+        if kind == 'bed':
+            return dict(layer,source=BedIndex(source))
+        if kind == 'genes':
+            return dict(layer,source=GeneModelIndex(source))
+        if kind == 'bedpe':
+            return dict(layer,source=BedpeIndex(source))
+        return layer
+
+    def _reset(self) -> None:
+        """Replaces the axes with empty ones."""
+        self.fig.clear()
+        self.fig.subplots_adjust(**self.subplotpars)
+        with mpl.rc_context(self.layout.get('rcparams',{})):
+            self.axes = create_axes(self.fig,self.tracks)
+        # widths of the axes before the layout, used to bin the data
+        self.widths = [visualizations.get_pixel_width(ax)
+                       for ax in self.axes]
+        # artists and the drawn region by track and layer index, and the
+        # artists by role of IN_PLACE_TRACKS
+        self.artists = {}
+        self.regions = {}
+        self.drawn = {}
+        self.region = None
+        # the last tight layout and the key it was computed for
+        self.layout_key = None
+        self.layout_pars = None
+
+    def _update_layer(self,ax:mpl.axes.Axes,layer:dict,key:Tuple[int,int],
+                      chromosome:str,start:int,end:int,
+                      data:Optional[tuple]) -> bool:
+        """Updates the artists of a layer in place if possible."""
+        artists = self.artists.get(key)
+        if not artists:
+            return False
+
+        if (layer['type'] == 'bw' and data is not None and
+            len(artists) == 1 and hasattr(artists[0],'set_data')):
+            x,values = data
+            artists[0].set_data(x,values[:,0],
+                                values[:,1] if values.shape[1] == 2 else 0)
+            options = layer.get('options',{})
+            ax.set_xlim(start,end)
+            ax.relim()
+            ax.set_autoscaley_on(True)
+            ax.autoscale_view(scalex=False)
+            ax.set_ylim(bottom=options.get('ymin'),top=options.get('ymax'))
+            return True
+
+        if layer['type'] == 'region_information':
+            drawn_start,drawn_end = self.regions[key]
+            if end-start != drawn_end-drawn_start:
+                return False
+            # shift the scale bar and the region text
+            transform = (mpl.transforms.Affine2D()
+                         .translate(start-drawn_start,0)+ax.transData)
+            for artist in artists:
+                artist.set_transform(transform)
+            artists[0].set_text(visualizations.get_region_label(
+                chromosome,start,end))
+            ax.set_xlim(start,end)
+            return True
+
+        return False
+
+    def _get_layout_key(self) -> list:
+        """Returns the extents the tight layout of the tracks depends on.
+
+        tight_layout pads the axes by the extents of their artists beyond
+        the axes. The data artists are clipped to the axes, thus, only the
+        tick labels, axis labels, titles, texts, legends, and spines are
+        considered, without measuring the data. The tracks are drawn on
+        the same axes positions for every region, so that equal keys give
+        equal layouts.
+        """
+        key = []
+        for ax in self.axes:
+            box = ax.get_window_extent()
+            extents = [box]
+            ticks = []
+            for axis in (ax.xaxis,ax.yaxis):
+                # updates the ticks and their labels
+                axis.get_majorticklabels()
+                low,high = sorted(axis.get_view_interval())
+                margin = 1e-9*(high-low)
+                visible = [tick for tick in axis.get_major_ticks()
+                           if low-margin <= tick.get_loc() <= high+margin]
+                extents.extend(label.get_window_extent()
+                               for tick in visible
+                               for label in (tick.label1,tick.label2)
+                               if label.get_visible() and label.get_text())
+                # the tick marks extend beyond the axes by their length
+                ticks.append((bool(visible),axis.label.get_text(),
+                              axis.label.get_fontsize(),
+                              axis.get_offset_text().get_text()))
+            extents.extend(text.get_window_extent() for text in ax.texts
+                           if text.get_visible() and text.get_in_layout())
+            if ax.get_legend() is not None:
+                extents.append(ax.get_legend().get_window_extent())
+
+            spines = tuple(spine.get_position()
+                           for spine in ax.spines.values())
+            if any(position[0] == 'data' for position in spines
+                   if isinstance(position,tuple)):
+                spines += (ax.get_xlim(),ax.get_ylim())
+
+            overflow = (box.x0-min(extent.x0 for extent in extents),
+                        box.y0-min(extent.y0 for extent in extents),
+                        max(extent.x1 for extent in extents)-box.x1,
+                        max(extent.y1 for extent in extents)-box.y1)
+            key.append((overflow,tuple(ticks),spines,
+                        tuple(ax.get_title(loc=loc)
+                              for loc in ('left','center','right'))))
+        return key
+
+    def fetch(self,chromosome:str,start:int,end:int
+              ) -> Dict[Tuple[int,int],Union[tuple,pd.DataFrame]]:
+        """Fetches the data of a region, see fetch_layout.
+
+        Can be called from another thread while the figure is drawn.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+
+        """
+        return fetch_layout(self.axes,self.tracks,chromosome,start,end,
+                            self.layout.get('fetch_workers'),self.widths)
+
+    def update(self,chromosome:str,start:int,end:int,
+               data:Optional[Dict[Tuple[int,int],
+                                  Union[tuple,pd.DataFrame]]]=None
+               ) -> 'GenomeBrowserFigure':
+        """Moves the figure to a region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+            data (Optional[Dict[Tuple[int,int],Union[tuple,pd.DataFrame]]]):
+                Data of the region already fetched using fetch.
+
+        """
+        with mpl.rc_context(self.layout.get('rcparams',{})):
+            try:
+                self._update(chromosome,start,end,data)
+            except BaseException:
+                # the tracks may be partially updated
+                self._reset()
+                raise
+        self.region = (chromosome,start,end)
+        return self
+
+    def _update(self,chromosome:str,start:int,end:int,
+                data:Optional[dict]) -> None:
+        """Updates the tracks."""
+        if data is None:
+            data = self.fetch(chromosome,start,end)
+        # the tracks are drawn before the layout as on a new figure
+        self.fig.subplots_adjust(**self.subplotpars)
+
+        for track_idx,(ax,layers) in enumerate(zip(self.axes,self.tracks)):
+            redrawn = False
+            for layer_idx,layer in enumerate(layers):
+                key = (track_idx,layer_idx)
+                if self._update_layer(ax,layer,key,chromosome,start,end,
+                                      data.get(key)):
+                    continue
+
+                previous = self.artists.pop(key,[])
+                drawn = self.drawn.pop(key,None)
+                if drawn is None:
+                    for artist in previous:
+                        artist.remove()
+                    ax.relim()
+                ax.set_autoscale_on(True)
+                children = set(ax.get_children())
+                drawn = draw_layer(ax,layer,chromosome,start,end,
+                                   data.get(key),drawn)
+                current = ax.get_children()
+                self.artists[key] = [artist for artist in current
+                                     if artist not in children]
+                if drawn is not None:
+                    # the artists updated in place are kept
+                    self.drawn[key] = drawn
+                    current = set(current)
+                    self.artists[key].extend(artist for artist in previous
+                                             if artist in current)
+                    if ax.get_autoscalex_on() or ax.get_autoscaley_on():
+                        ax.relim()
+                        ax.autoscale_view()
+                self.regions[key] = (start,end)
+                redrawn = True
+            if redrawn and 'legend' in layers[0]:
+                ax.legend(**layers[0]['legend'])
+            rasterize_track(ax,self.layout,layers)
+
+        with profiling.track('figure',None,chromosome,start,end,'layout'):
+            if 'margins' in self.layout:
+                self.fig.subplots_adjust(**self.layout['margins'])
+                return
+            layout_key = self._get_layout_key()
+            if layout_key != self.layout_key:
+                tight_layout(self.fig)
+                self.layout_key = layout_key
+                self.layout_pars = get_subplotpars(self.fig)
+            else:
+                self.fig.subplots_adjust(**self.layout_pars)
+
+    def savefig(self,path:str,**kwargs) -> None:
+        """Saves the figure.
+
+        Args:
+            path (str): Output file.
+            kwargs: Additional arguments passed to Figure.savefig. The dpi
+                defaults to that of the layout.
+
+        """
+        kwargs.setdefault('dpi',self.layout.get('dpi',300))
+        region = self.region or (None,None,None)
+        with mpl.rc_context(self.layout.get('rcparams',{})):
+            with profiling.track('figure',None,*region,'render'):
+                self.fig.savefig(path,**kwargs)
+
+def get_path(layout:dict,out_dir:str,chromosome:str,start:int,
+             end:int) -> str:
+    """Returns the output file of a region.
+
+    Args:
+        layout (dict): Track layout, see draw_layout.
+        out_dir (str): Output directory.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+
+    """
+    return os.path.join(out_dir,'%s_%d_%d.%s'%(chromosome,start,end,
+                                               layout.get('format','png')))
+
+def _init_worker(layout:dict) -> None:
+    """Initializes a worker process."""
+    global _FIGURE
+    mpl.use('Agg')
+    _FIGURE = GenomeBrowserFigure(layout)
+
+def _render_task(region:Tuple[str,int,int],out_dir:str,
+                 figure:Optional[GenomeBrowserFigure]=None,
+                 data:Optional[Union[dict,Exception]]=None) -> dict:
+    """Renders a region and reports the timing or failure."""
+    if figure is None:
+        figure = _FIGURE
+    chromosome,start,end = region
+    path = get_path(figure.layout,out_dir,chromosome,start,end)
+
+    start_time = time.perf_counter()
+    error = None
+    try:
+        if isinstance(data,Exception):
+            raise data
+        figure.update(chromosome,start,end,data).savefig(path)
+    except Exception as e:
+        logging.warning('Rendering %s:%d-%d failed: %s',
+                        chromosome,start,end,e)
+        error = repr(e)
+        path = None
+
+    return {'chromosome':chromosome,'start':start,'end':end,'path':path,
+            'seconds':time.perf_counter()-start_time,'error':error}
+
+def prefetch_regions(figure:GenomeBrowserFigure,
+                     regions:Iterable[Tuple[str,int,int]],prefetch:int=2
+                     ) -> Iterator[Tuple[Tuple[str,int,int],
+                                         Union[dict,Exception]]]:
+    """Fetches the data of the upcoming regions in the background.
+
+    The data is fetched (see GenomeBrowserFigure.fetch) by a background
+    thread into a queue of at most prefetch regions, so that fetching the
+    next regions overlaps drawing the current one while the memory use
+    stays bounded.
+
+    Args:
+        figure (GenomeBrowserFigure): Figure whose data is fetched.
+        regions (Iterable[Tuple[str,int,int]]): Regions.
+        prefetch (int): Maximum number of regions fetched ahead.
+
+    Returns:
+        Iterator[Tuple[Tuple[str,int,int],Union[dict,Exception]]]: Regions
+            and their data, or the exception raised while fetching.
+
+    """
+    fetched = queue.Queue(maxsize=max(prefetch,1))
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        """Waits for room in the queue unless stopped."""
+        while not stopped.is_set():
+            try:
+                fetched.put(item,timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        """Fetches the data of the regions."""
+        for region in regions:
+            try:
+                data = figure.fetch(*region)
+            except Exception as e:
+                data = e
+            if not put((region,data)):
+                return
+        put(None)
+
+    producer = threading.Thread(target=produce,daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = fetched.get()
+            if item is None:
+                break
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+def render_regions(layout:dict,regions:Union[pd.DataFrame,Iterable[tuple]],
+                   out_dir:str,workers:int=1,chunksize:int=1,
+                   prefetch:int=0,as_frame:bool=True
+                   ) -> Union[pd.DataFrame,List[dict]]:
+    """Renders the same track layout for many regions.
+
+    Regions are distributed across a pool of worker processes. Each worker
+    receives the layout once, opens the data sources given as paths only
+    once (see open_source), and moves a single GenomeBrowserFigure between
+    its regions. Failing regions are reported instead of stopping the
+    rendering.
+
+    Args:
+        layout (dict): Track layout, see draw_layout.
+        regions (Union[pd.DataFrame,Iterable[tuple]]): Regions in BED
+            format or an iterable of (chromosome, start, end) tuples.
+        out_dir (str): Output directory.
+        workers (int): Number of worker processes. If 1, then the regions
+            are rendered in the current process.
+        chunksize (int): Number of regions submitted to a worker at once.
+        prefetch (int): Number of regions whose data is fetched ahead
+            while rendering in the current process, see prefetch_regions.
+            The timings then exclude the fetching. Requires workers=1.
+        as_frame (bool): Return the results as a data frame, otherwise as
+            a list of dictionaries, which does not import pandas.
+
+    Returns:
+        Union[pd.DataFrame,List[dict]]: Output file, timing (seconds), and
+            error of each region.
+
+    """
+    if workers > 1 and prefetch > 0:
+        raise ValueError('prefetch requires workers=1')
+    regions = get_regions(regions)
+    os.makedirs(out_dir,exist_ok=True)
+
+    if workers == 1 and prefetch > 0:
+        figure = GenomeBrowserFigure(layout)
+        results = [_render_task(region,out_dir,figure,data)
+                   for region,data in prefetch_regions(figure,regions,
+                                                       prefetch)]
+    elif workers == 1:
+        figure = GenomeBrowserFigure(layout)
+        results = [_render_task(region,out_dir,figure)
+                   for region in regions]
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(layout,)) as executor:
+            results = list(executor.map(_render_task,regions,
+                                        [out_dir]*len(regions),
+                                        chunksize=chunksize))
+
+    failed = sum(result['error'] is not None for result in results)
+    if failed:
+        logging.warning('%d of %d regions failed',failed,len(results))
+
+    if not as_frame:
+        return results
+    import pandas as pd
+
+    return pd.DataFrame(results,columns=['chromosome','start','end',
+                                         'path','seconds','error'])
@@ -0,0 +1,255 @@
+"""Genome-wide scans of bigWig files in fixed-size windows."""
+import functools
+import heapq
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import pyBigWig
+
+from raesymatto.bigwig import BigWigSource
+from raesymatto.profiles import fetch_bins
+
+# maximum number of windows in a task
+CHUNK_SIZE = 1<<14
+
+# bigWig files opened by the current worker process, see _open
+_HANDLES = {}
+
+def get_windows(length:int,window:int,step:int,first:int=0,
+                last:Optional[int]=None) -> Tuple[np.ndarray,np.ndarray]:
+    """Returns the windows of a chromosome.
+
+    The windows start every step bases and the last window is clipped to
+    the end of the chromosome.
+
+    Args:
+        length (int): Length of the chromosome.
+        window (int): Length of a window.
+        step (int): Distance between the window starts.
+        first (int): Index of the first window returned.
+        last (Optional[int]): Index after the last window returned.
+            Defaults to the number of windows.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: Start and end coordinates.
+
+    """
+    n_windows = max(-(-(length-window)//step),0)+1 if length > 0 else 0
+    last = n_windows if last is None else min(last,n_windows)
+    starts = np.arange(first,max(last,first),dtype=np.int64)*step
+    return starts,np.minimum(starts+window,length)
+
+def mean_score(values:np.ndarray) -> np.ndarray:
+    """Scores windows by the mean over the samples.
+
+    Args:
+        values (np.ndarray): Window summaries (samples x windows).
+
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore',RuntimeWarning)
+        return np.nanmean(values,axis=0)
+
+def max_score(values:np.ndarray) -> np.ndarray:
+    """Scores windows by the maximum over the samples.
+
+    Args:
+        values (np.ndarray): Window summaries (samples x windows).
+
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore',RuntimeWarning)
+        return np.nanmax(values,axis=0)
+
+def log_fold_change(values:np.ndarray,first:Sequence[int],
+                    second:Sequence[int],pseudocount:float=1.0,
+                    absolute:bool=False) -> np.ndarray:
+    """Scores windows by the log2 fold change between two groups.
+
+    Args:
+        values (np.ndarray): Window summaries (samples x windows).
+        first (Sequence[int]): Samples of the first group.
+        second (Sequence[int]): Samples of the second group.
+        pseudocount (float): Pseudocount added to the group means.
+        absolute (bool): Score by the absolute fold change, i.e. find the
+            largest changes in either direction.
+
+    Returns:
+        np.ndarray: log2((mean of first+pseudocount)/(mean of
+            second+pseudocount)).
+
+    """
+    first_mean = mean_score(values[list(first)])
+    second_mean = mean_score(values[list(second)])
+    with np.errstate(invalid='ignore',divide='ignore'):
+        scores = (np.log2(first_mean+pseudocount)-
+                  np.log2(second_mean+pseudocount))
+    return np.abs(scores) if absolute else scores
+
+# score functions by name, see scan_windows
+SCORES = {'mean':mean_score,'max':max_score,
+          'log_fold_change':log_fold_change}
+
+def get_score_fn(score_fn:Union[str,Callable[[np.ndarray],np.ndarray]],
+                 groups:Optional[Tuple[Sequence[int],Sequence[int]]]=None,
+                 **kwargs) -> Callable[[np.ndarray],np.ndarray]:
+    """Returns a score function.
+
+    Args:
+        score_fn (Union[str,Callable[[np.ndarray],np.ndarray]]): Name of
+            a score function (see SCORES) or a function.
+        groups (Optional[Tuple[Sequence[int],Sequence[int]]]): Samples of
+            the two groups compared by log_fold_change.
+        kwargs: Additional arguments passed to the score function.
+
+    """
+    if callable(score_fn):
+        return functools.partial(score_fn,**kwargs) if kwargs else score_fn
+    if score_fn not in SCORES:
+        raise ValueError('Unknown score function: %s'%score_fn)
+    if score_fn == 'log_fold_change':
+        if groups is None:
+            raise ValueError('log_fold_change requires groups')
+        kwargs = {'first':list(groups[0]),'second':list(groups[1]),
+                  **kwargs}
+    return functools.partial(SCORES[score_fn],**kwargs)
+
+def _open(path:str) -> pyBigWig.pyBigWig:
+    """Returns a bigWig file opened by the current process."""
+    if path not in _HANDLES:
+        _HANDLES[path] = pyBigWig.open(path)
+    return _HANDLES[path]
+
+def _scan_task(bws:List[Union[str,pyBigWig.pyBigWig,BigWigSource]],
+               chromosome:str,length:int,first:int,last:int,window:int,
+               step:int,summary:str,
+               score_fn:Callable[[np.ndarray],np.ndarray],
+               top:Optional[int]) -> Tuple[np.ndarray,np.ndarray,
+                                           np.ndarray]:
+    """Scores windows and returns the top windows with a score."""
+    starts,ends = get_windows(length,window,step,first,last)
+    edges = np.column_stack((starts,ends))
+    values = np.vstack([fetch_bins(_open(bw) if isinstance(bw,str) else bw,
+                                   chromosome,edges,summary)[:,0]
+                        for bw in bws])
+    scores = np.asarray(score_fn(values),dtype=float)
+
+    keep = np.flatnonzero(~np.isnan(scores))
+    if top is not None and keep.shape[0] > top:
+        keep = keep[np.argpartition(-scores[keep],top-1)[:top]]
+    return starts[keep],ends[keep],scores[keep]
+
+def _merge_top(chromosomes:List[str],results:Iterable[tuple],
+               top:Optional[int]) -> List[Tuple[float,str,int,int]]:
+    """Keeps the top windows of the tasks in a bounded heap."""
+    heap = []
+    for chromosome,(starts,ends,scores) in zip(chromosomes,results):
+        for start,end,score in zip(starts,ends,scores):
+            item = (float(score),chromosome,int(start),int(end))
+            if top is None or len(heap) < top:
+                heapq.heappush(heap,item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap,item)
+    return heap
+
+def scan_windows(bws:List[Union[str,pyBigWig.pyBigWig,BigWigSource]],
+                 window:int=10000,step:Optional[int]=None,
+                 score_fn:Union[str,Callable[[np.ndarray],np.ndarray]]=
+                 'mean',top:Optional[int]=100,summary:str='mean',
+                 groups:Optional[Tuple[Sequence[int],Sequence[int]]]=None,
+                 chromosomes:Optional[List[str]]=None,
+                 workers:int=1) -> pd.DataFrame:
+    """Scans the chromosomes of bigWig files for the top-scoring windows.
+
+    Each chromosome is split into windows of window bases starting every
+    step bases, and each window is summarized in every bigWig file (see
+    raesymatto.profiles.fetch_bins). The score function maps the
+    summaries (samples x windows) to a score per window, e.g. mean_score,
+    max_score, or log_fold_change between groups of samples. Windows
+    whose score is NaN are skipped.
+
+    The windows are processed by chromosome and in chunks of CHUNK_SIZE
+    windows. With more than one worker, the chunks are processed on
+    a process pool, the bigWig files have to be given as paths, and the
+    score function has to be picklable (e.g. a module-level function or
+    a functools.partial of one). Only the top windows of each chunk are
+    returned to a bounded heap of the top windows.
+
+    Args:
+        bws (List[Union[str,pyBigWig.pyBigWig,BigWigSource]]): Paths of
+            bigWig files or bigWig objects.
+        window (int): Length of a window.
+        step (Optional[int]): Distance between the window starts.
+            Defaults to window.
+        score_fn (Union[str,Callable[[np.ndarray],np.ndarray]]): Name of
+            a score function (see SCORES) or a function.
+        top (Optional[int]): Number of windows returned. If None, then
+            all the windows are returned.
+        summary (str): Window summary; 'mean', 'max', or 'min'.
+        groups (Optional[Tuple[Sequence[int],Sequence[int]]]): Indices of
+            the bigWig files of the two groups compared by
+            log_fold_change.
+        chromosomes (Optional[List[str]]): Chromosomes scanned. Defaults
+            to the chromosomes of the first bigWig file.
+        workers (int): Number of worker processes.
+
+    Returns:
+        pd.DataFrame: Windows in BED format (chromosome, start, end,
+            score) sorted by the score in descending order, e.g. regions
+            of render_regions.
+
+    """
+    step = window if step is None else step
+    if window <= 0 or step <= 0:
+        raise ValueError('window and step have to be positive')
+    if summary not in ('mean','max','min'):
+        raise ValueError('Unknown summary: %s'%summary)
+    if top is not None and top <= 0:
+        raise ValueError('top has to be positive')
+    score_fn = get_score_fn(score_fn,groups)
+
+    if workers > 1 and not all(isinstance(bw,str) for bw in bws):
+        raise ValueError('bigWig files have to be given as paths '
+                         'when workers > 1')
+    opened = {bw:pyBigWig.open(bw) for bw in set(bws)
+              if isinstance(bw,str) and workers == 1}
+    bws = [opened.get(bw,bw) if isinstance(bw,str) else bw for bw in bws]
+
+    if isinstance(bws[0],str):
+        bw = pyBigWig.open(bws[0])
+        lengths = bw.chroms()
+        bw.close()
+    else:
+        lengths = bws[0].chroms()
+    if chromosomes is not None:
+        lengths = {chromosome:lengths[chromosome]
+                   for chromosome in chromosomes if chromosome in lengths}
+
+    tasks = []
+    for chromosome,length in lengths.items():
+        n_windows = get_windows(length,window,step)[0].shape[0]
+        for first in range(0,n_windows,CHUNK_SIZE):
+            tasks.append((chromosome,length,first,first+CHUNK_SIZE))
+
+    task = functools.partial(_scan_task,bws,window=window,step=step,
+                             summary=summary,score_fn=score_fn,top=top)
+    columns = [list(column) for column in zip(*tasks)] or [[]]*4
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                heap = _merge_top(columns[0],executor.map(task,*columns),
+                                  top)
+        else:
+            heap = _merge_top(columns[0],map(task,*columns),top)
+    finally:
+        for bw in opened.values():
+            bw.close()
+
+    return pd.DataFrame([(chromosome,start,end,score)
+                         for score,chromosome,start,end
+                         in sorted(heap,reverse=True)],
+                        columns=['chromosome','start','end','score'])
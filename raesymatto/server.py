@@ -0,0 +1,434 @@
+"""Local HTTP server of rendered track layout tiles."""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+import matplotlib as mpl
+
+from raesymatto import render
+
+# layouts, figures by layout name, and the size and modification time of
+# the files of the figures used by the current worker process,
+# see _init_tile_worker
+_LAYOUTS = None
+_FIGURES = {}
+_STATS = {}
+
+TILE_PATH = re.compile(r'^/tiles/([^/]+)/([^/]+)/(\d+)/(\d+)\.png$')
+NAME = re.compile(r'^[\w\-][\w.\-]*$')
+
+VIEWER = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>raesymatto</title>
+<style>
+body {font-family: sans-serif; font-size: 12px;}
+#tiles {white-space: nowrap; overflow: hidden;}
+#tiles img {display: inline-block;}
+</style>
+</head>
+<body>
+<form id="form">
+<select id="layout"></select>
+<input id="chromosome" value="chr1" size="8">
+<input id="position" value="1000000" size="12">
+zoom <input id="zoom" type="number" value="8" min="0" max="30">
+<button type="button" onclick="move(-1)">&larr;</button>
+<button type="button" onclick="move(1)">&rarr;</button>
+<button type="button" onclick="zoom(-1)">+</button>
+<button type="button" onclick="zoom(1)">&minus;</button>
+<button type="submit">go</button>
+</form>
+<div id="tiles"></div>
+<script>
+var TILE_WIDTH = %(tile_width)d, N_TILES = 3;
+function value(id) {return document.getElementById(id).value;}
+function span() {return TILE_WIDTH*Math.pow(2,parseInt(value('zoom')));}
+function show() {
+  var first = Math.max(Math.floor(parseInt(value('position'))/span())-1,0);
+  var tiles = document.getElementById('tiles');
+  tiles.innerHTML = '';
+  for (var i = first; i < first+N_TILES; i++) {
+    var img = document.createElement('img');
+    img.src = ['tiles',encodeURIComponent(value('layout')),
+               encodeURIComponent(value('chromosome')),value('zoom'),
+               i+'.png'].join('/');
+    tiles.appendChild(img);
+  }
+}
+function move(step) {
+  var position = document.getElementById('position');
+  position.value = Math.max(parseInt(position.value)+step*span(),0);
+  show();
+}
+function zoom(step) {
+  var zoom = document.getElementById('zoom');
+  zoom.value = Math.max(parseInt(zoom.value)+step,0);
+  show();
+}
+document.getElementById('form').onsubmit = function() {show(); return false;};
+fetch('layouts').then(function(r) {return r.json();}).then(function(names) {
+  var select = document.getElementById('layout');
+  names.forEach(function(name) {select.add(new Option(name,name));});
+  show();
+});
+</script>
+</body>
+</html>
+'''
+
+def get_tile_region(zoom:int,index:int,tile_width:int) -> Tuple[int,int]:
+    """Returns the start and end coordinates of a tile.
+
+    At zoom level zoom, a pixel spans 2**zoom base pairs.
+
+    Args:
+        zoom (int): Zoom level.
+        index (int): Tile index.
+        tile_width (int): Width of a tile in pixels.
+
+    """
+    span = tile_width<<zoom
+    return index*span,(index+1)*span
+
+def get_tile_layout(layout:dict,tile_width:int) -> dict:
+    """Returns a layout rendering tiles of tile_width pixels.
+
+    The axes span the whole tile so that adjacent tiles line up, unless
+    the layout has 'margins' of its own.
+
+    Args:
+        layout (dict): Track layout, see render.draw_layout.
+        tile_width (int): Width of a tile in pixels.
+
+    """
+    dpi = layout.get('dpi',100)
+    return dict(layout,dpi=dpi,
+                figsize=(tile_width/dpi,layout.get('figsize',(8,4))[1]),
+                margins=layout.get('margins',{'left':0,'right':1,
+                                              'bottom':0,'top':1,
+                                              'hspace':0.05}))
+
+def get_sources(layout:dict) -> List[str]:
+    """Returns the files used by a layout.
+
+    Args:
+        layout (dict): Track layout, see render.draw_layout.
+
+    """
+    paths = []
+    for track in layout['tracks']:
+        for layer in render.get_layers(track):
+            sources = layer.get('source')
+            if not isinstance(sources,list):
+                sources = [sources]
+            paths.extend(source for source in sources
+                         if isinstance(source,str))
+    return paths
+
+def get_version(layout:dict) -> str:
+    """Returns a version of a layout which changes with its files.
+
+    The version is the hash of the layout and of the size and modification
+    time of each file used by it.
+
+    Args:
+        layout (dict): Track layout, see render.draw_layout.
+
+    """
+    sha1 = hashlib.sha1(json.dumps(layout,sort_keys=True,
+                                   default=repr).encode())
+    for path in get_sources(layout):
+        stat = get_stat(path)
+        if stat is None:
+            # e.g. a URL
+            sha1.update(path.encode())
+        else:
+            sha1.update(('%s:%d:%d'%(os.path.abspath(path),
+                                     *stat)).encode())
+    return sha1.hexdigest()[:16]
+
+def get_stat(path:str) -> Optional[Tuple[int,int]]:
+    """Returns the size and modification time (ns) of a file, if any.
+
+    Args:
+        path (str): Path of the file.
+
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size,stat.st_mtime_ns
+
+def _init_tile_worker(layouts:Dict[str,dict]) -> None:
+    """Initializes a worker process."""
+    global _LAYOUTS
+    mpl.use('Agg')
+    _LAYOUTS = layouts
+
+def _render_tile(name:str,version:str,chromosome:str,start:int,end:int,
+                 tile_width:int) -> bytes:
+    """Renders a tile in a worker process."""
+    if name not in _FIGURES or _FIGURES[name][0] != version:
+        # reopen the files of the layout which have changed, the figures
+        # and the files of the other layouts are kept
+        stats = {path:get_stat(path) for path in get_sources(_LAYOUTS[name])}
+        render.close_sources([path for path,stat in stats.items()
+                              if path in _STATS and _STATS[path] != stat])
+        _STATS.update(stats)
+        _FIGURES[name] = (version,render.GenomeBrowserFigure(
+            get_tile_layout(_LAYOUTS[name],tile_width)))
+
+    buffer = io.BytesIO()
+    _FIGURES[name][1].update(chromosome,start,end).savefig(buffer,
+                                                           format='png')
+    return buffer.getvalue()
+
+class TileServer:
+    """Renders and caches tiles of track layouts.
+
+    A tile is identified by a layout name, chromosome, zoom level, and tile
+    index, see get_tile_region. Tiles are served from an in-memory LRU
+    cache bounded by memory_bytes, then from a tile pyramid on the disk
+    (cache_dir/layout/version/chromosome/zoom/index.png), and otherwise
+    rendered on a pool of worker processes. Concurrent requests of the same
+    tile wait for a single rendering.
+
+    The version of a layout changes with its files (see get_version), which
+    invalidates its cached tiles. The stale tiles are removed from the disk.
+
+    Args:
+        layouts (Dict[str,dict]): Track layouts by name. The data sources
+            have to be picklable, e.g. paths.
+        cache_dir (str): Directory of the tile pyramids.
+        workers (int): Number of worker processes.
+        memory_bytes (int): Maximum size of the in-memory cache in bytes.
+        tile_width (int): Width of a tile in pixels.
+
+    """
+    def __init__(self,layouts:Dict[str,dict],cache_dir:str,workers:int=2,
+                 memory_bytes:int=64*1024**2,tile_width:int=512) -> None:
+        """
+        """
+        self.layouts = layouts
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.tile_width = tile_width
+
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.nbytes = 0
+        self.pending = {}
+        self.versions = {}
+        self.stats = {'memory':0,'disk':0,'rendered':0}
+
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            initializer=_init_tile_worker,
+                                            initargs=(layouts,))
+
+    def __enter__(self) -> 'TileServer':
+        """
+        """
+        return self
+
+    def __exit__(self,*args) -> None:
+        """
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down the worker processes."""
+        self.executor.shutdown()
+
+    def _remember(self,key:tuple,data:bytes) -> None:
+        """Adds a tile to the in-memory cache."""
+        with self.lock:
+            if key in self.memory or len(data) > self.memory_bytes:
+                return
+            self.memory[key] = data
+            self.nbytes += len(data)
+            while self.nbytes > self.memory_bytes:
+                _,evicted = self.memory.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def _invalidate(self,name:str,version:str) -> None:
+        """Removes the tiles of other versions of a layout."""
+        with self.lock:
+            if self.versions.get(name) == version:
+                return
+            self.versions[name] = version
+            for key in [key for key in self.memory
+                        if key[0] == name and key[1] != version]:
+                self.nbytes -= len(self.memory.pop(key))
+
+        directory = os.path.join(self.cache_dir,name)
+        if os.path.isdir(directory):
+            for entry in os.listdir(directory):
+                if entry != version:
+                    logging.info('Removing stale tiles %s',
+                                 os.path.join(directory,entry))
+                    shutil.rmtree(os.path.join(directory,entry),
+                                  ignore_errors=True)
+
+    def get_tile(self,name:str,chromosome:str,zoom:int,index:int) -> bytes:
+        """Returns a tile as PNG data.
+
+        Args:
+            name (str): Layout name.
+            chromosome (str): Chromosome of interest.
+            zoom (int): Zoom level.
+            index (int): Tile index.
+
+        """
+        if name not in self.layouts:
+            raise KeyError('Unknown layout: %s'%name)
+        if not NAME.match(chromosome):
+            raise ValueError('Invalid chromosome: %s'%chromosome)
+
+        version = get_version(self.layouts[name])
+        self._invalidate(name,version)
+
+        key = (name,version,chromosome,zoom,index)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats['memory'] += 1
+                return self.memory[key]
+
+        path = os.path.join(self.cache_dir,name,version,chromosome,
+                            str(zoom),'%d.png'%index)
+        try:
+            with open(path,'rb') as f:
+                data = f.read()
+            with self.lock:
+                self.stats['disk'] += 1
+            self._remember(key,data)
+            return data
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            owner = key not in self.pending
+            if owner:
+                self.pending[key] = self.executor.submit(
+                    _render_tile,name,version,chromosome,
+                    *get_tile_region(zoom,index,self.tile_width),
+                    self.tile_width)
+            future = self.pending[key]
+
+        try:
+            data = future.result()
+        finally:
+            if owner:
+                with self.lock:
+                    del self.pending[key]
+        if owner:
+            with self.lock:
+                self.stats['rendered'] += 1
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+            tmp_path = '%s.tmp%d'%(path,threading.get_ident())
+            with open(tmp_path,'wb') as f:
+                f.write(data)
+            os.replace(tmp_path,path)
+            self._remember(key,data)
+        return data
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """Serves the viewer, the layout names, and the tiles."""
+    def do_GET(self) -> None:
+        """
+        """
+        path = urlparse(self.path).path
+        tiles = self.server.tiles
+
+        if path in ('/','/index.html'):
+            self.send_data((VIEWER%{'tile_width':tiles.tile_width}).encode(),
+                           'text/html; charset=utf-8')
+            return
+        if path == '/layouts':
+            self.send_data(json.dumps(sorted(tiles.layouts)).encode(),
+                           'application/json')
+            return
+
+        match = TILE_PATH.match(path)
+        if match is None:
+            self.send_error(404)
+            return
+        try:
+            data = tiles.get_tile(unquote(match.group(1)),
+                                  unquote(match.group(2)),
+                                  int(match.group(3)),int(match.group(4)))
+        except KeyError as e:
+            self.send_error(404,str(e))
+        except ValueError as e:
+            self.send_error(400,str(e))
+        except Exception as e:
+            logging.warning('Rendering %s failed: %s',path,e)
+            self.send_error(500,str(e))
+        else:
+            self.send_data(data,'image/png')
+
+    def send_data(self,data:bytes,content_type:str) -> None:
+        """Sends a response."""
+        self.send_response(200)
+        self.send_header('Content-Type',content_type)
+        self.send_header('Content-Length',str(len(data)))
+        self.send_header('Cache-Control','no-cache')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self,format:str,*args) -> None:
+        """
+        """
+        logging.debug(format,*args)
+
+def make_server(tiles:TileServer,host:str='127.0.0.1',
+                port:int=8000) -> ThreadingHTTPServer:
+    """Returns an HTTP server of tiles.
+
+    Args:
+        tiles (TileServer): Tile server.
+        host (str): Host name.
+        port (int): Port. If 0, then a free port is used.
+
+    """
+    server = ThreadingHTTPServer((host,port),TileRequestHandler)
+    server.daemon_threads = True
+    server.tiles = tiles
+    return server
+
+def serve(layouts:Dict[str,dict],cache_dir:str,host:str='127.0.0.1',
+          port:int=8000,**kwargs) -> None:
+    """Serves tiles of track layouts until interrupted.
+
+    The viewer is available at http://host:port/.
+
+    Args:
+        layouts (Dict[str,dict]): Track layouts by name.
+        cache_dir (str): Directory of the tile pyramids.
+        host (str): Host name.
+        port (int): Port.
+        kwargs: Additional arguments passed to TileServer.
+
+    """
+    with TileServer(layouts,cache_dir,**kwargs) as tiles:
+        server = make_server(tiles,host,port)
+        logging.info('Serving tiles at http://%s:%d/',*server.server_address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
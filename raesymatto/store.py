@@ -0,0 +1,243 @@
+"""Shared-memory storage of annotation indices."""
+import copy
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from raesymatto.genes import GeneModelIndex
+from raesymatto.intervals import BedIndex, BedpeIndex
+
+# shared memory blocks attached by the current process, see attach_array
+_ATTACHED = {}
+
+class SharedArray(np.ndarray):
+    """Read-only array backed by a shared memory block.
+
+    Pickling a SharedArray stores only the name of the block, and
+    unpickling attaches to the same block. Arrays derived from
+    a SharedArray (e.g. slices) are pickled as regular arrays.
+
+    """
+    def __array_finalize__(self,obj) -> None:
+        """
+        """
+        self.shared = None
+
+    def __reduce__(self):
+        """
+        """
+        if self.shared is None:
+            return np.asarray(self).__reduce__()
+        return (attach_array,self.shared)
+
+def attach_array(name:str,dtype:str,shape:Tuple[int,...]) -> SharedArray:
+    """Returns a read-only array backed by an existing shared memory block.
+
+    Args:
+        name (str): Name of the shared memory block.
+        dtype (str): Data type of the array.
+        shape (Tuple[int,...]): Shape of the array.
+
+    """
+    if name not in _ATTACHED:
+        _ATTACHED[name] = shared_memory.SharedMemory(name=name)
+
+    array = np.ndarray(shape,dtype=dtype,
+                       buffer=_ATTACHED[name].buf).view(SharedArray)
+    array.flags.writeable = False
+    array.shared = (name,dtype,shape)
+
+    return array
+
+class ColumnTable:
+    """Columnar table with dictionary-encoded string columns.
+
+    Numeric columns are stored as such, whereas other columns (e.g.
+    chromosomes and names) are stored as integer codes referring to
+    a fixed-width string array of categories. The rows are decoded only
+    when they are taken.
+
+    Args:
+        columns (Dict): Arrays (numeric columns) or tuples of codes and
+            categories (encoded columns) by column label.
+
+    """
+    def __init__(self,columns:Dict) -> None:
+        """
+        """
+        self.columns = columns
+
+    @classmethod
+    def from_dataframe(cls,df:pd.DataFrame) -> 'ColumnTable':
+        """Returns a table with the columns of a data frame.
+
+        Args:
+            df (pd.DataFrame): Data frame.
+
+        """
+        columns = {}
+        for label in df.columns:
+            values = df[label].to_numpy()
+            if (pd.api.types.is_numeric_dtype(df[label]) and
+                values.dtype != object):
+                columns[label] = np.ascontiguousarray(values)
+            else:
+                codes,categories = pd.factorize(df[label])
+                columns[label] = (codes.astype(np.int32),
+                                  np.asarray(categories,dtype=object)
+                                  .astype(str))
+        return cls(columns)
+
+    @property
+    def shape(self) -> Tuple[int,int]:
+        """Returns the number of rows and columns."""
+        if not self.columns:
+            return (0,0)
+        first = next(iter(self.columns.values()))
+        return (len(first[0] if isinstance(first,tuple) else first),
+                len(self.columns))
+
+    def __len__(self) -> int:
+        """Returns the number of rows."""
+        return self.shape[0]
+
+    def take(self,positions:np.ndarray) -> pd.DataFrame:
+        """Returns rows as a data frame.
+
+        Args:
+            positions (np.ndarray): Row positions.
+
+        """
+        data = {}
+        for label,column in self.columns.items():
+            if isinstance(column,tuple):
+                codes = column[0][positions]
+                values = column[1][np.maximum(codes,0)].astype(object)
+                values[codes < 0] = None
+                data[label] = values
+            else:
+                data[label] = column[positions]
+        return pd.DataFrame(data,columns=list(self.columns))
+
+# indices whose arrays can be stored outside of the process memory
+INDICES = (BedIndex,BedpeIndex,GeneModelIndex,ColumnTable)
+
+def map_arrays(value:Any,function:Callable[[np.ndarray],np.ndarray]) -> Any:
+    """Applies a function to the arrays of an index.
+
+    Indices are copied and their attributes are processed recursively.
+    Data frames are converted into column tables, extension arrays (e.g.
+    string columns) into arrays, and object arrays into fixed-width string
+    arrays, so that only plain arrays remain.
+
+    Args:
+        value (Any): Index or its attribute.
+        function (Callable[[np.ndarray],np.ndarray]): Function applied
+            to the arrays.
+
+    """
+    if isinstance(value,pd.api.extensions.ExtensionArray):
+        value = value.to_numpy()
+    if isinstance(value,np.ndarray):
+        if value.dtype == object:
+            value = value.astype(str)
+        return function(value)
+    if isinstance(value,pd.DataFrame):
+        return map_arrays(ColumnTable.from_dataframe(value),function)
+    if isinstance(value,INDICES):
+        mapped = copy.copy(value)
+        for attribute,item in vars(value).items():
+            setattr(mapped,attribute,map_arrays(item,function))
+        return mapped
+    if isinstance(value,dict):
+        return {key:map_arrays(item,function) for key,item in value.items()}
+    if isinstance(value,tuple):
+        return tuple(map_arrays(item,function) for item in value)
+    return value
+
+class AnnotationStore:
+    """Shared memory storage of annotation indices.
+
+    Indices added to the store are copied into shared memory once. The
+    returned read-only indices can be passed to the draw functions and to
+    worker processes: pickling sends only the names of the shared memory
+    blocks, so that all the processes share one physical copy. Data frames
+    are converted into dictionary-encoded column tables.
+
+    The store owns the shared memory blocks, which are released by close.
+
+    """
+    def __init__(self) -> None:
+        """
+        """
+        self.blocks = []
+
+    def __enter__(self) -> 'AnnotationStore':
+        """
+        """
+        return self
+
+    def __exit__(self,*args) -> None:
+        """
+        """
+        self.close()
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the size of the shared memory blocks in bytes."""
+        return sum(block.size for block in self.blocks)
+
+    def add_array(self,array:np.ndarray) -> SharedArray:
+        """Copies an array into shared memory.
+
+        Args:
+            array (np.ndarray): Array.
+
+        """
+        block = shared_memory.SharedMemory(create=True,
+                                           size=max(array.nbytes,1))
+        self.blocks.append(block)
+        _ATTACHED[block.name] = block
+        np.ndarray(array.shape,dtype=array.dtype,
+                   buffer=block.buf)[...] = array
+
+        return attach_array(block.name,array.dtype.str,array.shape)
+
+    def add(self,index:Union[pd.DataFrame,BedIndex,BedpeIndex,
+                             GeneModelIndex]
+            ) -> Union[BedIndex,BedpeIndex,GeneModelIndex]:
+        """Copies an index into shared memory.
+
+        Data frames are indexed as BED data, see BedIndex.
+
+        Args:
+            index (Union[pd.DataFrame,BedIndex,BedpeIndex,GeneModelIndex]):
+                Index or data in BED format.
+
+        Returns:
+            Union[BedIndex,BedpeIndex,GeneModelIndex]: Read-only index
+                backed by shared memory.
+
+        """
+        if isinstance(index,pd.DataFrame):
+            index = BedIndex(index)
+        # a bare column table cannot be queried by the draw functions
+        if isinstance(index,ColumnTable) or not isinstance(index,INDICES):
+            raise TypeError('Unsupported index: %s'%type(index).__name__)
+
+        return map_arrays(index,self.add_array)
+
+    def close(self) -> None:
+        """Releases the shared memory blocks."""
+        for block in self.blocks:
+            _ATTACHED.pop(block.name,None)
+            try:
+                block.close()
+            except BufferError:
+                # arrays still refer to the block, which is freed
+                # once they are garbage collected
+                pass
+            block.unlink()
+        self.blocks = []
@@ -0,0 +1,532 @@
+"""Region queries on block-gzipped and tabix-indexed files."""
+import gzip
+import os
+import re
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+# empty block marking the end of a BGZF file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003'
+                         '000000000000000000')
+
+# maximum uncompressed size of a BGZF block written by bgzip
+BGZF_BLOCK_SIZE = 0xff00
+
+# tabix presets: format, sequence, begin, and end columns (1-based)
+PRESETS = {'bed':(0x10000,1,2,3),
+           'gff':(0,1,4,5)}
+
+GTF_COLUMNS = ['seqname','source','feature','start','end',
+               'score','strand','frame']
+
+# numeric BED columns; start, end, score, thickStart, and thickEnd
+BED_NUMERIC_COLUMNS = (1,2,4,6,7)
+
+def reg2bin(start:int,end:int) -> int:
+    """Returns the bin of a 0-based half-open interval, see SAM spec."""
+    end -= 1
+    for shift,offset in ((14,4681),(17,585),(20,73),(23,9),(26,1)):
+        if start>>shift == end>>shift:
+            return offset+(start>>shift)
+    return 0
+
+def reg2bins(start:int,end:int) -> List[int]:
+    """Returns the bins overlapping a 0-based half-open interval."""
+    end -= 1
+    bins = [0]
+    for shift,offset in ((26,1),(23,9),(20,73),(17,585),(14,4681)):
+        bins.extend(range(offset+(start>>shift),offset+(end>>shift)+1))
+    return bins
+
+class BgzfReader:
+    """Reader of block-gzipped (BGZF) files.
+
+    Positions are virtual offsets, i.e. the offset of a compressed block
+    shifted left by 16 bits plus the offset within the uncompressed block.
+    Only the blocks needed are decompressed and the most recently used
+    blocks are kept in memory.
+
+    Args:
+        path (str): Path to a BGZF file.
+        cache_blocks (int): Number of decompressed blocks kept in memory.
+
+    """
+    def __init__(self,path:str,cache_blocks:int=16) -> None:
+        """
+        """
+        self.path = path
+        self.f = open(path,'rb')
+        self.cache_blocks = cache_blocks
+        self.blocks = OrderedDict()
+
+    def __enter__(self) -> 'BgzfReader':
+        """
+        """
+        return self
+
+    def __exit__(self,*args) -> None:
+        """
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Closes the file."""
+        self.f.close()
+        self.blocks.clear()
+
+    def block(self,coffset:int) -> Tuple[bytes,int]:
+        """Returns a decompressed block and the offset of the next block.
+
+        Args:
+            coffset (int): Offset of the compressed block.
+
+        """
+        if coffset in self.blocks:
+            self.blocks.move_to_end(coffset)
+            return self.blocks[coffset]
+
+        self.f.seek(coffset)
+        header = self.f.read(12)
+        if len(header) < 12:
+            return b'',coffset
+        if header[:4] != b'\x1f\x8b\x08\x04':
+            raise ValueError('%s is not a BGZF file'%self.path)
+        extra = self.f.read(struct.unpack('<H',header[10:12])[0])
+
+        # find the BC subfield storing the size of the block
+        bsize,position = None,0
+        while position+4 <= len(extra):
+            length = struct.unpack('<H',extra[position+2:position+4])[0]
+            if extra[position:position+2] == b'BC':
+                bsize = struct.unpack('<H',extra[position+4:
+                                                 position+6])[0]
+            position += 4+length
+        if bsize is None:
+            raise ValueError('%s is not a BGZF file'%self.path)
+
+        rest = self.f.read(bsize+1-12-len(extra))
+        data = zlib.decompress(rest[:-8],-15)
+
+        self.blocks[coffset] = (data,coffset+bsize+1)
+        if len(self.blocks) > self.cache_blocks:
+            self.blocks.popitem(last=False)
+        return self.blocks[coffset]
+
+    def lines(self,vstart:int=0,
+              vend:Optional[int]=None) -> Iterator[Tuple[int,int,bytes]]:
+        """Yields lines starting at a virtual offset.
+
+        Args:
+            vstart (int): Virtual offset of the first line.
+            vend (Optional[int]): Stop before the first line starting at
+                or after this virtual offset.
+
+        Yields:
+            Tuple[int,int,bytes]: Virtual offsets of the start and the end
+                of a line and the line without the newline.
+
+        """
+        coffset,position = vstart>>16,vstart&0xffff
+        pending,pending_start = b'',None
+
+        while True:
+            data,next_coffset = self.block(coffset)
+            if next_coffset == coffset:
+                break
+            while position < len(data):
+                line_start = (pending_start if pending_start is not None
+                              else coffset<<16|position)
+                if vend is not None and line_start >= vend:
+                    return
+                newline = data.find(b'\n',position)
+                if newline < 0:
+                    pending += data[position:]
+                    pending_start = line_start
+                    break
+                line_end = (coffset<<16|newline+1 if newline+1 < len(data)
+                            else next_coffset<<16)
+                yield line_start,line_end,pending+data[position:newline]
+                pending,pending_start = b'',None
+                position = newline+1
+            coffset,position = next_coffset,0
+
+        if pending and (vend is None or pending_start < vend):
+            yield pending_start,coffset<<16,pending
+
+class TabixIndex:
+    """Tabix (.tbi) index.
+
+    Args:
+        path (str): Path to a tabix index.
+
+    """
+    def __init__(self,path:str) -> None:
+        """
+        """
+        with gzip.open(path,'rb') as f:
+            data = f.read()
+
+        if data[:4] != b'TBI\x01':
+            raise ValueError('%s is not a tabix index'%path)
+        (n_ref,self.format,self.col_seq,self.col_beg,self.col_end,
+         meta,self.skip,l_nm) = struct.unpack('<8i',data[4:36])
+        self.meta = chr(meta).encode()
+        self.names = data[36:36+l_nm].split(b'\x00')[:n_ref]
+        self.names = [name.decode() for name in self.names]
+
+        position = 36+l_nm
+        self.bins = {}
+        self.linear = {}
+        for name in self.names:
+            n_bin = struct.unpack('<i',data[position:position+4])[0]
+            position += 4
+            bins = {}
+            for _ in range(n_bin):
+                bin_id,n_chunk = struct.unpack('<Ii',
+                                               data[position:position+8])
+                position += 8
+                chunks = struct.unpack('<%dQ'%(2*n_chunk),
+                                       data[position:position+16*n_chunk])
+                position += 16*n_chunk
+                bins[bin_id] = list(zip(chunks[::2],chunks[1::2]))
+            n_intv = struct.unpack('<i',data[position:position+4])[0]
+            position += 4
+            self.linear[name] = struct.unpack('<%dQ'%n_intv,
+                                              data[position:
+                                                   position+8*n_intv])
+            position += 8*n_intv
+            self.bins[name] = bins
+
+    def chunks(self,chromosome:str,start:int,end:int) -> List[Tuple[int,
+                                                                     int]]:
+        """Returns the chunks possibly containing records in the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate (0-based).
+            end (int): End coordinate (0-based, exclusive).
+
+        Returns:
+            List[Tuple[int,int]]: Sorted and merged virtual offset ranges.
+
+        """
+        if chromosome not in self.bins:
+            return []
+
+        linear = self.linear[chromosome]
+        min_offset = (linear[min(start>>14,len(linear)-1)]
+                      if len(linear) > 0 else 0)
+
+        chunks = sorted(chunk
+                        for bin_id in reg2bins(max(start,0),max(end,1))
+                        for chunk in self.bins[chromosome].get(bin_id,[])
+                        if chunk[1] > min_offset)
+
+        merged = []
+        for chunk_start,chunk_end in chunks:
+            chunk_start = max(chunk_start,min_offset)
+            if merged and chunk_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1],chunk_end)
+            else:
+                merged.append([chunk_start,chunk_end])
+        return [tuple(chunk) for chunk in merged]
+
+class TabixFile:
+    """Region queries on a block-gzipped and tabix-indexed file.
+
+    Only the blocks overlapping the region are decompressed, thus, the
+    memory use depends on the size of the region instead of the file.
+    No network access or external tools are needed.
+
+    Args:
+        path (str): Path to a block-gzipped and coordinate-sorted file.
+        index (Optional[str]): Path to the tabix index. Defaults to the
+            path with the suffix .tbi.
+
+    """
+    def __init__(self,path:str,index:Optional[str]=None) -> None:
+        """
+        """
+        self.path = path
+        self.index = TabixIndex(index if index is not None
+                                else path+'.tbi')
+        self.reader = BgzfReader(path)
+
+    def __enter__(self) -> 'TabixFile':
+        """
+        """
+        return self
+
+    def __exit__(self,*args) -> None:
+        """
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Closes the file."""
+        self.reader.close()
+
+    def fetch(self,chromosome:str,start:int,end:int) -> Iterator[List[str]]:
+        """Yields the records overlapping the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate (0-based).
+            end (int): End coordinate (0-based, exclusive).
+
+        Yields:
+            List[str]: Fields of a record.
+
+        """
+        index = self.index
+        one_based = not index.format&0x10000
+        for chunk_start,chunk_end in index.chunks(chromosome,start,end):
+            for _,_,line in self.reader.lines(chunk_start,chunk_end):
+                if not line or line.startswith(index.meta):
+                    continue
+                fields = line.decode().split('\t')
+                if fields[index.col_seq-1] != chromosome:
+                    continue
+                record_start = int(fields[index.col_beg-1])-one_based
+                record_end = (int(fields[index.col_end-1])
+                              if index.col_end > 0 else record_start+1)
+                if record_start >= end:
+                    break
+                if record_end > start:
+                    yield fields
+
+def to_numeric(df:pd.DataFrame,
+               columns:Tuple[int,...]=BED_NUMERIC_COLUMNS) -> pd.DataFrame:
+    """Converts the numeric columns of a data frame.
+
+    Only the given columns are converted, so that e.g. the chromosome
+    names 1, 2, ... stay strings.
+
+    Args:
+        df (pd.DataFrame): Data frame whose columns are strings.
+        columns (Tuple[int,...]): Columns converted if numeric.
+
+    """
+    for label in df.columns.intersection(columns):
+        try:
+            df[label] = pd.to_numeric(df[label])
+        except (ValueError,TypeError):
+            pass
+    return df
+
+class TabixBed:
+    """BED data read from a block-gzipped and tabix-indexed file.
+
+    Can be passed to draw_bed, draw_boxes, and draw_loops in place of the
+    BED DataFrame.
+
+    Args:
+        path (str): Path to a block-gzipped and coordinate-sorted BED file.
+        index (Optional[str]): Path to the tabix index. Defaults to the
+            path with the suffix .tbi.
+
+    """
+    def __init__(self,path:str,index:Optional[str]=None) -> None:
+        """
+        """
+        self.file = TabixFile(path,index)
+
+    def query(self,chromosome:str,start:int,end:int) -> pd.DataFrame:
+        """Returns intervals overlapping the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+
+        """
+        # closed intervals as in get_intervals
+        records = list(self.file.fetch(chromosome,start-1,end+1))
+        if not records:
+            return pd.DataFrame(columns=range(5))
+        return to_numeric(pd.DataFrame(records))
+
+def parse_gtf(records:List[List[str]]) -> pd.DataFrame:
+    """Returns GTF records as a data frame with attributes as columns.
+
+    Args:
+        records (List[List[str]]): Fields of GTF records.
+
+    """
+    rows = []
+    for fields in records:
+        row = dict(zip(GTF_COLUMNS,fields[:8]))
+        row.update(re.findall(r'(\S+)\s+"([^"]*)"',fields[8]))
+        rows.append(row)
+
+    genes = pd.DataFrame(rows)
+    for column in GTF_COLUMNS+['transcript_id']:
+        if column not in genes:
+            genes[column] = pd.Series(dtype=object)
+    genes['start'] = genes['start'].astype(int)
+    genes['end'] = genes['end'].astype(int)
+    return genes
+
+class TabixGenes:
+    """GTF data read from a block-gzipped and tabix-indexed file.
+
+    Can be passed to draw_gene_models in place of the GTF DataFrame. All the
+    records of the transcripts overlapping the region are read provided
+    that the file has transcript records spanning the transcripts, as GTF
+    files usually do. Otherwise, only the records overlapping the region
+    (widened by the records found) are read.
+
+    Args:
+        path (str): Path to a block-gzipped and coordinate-sorted GTF file.
+        index (Optional[str]): Path to the tabix index. Defaults to the
+            path with the suffix .tbi.
+
+    """
+    def __init__(self,path:str,index:Optional[str]=None) -> None:
+        """
+        """
+        self.file = TabixFile(path,index)
+
+    def query(self,chromosome:str,start:int,end:int) -> pd.DataFrame:
+        """Returns the records of the transcripts overlapping the region.
+
+        Args:
+            chromosome (str): Chromosome of interest.
+            start (int): Start coordinate.
+            end (int): End coordinate.
+
+        """
+        genes = parse_gtf(list(self.file.fetch(chromosome,start-1,end)))
+        transcript_ids = set(genes['transcript_id'].dropna())
+
+        # widen the region until it covers the transcripts
+        while transcript_ids:
+            spans = genes[genes['transcript_id'].isin(transcript_ids)]
+            span_start = min(spans['start'].min(),start)
+            span_end = max(spans['end'].max(),end)
+            if span_start >= start and span_end <= end:
+                break
+            start,end = span_start,span_end
+            genes = parse_gtf(list(self.file.fetch(chromosome,start-1,end)))
+
+        return genes[genes['transcript_id'].isin(transcript_ids)]
+
+def bgzip(path:str,output:Optional[str]=None,level:int=6) -> str:
+    """Compresses a file into the BGZF format.
+
+    Args:
+        path (str): Path to a file.
+        output (Optional[str]): Output file. Defaults to the path with the
+            suffix .gz.
+        level (int): Compression level.
+
+    Returns:
+        str: Output file.
+
+    """
+    if output is None:
+        output = path+'.gz'
+
+    with open(path,'rb') as f_in,open(output,'wb') as f_out:
+        while True:
+            data = f_in.read(BGZF_BLOCK_SIZE)
+            if not data:
+                break
+            compressor = zlib.compressobj(level,zlib.DEFLATED,-15)
+            cdata = compressor.compress(data)+compressor.flush()
+            f_out.write(struct.pack('<4BI2BH2BHH',0x1f,0x8b,8,4,0,0,0xff,6,
+                                    ord('B'),ord('C'),2,len(cdata)+25))
+            f_out.write(cdata)
+            f_out.write(struct.pack('<2I',zlib.crc32(data),len(data)))
+        f_out.write(BGZF_EOF)
+
+    return output
+
+def build_index(path:str,preset:str='bed',
+                output:Optional[str]=None) -> str:
+    """Builds a tabix index of a block-gzipped and coordinate-sorted file.
+
+    Args:
+        path (str): Path to a BGZF file, see bgzip.
+        preset (str): File format; 'bed' or 'gff' (also used for GTF).
+        output (Optional[str]): Output file. Defaults to the path with the
+            suffix .tbi.
+
+    Returns:
+        str: Output file.
+
+    """
+    if output is None:
+        output = path+'.tbi'
+    file_format,col_seq,col_beg,col_end = PRESETS[preset]
+    one_based = not file_format&0x10000
+
+    names = []
+    bins = {}
+    linear = {}
+    previous = None
+
+    with BgzfReader(path) as reader:
+        for line_start,line_end,line in reader.lines():
+            if (not line or line.startswith(b'#') or
+                line.startswith(b'track') or line.startswith(b'browser')):
+                continue
+            fields = line.decode().split('\t')
+            chromosome = fields[col_seq-1]
+            start = int(fields[col_beg-1])-one_based
+            end = int(fields[col_end-1])
+
+            if chromosome not in bins:
+                if chromosome in names:
+                    raise ValueError('%s is not sorted'%path)
+                names.append(chromosome)
+                bins[chromosome],linear[chromosome] = {},[]
+            elif start < previous:
+                raise ValueError('%s is not sorted'%path)
+            previous = start
+
+            chunks = bins[chromosome].setdefault(reg2bin(start,
+                                                         max(end,start+1)),
+                                                 [])
+            if chunks and chunks[-1][1] == line_start:
+                chunks[-1][1] = line_end
+            else:
+                chunks.append([line_start,line_end])
+
+            offsets = linear[chromosome]
+            last_window = (max(end,start+1)-1)>>14
+            if len(offsets) <= last_window:
+                offsets.extend([None]*(last_window+1-len(offsets)))
+            for window in range(start>>14,last_window+1):
+                if offsets[window] is None:
+                    offsets[window] = line_start
+
+    data = [b'TBI\x01',
+            struct.pack('<8i',len(names),file_format,col_seq,col_beg,
+                        col_end,ord('#'),0,
+                        len(b''.join(name.encode()+b'\x00'
+                                     for name in names)))]
+    data.extend(name.encode()+b'\x00' for name in names)
+    for name in names:
+        data.append(struct.pack('<i',len(bins[name])))
+        for bin_id,chunks in sorted(bins[name].items()):
+            data.append(struct.pack('<Ii',bin_id,len(chunks)))
+            data.extend(struct.pack('<2Q',*chunk) for chunk in chunks)
+        # windows without records point to the preceding records
+        offsets,previous_offset = [],0
+        for offset in linear[name]:
+            previous_offset = offset if offset is not None else previous_offset
+            offsets.append(previous_offset)
+        data.append(struct.pack('<i%dQ'%len(offsets),len(offsets),*offsets))
+
+    tmp = output+'.tmp%d'%os.getpid()
+    with open(tmp,'wb') as f:
+        f.write(b''.join(data))
+    bgzip(tmp,output)
+    os.remove(tmp)
+
+    return output
@@ -1,7 +1,21 @@
-"""Metric (SI) prefixes."""
+"""Metric (SI) prefixes and type checks."""
 import math
+import sys
 from typing import Optional
 
+def is_dataframe(obj) -> bool:
+    """Returns whether an object is a pandas DataFrame.
+
+    pandas is not imported, as an object cannot be a DataFrame unless
+    pandas has already been imported.
+
+    Args:
+        obj: Object to be checked.
+
+    """
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(obj,pd.DataFrame)
+
 class Units:
     """Provides an interface to metric prefixes.
 
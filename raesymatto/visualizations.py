@@ -1,21 +1,40 @@
-"""Visualization related functions."""
+"""Visualization related functions.
+
+pandas, pyBigWig, and the data modules are imported by the functions
+which need them, so that importing the module does not import them.
+"""
+from __future__ import annotations
+
 import logging
-from typing import Optional, Tuple
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
 import numpy as np
 import matplotlib as mpl
-import matplotlib.pyplot as plt
-import pandas as pd
-
-import pyBigWig
+import matplotlib.figure
 
+from raesymatto import profiling
 from raesymatto.utils import Units
 
-def hide_frame(ax:plt.Axes) -> None:
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyBigWig
+
+    from raesymatto.bigwig import BigWigSource
+    from raesymatto.genes import GeneModelIndex
+    from raesymatto.intervals import BedIndex, BedpeIndex
+
+# vector vertices and artists of a track above which its data is rasterized,
+# see rasterize_dense
+MAX_VERTICES = 50000
+MAX_ARTISTS = 1000
+
+def hide_frame(ax:mpl.axes.Axes) -> None:
     """Hides spines.
 
     Args:
-        ax (plt.Axes): Axes to be used.
+        ax (mpl.axes.Axes): Axes to be used.
 
     """
     ax.spines['right'].set_color('none')
@@ -23,13 +42,41 @@ def hide_frame(ax:plt.Axes) -> None:
     ax.spines['left'].set_color('none')
     ax.spines['bottom'].set_color('none')
 
-def draw_region_information(ax:plt.Axes,chromosome:str,
+def remove_replaced(artists:Optional[dict],drawn:dict) -> dict:
+    """Removes the artists of a previous call which were not reused.
+
+    Args:
+        artists (Optional[dict]): Artists of the previous call by role.
+        drawn (dict): Artists of the current call by role.
+
+    Returns:
+        dict: The drawn artists.
+
+    """
+    for role,artist in (artists or {}).items():
+        if drawn.get(role) is not artist:
+            artist.remove()
+    return drawn
+
+def get_region_label(chromosome:str,start:int,end:int) -> str:
+    """Returns the label of a region, e.g. chr1:1,000-2,000.
+
+    Args:
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+
+    """
+    return '%s:%s-%s'%(chromosome,'{:,d}'.format(start),'{:,d}'.format(end))
+
+@profiling.profiled
+def draw_region_information(ax:mpl.axes.Axes,chromosome:str,
                             start:int,end:int,fontsize:int=7,
                             kwargs:Optional[dict]=None) -> None:
     """Draws region information.
 
     Args:
-        ax (plt.Axes): Axes to be used.
+        ax (mpl.axes.Axes): Axes to be used.
         chromosome (str): Chromosome of interest.
         start (int): Start coordinate.
         end (int): End coordinate.
@@ -41,9 +88,7 @@ def draw_region_information(ax:plt.Axes,chromosome:str,
         kwargs = {'lw':0.25}
 
     # region text
-    ax.text((end+start)*0.5,2.5,'%s:%s-%s'%(chromosome,
-                                            '{:,d}'.format(start),
-                                            '{:,d}'.format(end)),
+    ax.text((end+start)*0.5,2.5,get_region_label(chromosome,start,end),
             va='center',ha='center',fontsize=fontsize)
 
     # scale bar with the tee arrow heads
@@ -80,19 +125,163 @@ def draw_region_information(ax:plt.Axes,chromosome:str,
 
     hide_frame(ax)
 
-def draw_bw(ax:plt.Axes,chromosome:str,start:int,end:int,
-            bw:pyBigWig.pyBigWig,ymin:Optional[float]=None,
+def get_pixel_width(ax:mpl.axes.Axes) -> int:
+    """Returns the width of axes in pixels.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+
+    """
+    return max(int(np.ceil(ax.get_window_extent().width)),1)
+
+def count_vertices(artist:mpl.artist.Artist,limit:Optional[int]=None) -> int:
+    """Returns the number of vertices of an artist.
+
+    Args:
+        artist (mpl.artist.Artist): Collection, patch, or line.
+        limit (Optional[int]): Stop counting once the count exceeds limit.
+
+    """
+    if isinstance(artist,mpl.collections.Collection):
+        count = 0
+        for path in artist.get_paths():
+            count += len(path.vertices)
+            if limit is not None and count > limit:
+                break
+        return count
+    if isinstance(artist,mpl.patches.Patch):
+        return len(artist.get_path().vertices)
+    if isinstance(artist,mpl.lines.Line2D):
+        return len(artist.get_xydata())
+    return 0
+
+def rasterize_dense(ax:mpl.axes.Axes,max_vertices:int=MAX_VERTICES,
+                    max_artists:int=MAX_ARTISTS) -> bool:
+    """Rasterizes the data of dense axes in vector exports.
+
+    The collections, patches, lines, and images of the axes are rasterized
+    if they have more than max_vertices vertices or there are more than
+    max_artists of them, so that the size of a PDF or SVG file does not
+    grow with the number of drawn features. The texts (e.g. gene names and
+    the region information), the axis, and the spines stay vector. The
+    rasterized data is drawn at the dpi given to Figure.savefig.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        max_vertices (int): Maximum number of vector vertices.
+        max_artists (int): Maximum number of vector artists.
+
+    Returns:
+        bool: Whether the data was rasterized.
+
+    """
+    artists = [*ax.collections,*ax.patches,*ax.lines,*ax.images]
+    dense = len(artists) > max_artists
+    vertices = 0
+    for artist in artists:
+        if dense:
+            break
+        vertices += count_vertices(artist,max_vertices-vertices)
+        dense = vertices > max_vertices
+
+    for artist in artists:
+        artist.set_rasterized(dense)
+    return dense
+
+def get_bw_bins(bw:Union[pyBigWig.pyBigWig,BigWigSource],chromosome:str,
+                start:int,end:int,nbins:int,
+                summary:str='max') -> Tuple[np.ndarray,np.ndarray]:
+    """Returns binned bigWig data using the zoom levels.
+
+    Bins without data are NaN. BigWigSource objects summarize the bins
+    from their cached tiles.
+
+    Args:
+        bw (Union[pyBigWig.pybigWig,BigWigSource]): bigWig object.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        nbins (int): Number of bins. Capped at the region length.
+        summary (str): 'max', 'mean', 'min', or 'minmax'.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: Bin edges (nbins+1) and the summaries
+            (nbins x 1, or nbins x 2 for 'minmax').
+
+    """
+    from raesymatto.bigwig import BigWigSource
+
+    if isinstance(bw,BigWigSource):
+        return bw.get_bins(chromosome,start,end,nbins,summary)
+
+    if summary not in ('max','mean','min','minmax'):
+        raise ValueError('Unknown summary: %s'%summary)
+
+    nbins = max(min(int(nbins),end-start),1)
+    edges = np.linspace(start,end,nbins+1)
+
+    types = ['min','max'] if summary == 'minmax' else [summary]
+    values = np.column_stack([np.array(bw.stats(chromosome,start,end,
+                                                type=stat_type,
+                                                nBins=nbins),
+                                       dtype=float)
+                              for stat_type in types])
+
+    return edges,values
+
+@profiling.profiled(phase='query')
+def fetch_bw(bw:Union[pyBigWig.pyBigWig,BigWigSource],chromosome:str,
+             start:int,end:int,skip:int=1,nbins:Optional[int]=None,
+             summary:str='max') -> Tuple[np.ndarray,np.ndarray]:
+    """Fetches bigWig data drawn by draw_bw.
+
+    Args:
+        bw (Union[pyBigWig.pybigWig,BigWigSource]): bigWig object.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        skip (int): Fetch every skip-th value.
+        nbins (Optional[int]): Number of bins, see get_bw_bins.
+        summary (str): Bin summary, see get_bw_bins.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: Positions and values (n x 1, or
+            n x 2 for 'minmax'). With bins, the positions are the bin edges
+            and the last value is repeated so that the last bin spans until
+            its end.
+
+    """
+    if nbins is None:
+        return (np.array(range(start,end))[::skip],
+                np.asarray(bw.values(chromosome,start,end),
+                           dtype=float)[::skip,None])
+
+    edges,values = get_bw_bins(bw,chromosome,start,end,nbins,summary)
+    return edges,np.vstack((values,values[-1:]))
+
+@profiling.profiled
+def draw_bw(ax:mpl.axes.Axes,chromosome:str,start:int,end:int,
+            bw:Union[pyBigWig.pyBigWig,BigWigSource],
+            ymin:Optional[float]=None,
             ymax:Optional[float]=None,xspine:Optional[float]=None,
             skip:int=1,fontsize:int=7,ylabel:Optional[str]=None,
-            label:Optional[str]=None,kwargs:Optional[dict]=None) -> None:
+            label:Optional[str]=None,nbins:Optional[Union[int,str]]=None,
+            summary:str='max',data:Optional[Tuple[np.ndarray,
+                                                  np.ndarray]]=None,
+            kwargs:Optional[dict]=None) -> None:
     """Draws bigWig data.
 
+    By default every base is fetched using bw.values. When nbins is given,
+    the region is summarized into nbins bins using the zoom levels of the
+    bigWig file (bw.stats), so that the cost depends on the figure width
+    instead of the region length and narrow peaks remain visible.
+
     Args:
-        ax (plt.Axes): Axes to be used.
+        ax (mpl.axes.Axes): Axes to be used.
         chromosome (str): Chromosome of interest.
         start (int): Start coordinate.
         end (int): End coordinate.
-        bw (pyBigWig.pybigWig): bigWig object.
+        bw (Union[pyBigWig.pybigWig,BigWigSource]): bigWig object.
         ymin (Optional[float]): Bottom of y axis.
         ymax (Optional[float]): Top of y axis.
         xspine (Optional[float]): Location for x spine.
@@ -100,6 +289,12 @@ def draw_bw(ax:plt.Axes,chromosome:str,start:int,end:int,
         fontsize (int): Font size.
         ylabel (Optional[str]): Y axis label.
         label (Optional[str]): Legend label.
+        nbins (Optional[Union[int,str]]): Number of bins. If 'auto', then
+            the width of the axes in pixels is used. Overrides skip.
+        summary (str): Bin summary when nbins is given; 'max', 'mean',
+            'min', or 'minmax' (the envelope between min and max).
+        data (Optional[Tuple[np.ndarray,np.ndarray]]): Data already
+            fetched using fetch_bw. If given, then bw is not read.
         kwargs (Optional[dict]): Additional arguments passed
             to Axes.fill_between.
 
@@ -109,9 +304,20 @@ def draw_bw(ax:plt.Axes,chromosome:str,start:int,end:int,
                   'alpha':1.0,
                   'lw':0.1}
 
-    ax.fill_between(x=np.array(range(start,end))[::skip],
-                    y1=bw.values(chromosome,start,end)[::skip],
-                    label=label,**kwargs)
+    if nbins == 'auto':
+        nbins = get_pixel_width(ax)
+    if data is None:
+        data = fetch_bw(bw,chromosome,start,end,skip,nbins,summary)
+    x,values = data
+    profiling.mark('query',x.shape[0])
+
+    step = 'post' if nbins is not None else None
+    if values.shape[1] == 2:
+        ax.fill_between(x=x,y1=values[:,0],y2=values[:,1],
+                        step=step,label=label,**kwargs)
+    else:
+        ax.fill_between(x=x,y1=values[:,0],
+                        step=step,label=label,**kwargs)
 
     ax.set_ylabel(ylabel,fontsize=fontsize)
 
@@ -126,22 +332,432 @@ def draw_bw(ax:plt.Axes,chromosome:str,start:int,end:int,
     if xspine is not None:
         ax.spines['bottom'].set_position(('data',xspine))
 
-def draw_bed(ax:plt.Axes,chromosome:str,start:int,end:int,
-             bed:pd.DataFrame,fontsize=7,label:Optional[str]=None,
+@profiling.profiled(phase='query')
+def fetch_bw_matrix(bws:List[Union[pyBigWig.pyBigWig,BigWigSource]],
+                    chromosome:str,start:int,end:int,nbins:int,
+                    summary:str='mean',workers:Optional[int]=None
+                    ) -> Tuple[np.ndarray,np.ndarray]:
+    """Fetches a matrix of binned bigWig data from many bigWig files.
+
+    The files are read concurrently on a thread pool using one binned
+    request (see get_bw_bins) per file. A bigWig object listed multiple
+    times is read once, so that raw pyBigWig objects are never shared
+    between threads.
+
+    Args:
+        bws (List[Union[pyBigWig.pybigWig,BigWigSource]]): bigWig objects.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        nbins (int): Number of bins. Capped at the region length.
+        summary (str): 'max', 'mean', or 'min'.
+        workers (Optional[int]): Number of threads. Defaults to the number
+            of bigWig objects.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: Bin edges and values (samples x bins,
+            float32).
+
+    """
+    if summary not in ('max','mean','min'):
+        raise ValueError('Unknown summary: %s'%summary)
+
+    unique = list({id(bw):bw for bw in bws}.values())
+    nbins = max(min(int(nbins),end-start),1)
+    edges = np.linspace(start,end,nbins+1)
+    matrix = np.full((len(bws),nbins),np.nan,dtype=np.float32)
+    if not unique:
+        return edges,matrix
+
+    def fetch(bw):
+        return get_bw_bins(bw,chromosome,start,end,nbins,summary)[1][:,0]
+
+    with ThreadPoolExecutor(max_workers=(workers if workers is not None
+                                         else len(unique))) as executor:
+        rows = dict(zip(map(id,unique),executor.map(fetch,unique)))
+    for idx,bw in enumerate(bws):
+        matrix[idx] = rows[id(bw)]
+
+    return edges,matrix
+
+def get_row_order(matrix:np.ndarray,order:Union[str,np.ndarray]
+                  ) -> np.ndarray:
+    """Returns the order of the rows of a matrix.
+
+    Args:
+        matrix (np.ndarray): Matrix.
+        order (Union[str,np.ndarray]): 'sum' or 'max' (sort the rows by
+            their sum or maximum in the descending order), 'cluster'
+            (order the rows using average-linkage hierarchical clustering
+            of the correlation distances, requires scipy, see the cluster
+            extra), or row positions.
+
+    """
+    if not isinstance(order,str):
+        return np.asarray(order,dtype=int)
+
+    values = np.nan_to_num(np.asarray(matrix,dtype=float))
+    if order == 'sum':
+        return np.argsort(-values.sum(axis=1),kind='stable')
+    if order == 'max':
+        return np.argsort(-values.max(axis=1,initial=-np.inf),
+                          kind='stable')
+    if order == 'cluster':
+        if values.shape[0] < 3:
+            return np.arange(values.shape[0])
+        try:
+            from scipy.cluster.hierarchy import leaves_list, linkage
+        except ImportError as error:
+            raise ImportError(('order=\'cluster\' requires scipy, install '
+                               'it using pip install raesymatto[cluster]')
+                              ) from error
+
+        with np.errstate(invalid='ignore',divide='ignore'):
+            distances = 1-np.corrcoef(values)
+        # rows without variation are uncorrelated with the others
+        distances = np.clip(np.nan_to_num(distances,nan=1.0),0,2)
+        return leaves_list(linkage(
+            distances[np.triu_indices(values.shape[0],1)],'average'))
+    raise ValueError('Unknown order: %s'%order)
+
+@profiling.profiled
+def draw_bw_heatmap(ax:mpl.axes.Axes,chromosome:str,start:int,end:int,
+                    bws:List[Union[pyBigWig.pyBigWig,BigWigSource]],
+                    nbins:Union[int,str]='auto',summary:str='mean',
+                    order:Optional[Union[str,np.ndarray]]=None,
+                    labels:Optional[List[str]]=None,cmap:str='viridis',
+                    vmin:Optional[float]=None,vmax:Optional[float]=None,
+                    fontsize:int=7,ylabel:Optional[str]=None,
+                    workers:Optional[int]=None,
+                    data:Optional[Tuple[np.ndarray,np.ndarray]]=None,
+                    kwargs:Optional[dict]=None) -> np.ndarray:
+    """Draws bigWig data of many samples as a heatmap.
+
+    Each row is a sample and each column is a bin. The binned data of all
+    the samples is fetched concurrently (see fetch_bw_matrix) and drawn
+    as a single image.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        chromosome (str): Chromosome of interest.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        bws (List[Union[pyBigWig.pybigWig,BigWigSource]]): bigWig objects.
+        nbins (Union[int,str]): Number of bins. If 'auto', then the width
+            of the axes in pixels is used.
+        summary (str): Bin summary; 'max', 'mean', or 'min'.
+        order (Optional[Union[str,np.ndarray]]): Order of the rows, see
+            get_row_order. Defaults to the order of bws.
+        labels (Optional[List[str]]): Sample labels drawn as y ticks.
+        cmap (str): Colormap.
+        vmin (Optional[float]): Minimum value of the colormap.
+        vmax (Optional[float]): Maximum value of the colormap.
+        fontsize (int): Font size.
+        ylabel (Optional[str]): Y axis label.
+        workers (Optional[int]): Number of threads, see fetch_bw_matrix.
+        data (Optional[Tuple[np.ndarray,np.ndarray]]): Data already
+            fetched using fetch_bw_matrix. If given, then bws are not read.
+        kwargs (Optional[dict]): Additional arguments passed
+            to Axes.imshow.
+
+    Returns:
+        np.ndarray: Order of the rows from the top to the bottom.
+
+    """
+    if kwargs is None:
+        kwargs = {'interpolation':'nearest'}
+
+    if nbins == 'auto':
+        nbins = get_pixel_width(ax)
+    if data is None:
+        data = fetch_bw_matrix(bws,chromosome,start,end,nbins,summary,
+                               workers)
+    edges,matrix = data
+    profiling.mark('query',matrix.size)
+
+    rows = (get_row_order(matrix,order) if order is not None
+            else np.arange(matrix.shape[0]))
+    profiling.mark('layout')
+
+    ax.imshow(matrix[rows],aspect='auto',cmap=cmap,vmin=vmin,vmax=vmax,
+              extent=(edges[0],edges[-1],rows.shape[0]-0.5,-0.5),
+              **kwargs)
+
+    ax.set_xlim(start,end)
+    ax.set_xticks([])
+    if labels is not None:
+        ax.set_yticks(np.arange(rows.shape[0]))
+        ax.set_yticklabels(np.asarray(labels)[rows],fontsize=fontsize)
+    else:
+        ax.set_yticks([])
+    ax.set_ylabel(ylabel,fontsize=fontsize)
+
+    return rows
+
+def set_profile_ticks(ax:mpl.axes.Axes,edges:np.ndarray,
+                      body_length:Optional[int]=None,
+                      reference_label:str='center',fontsize:int=7) -> None:
+    """Labels the x axis of a profile.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        edges (np.ndarray): Relative bin edges, see compute_matrix.
+        body_length (Optional[int]): Length of the scaled regions in the
+            scale-regions mode. Otherwise, the reference-point mode is
+            assumed.
+        reference_label (str): Label of the reference point.
+        fontsize (int): Font size.
+
+    """
+    units = Units(overrides={-2:{'multiplier':1e-0,'prefix':''},
+                             -1:{'multiplier':1e-0,'prefix':''},
+                             1:{'multiplier':1e-0,'prefix':''},
+                             2:{'multiplier':1e-0,'prefix':''}})
+
+    def format_distance(distance:float) -> str:
+        """Formats a distance using metric prefixes."""
+        multiplier,prefix = units.convert(distance)
+        return '%g %sb'%(multiplier,prefix)
+
+    if body_length is None:
+        ticks = [0]
+        labels = [reference_label]
+        right = 0
+    else:
+        ticks = [0,body_length]
+        labels = ['start','end']
+        right = body_length
+    if edges[0] < 0:
+        ticks.insert(0,edges[0])
+        labels.insert(0,format_distance(edges[0]))
+    if edges[-1] > right:
+        ticks.append(edges[-1])
+        labels.append(format_distance(edges[-1]-right))
+
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(labels,fontsize=fontsize)
+
+@profiling.profiled
+def draw_profile(ax:mpl.axes.Axes,matrix:np.ndarray,edges:np.ndarray,
+                 labels:Optional[List[str]]=None,average:str='mean',
+                 body_length:Optional[int]=None,
+                 reference_label:str='center',fontsize:int=7,
+                 ylabel:Optional[str]=None,
+                 kwargs:Optional[dict]=None) -> None:
+    """Draws the average signal around regions.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        matrix (np.ndarray): Binned signal (samples x regions x bins, or
+            regions x bins), see compute_matrix.
+        edges (np.ndarray): Relative bin edges, see compute_matrix.
+        labels (Optional[List[str]]): Legend labels of the samples.
+        average (str): 'mean' or 'median' over the regions. Missing
+            values are ignored.
+        body_length (Optional[int]): Length of the scaled regions in the
+            scale-regions mode, see set_profile_ticks.
+        reference_label (str): Label of the reference point.
+        fontsize (int): Font size.
+        ylabel (Optional[str]): Y axis label.
+        kwargs (Optional[dict]): Additional arguments passed to Axes.plot.
+
+    """
+    if kwargs is None:
+        kwargs = {'lw':1}
+
+    if average not in ('mean','median'):
+        raise ValueError('Unknown average: %s'%average)
+
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 2:
+        matrix = matrix[None]
+    if labels is None:
+        labels = [None]*matrix.shape[0]
+
+    centers = 0.5*(edges[:-1]+edges[1:])
+    with warnings.catch_warnings():
+        # bins without data in any of the regions
+        warnings.simplefilter('ignore',category=RuntimeWarning)
+        profiles = (np.nanmean(matrix,axis=1) if average == 'mean'
+                    else np.nanmedian(matrix,axis=1))
+    for profile,label in zip(profiles,labels):
+        ax.plot(centers,profile,label=label,**kwargs)
+
+    ax.set_xlim(edges[0],edges[-1])
+    set_profile_ticks(ax,edges,body_length,reference_label,fontsize)
+    ax.set_ylabel(ylabel,fontsize=fontsize)
+    ax.tick_params(axis='y',labelsize=fontsize)
+
+    ax.spines['right'].set_color('none')
+    ax.spines['top'].set_color('none')
+
+@profiling.profiled
+def draw_profile_heatmap(ax:mpl.axes.Axes,matrix:np.ndarray,edges:np.ndarray,
+                         order:Optional[Union[str,np.ndarray]]='sum',
+                         cmap:str='viridis',vmin:Optional[float]=None,
+                         vmax:Optional[float]=None,
+                         body_length:Optional[int]=None,
+                         reference_label:str='center',fontsize:int=7,
+                         ylabel:Optional[str]=None,
+                         kwargs:Optional[dict]=None) -> np.ndarray:
+    """Draws the signal around regions of a sample as a heatmap.
+
+    Each row is a region and the heatmap is drawn as a single image.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        matrix (np.ndarray): Binned signal of a sample (regions x bins),
+            see compute_matrix.
+        edges (np.ndarray): Relative bin edges, see compute_matrix.
+        order (Optional[Union[str,np.ndarray]]): Order of the rows, see
+            get_row_order. If None, then the order of the regions is kept.
+        cmap (str): Colormap.
+        vmin (Optional[float]): Minimum value of the colormap.
+        vmax (Optional[float]): Maximum value of the colormap.
+        body_length (Optional[int]): Length of the scaled regions in the
+            scale-regions mode, see set_profile_ticks.
+        reference_label (str): Label of the reference point.
+        fontsize (int): Font size.
+        ylabel (Optional[str]): Y axis label.
+        kwargs (Optional[dict]): Additional arguments passed
+            to Axes.imshow.
+
+    Returns:
+        np.ndarray: Order of the rows from the top to the bottom.
+
+    """
+    if kwargs is None:
+        kwargs = {}
+
+    rows = (get_row_order(matrix,order) if order is not None
+            else np.arange(matrix.shape[0]))
+
+    ax.imshow(matrix[rows],aspect='auto',cmap=cmap,vmin=vmin,vmax=vmax,
+              extent=(edges[0],edges[-1],rows.shape[0]-0.5,-0.5),
+              **kwargs)
+
+    set_profile_ticks(ax,edges,body_length,reference_label,fontsize)
+    ax.set_yticks([])
+    ax.set_ylabel(ylabel,fontsize=fontsize)
+
+    return rows
+
+def draw_rectangles(ax:mpl.axes.Axes,x:np.ndarray,y:np.ndarray,
+                    width:np.ndarray,height:np.ndarray,
+                    kwargs:Optional[dict]=None,
+                    collection:Optional[mpl.collections.PolyCollection]=None
+                    ) -> mpl.collections.PolyCollection:
+    """Draws rectangles as a single collection.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        x (np.ndarray): Left coordinates.
+        y (np.ndarray): Bottom coordinates.
+        width (np.ndarray): Widths.
+        height (np.ndarray): Heights.
+        kwargs (Optional[dict]): Additional arguments passed
+            to mpl.collections.PolyCollection. Colors can be given
+            per rectangle.
+        collection (Optional[mpl.collections.PolyCollection]): Collection
+            of the axes drawn earlier, which is updated in place.
+
+    """
+    if kwargs is None:
+        kwargs = {}
+
+    x,y,width,height = np.broadcast_arrays(*[np.asarray(value,dtype=float)
+                                             for value in (x,y,width,height)])
+    verts = np.stack([np.column_stack((x,y)),
+                      np.column_stack((x+width,y)),
+                      np.column_stack((x+width,y+height)),
+                      np.column_stack((x,y+height))],axis=1)
+
+    if collection is None:
+        collection = mpl.collections.PolyCollection(verts,**kwargs)
+        ax.add_collection(collection)
+    else:
+        collection.set_verts(verts)
+        collection.set(**kwargs)
+
+    return collection
+
+def draw_interval_density(ax:mpl.axes.Axes,start:int,end:int,
+                          starts:np.ndarray,ends:np.ndarray,
+                          scores:Optional[np.ndarray]=None,
+                          summary:str='coverage',
+                          kwargs:Optional[dict]=None,
+                          collection:Optional[mpl.collections.PolyCollection]
+                          =None
+                          ) -> Tuple[np.ndarray,
+                                     mpl.collections.PolyCollection]:
+    """Draws the density of intervals as a single filled profile.
+
+    The intervals are summarized in a bin per pixel, see bin_intervals.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        start (int): Start coordinate.
+        end (int): End coordinate.
+        starts (np.ndarray): Start coordinates of the intervals.
+        ends (np.ndarray): End coordinates of the intervals.
+        scores (Optional[np.ndarray]): Scores of the intervals.
+        summary (str): 'coverage', 'sum', or 'max'.
+        kwargs (Optional[dict]): Additional arguments passed
+            to Axes.fill_between.
+        collection (Optional[mpl.collections.PolyCollection]): Profile of
+            the axes drawn earlier, which is updated in place if supported
+            by matplotlib (Axes.fill_between returns a collection with
+            a set_data method). Otherwise, a new profile is drawn.
+
+    Returns:
+        Tuple[np.ndarray,mpl.collections.PolyCollection]: Summary of each
+            bin and the filled profile.
+
+    """
+    from raesymatto.intervals import bin_intervals
+
+    if kwargs is None:
+        kwargs = {}
+
+    edges = np.linspace(start,end,get_pixel_width(ax)+1)
+    values = bin_intervals(starts,ends,edges,scores,summary)
+    profiling.mark('layout')
+
+    if collection is not None and hasattr(collection,'set_data'):
+        collection.set_data(edges,np.append(values,values[-1]),0)
+        collection.set(**kwargs)
+    else:
+        collection = ax.fill_between(edges,np.append(values,values[-1]),
+                                     step='post',**kwargs)
+    return values,collection
+
+@profiling.profiled
+def draw_bed(ax:mpl.axes.Axes,chromosome:str,start:int,end:int,
+             bed:Union[pd.DataFrame,BedIndex],fontsize=7,
+             label:Optional[str]=None,
              frame:bool=True,scores:bool=False,cmap:str='Greys',
              vmin:Optional[float]=None,vmax:Optional[float]=None,
-             spacing:int=1,kwargs:Optional[dict]=None) -> None:
+             spacing:int=1,max_rows:Optional[int]=None,
+             kwargs:Optional[dict]=None,mode:str='auto',
+             density_threshold:int=10000,
+             summary:str='coverage',
+             artists:Optional[dict]=None) -> dict:
     """Draws genomics regions defined using the BED format.
 
     Score defines the color. Does not take into account strand
-    information at the moment.
+    information at the moment. In the density mode, the regions are
+    summarized in a bin per pixel and drawn as a single filled profile
+    instead of being stacked into rows.
 
     Args:
-        ax (plt.Axes): Axes to be used.
+        ax (mpl.axes.Axes): Axes to be used.
         chromosome (str): Chromosome of interest.
         start (int): Start coordinate.
         end (int): End coordinate.
-        bed (pd.DataFrame): Data in Browser Extensible Data (BED) format.
+        bed (Union[pd.DataFrame,BedIndex]): Data in Browser Extensible
+            Data (BED) format or an index built from it. Other sources
+            with a query method, e.g. raesymatto.tabix.TabixBed, are also
+            accepted.
         fontsize (int): Font size.
         label (Optional[str]): Y axis label.
         frame (bool): Draw spines.
@@ -150,43 +766,69 @@ def draw_bed(ax:plt.Axes,chromosome:str,start:int,end:int,
         vmin (Optional[float]): Minimum score.
         vmax (Optional[float]): Maximum score.
         spacing (int): Spacing between rows of elements.
+        max_rows (Optional[int]): Maximum number of rows. Overflowing
+            elements are collapsed into the last row.
         kwargs (Optional[dict]): Additional arguments passed
-            to mpl.patches.Rectangle.
+            to mpl.collections.PolyCollection.
+        mode (str): 'full' (a rectangle per region), 'density', or 'auto'
+            (density above density_threshold regions).
+        density_threshold (int): Number of regions above which the auto
+            mode draws the density.
+        summary (str): Density summary; 'coverage' (number of regions
+            overlapping a pixel), 'sum', or 'max' of the scores.
+        artists (Optional[dict]): Artists returned by a previous call with
+            the same options on the same axes. They are updated in place
+            where possible and removed otherwise.
+
+    Returns:
+        dict: Drawn artists by role; 'rectangles' or 'density'.
 
     """
+    from raesymatto.intervals import get_intervals, pack_intervals
+
+    previous = artists or {}
+
     if kwargs is None:
         kwargs = {'facecolor':'gray',
                   'edgecolor':'gray',
                   'alpha':1.0,
                   'lw':0.0}
 
-    def distribute_intervals(intervals):
-        levels = []
-        for interval_idx in range(0,intervals.shape[0]):
-            found_place = False
-            for level_idx in range(0,len(levels)):
-                if levels[level_idx][-1][2] < intervals[interval_idx][1]:
-                    levels[level_idx].append(intervals[interval_idx])
-                    found_place = True
-                    break
-            if not found_place:
-                levels.append([intervals[interval_idx]])
-        return levels
-
-    intervals = (bed[(bed.iloc[:,0] == chromosome) &
-                     (((bed.iloc[:,1] >= start) &
-                       (bed.iloc[:,1] <= end)) |
-                     ((bed.iloc[:,2] >= start) &
-                      (bed.iloc[:,2] <= end)) |
-                     ((start >= bed.iloc[:,[1,2]].min(axis=1)) &
-                      (end <= bed.iloc[:,[1,2]].max(axis=1))))].values)
+    intervals = get_intervals(bed,chromosome,start,end).values
+    profiling.mark('query',intervals.shape[0])
+
+    if mode == 'auto':
+        mode = ('density' if intervals.shape[0] > density_threshold
+                else 'full')
+    if mode not in ('full','density'):
+        raise ValueError('Unknown mode: %s'%mode)
+
+    if mode == 'density':
+        values,profile = draw_interval_density(
+            ax,start,end,intervals[:,1],intervals[:,2],
+            intervals[:,4] if summary != 'coverage' else None,summary,
+            kwargs,previous.get('density'))
+
+        ax.set_ylabel(label,fontsize=fontsize)
+
+        ax.set_xlim(start,end)
+        if summary == 'coverage':
+            ax.set_ylim(0,max(values.max(),1))
+        ax.set_xticks([])
+        ax.set_yticks([])
+
+        if not frame:
+            hide_frame(ax)
+        return remove_replaced(artists,{'density':profile})
 
     if intervals.shape[0] > 0:
         intervals = intervals[np.lexsort((-(intervals[:,2]-
                                             intervals[:,1]),
                                           intervals[:,1])),:]
 
-    levels = distribute_intervals(intervals)
+    rows = pack_intervals(intervals[:,1],intervals[:,2],max_rows)
+    n_rows = rows.max()+1 if intervals.shape[0] > 0 else 0
+    profiling.mark('layout')
 
     if intervals.shape[0] > 0 and scores:
         if vmin is None:
@@ -195,7 +837,7 @@ def draw_bed(ax:plt.Axes,chromosome:str,start:int,end:int,
             vmax = intervals[:,4].max()
 
         norm = mpl.colors.Normalize(vmin=vmin,vmax=vmax)
-        color = mpl.cm.get_cmap(cmap)
+        color = mpl.colormaps[cmap]
 
         # if score == True, then user-specified facecolor
         # or fc should not be used
@@ -205,25 +847,19 @@ def draw_bed(ax:plt.Axes,chromosome:str,start:int,end:int,
             kwargs.pop('facecolor',None)
             kwargs.pop('fc',None)
 
-    for idx,level in enumerate(levels):
-        for region in level:
-            if not scores:
-                rect = mpl.patches.Rectangle(xy=(region[1],spacing*idx-0.25),
-                                             width=region[2]-region[1],
-                                             height=0.5,**kwargs)
-            else:
-                # get the color of the current region
-                kwargs['facecolor'] = color(norm(region[4]))
-                rect = mpl.patches.Rectangle(xy=(region[1],spacing*idx-0.25),
-                                             width=region[2]-region[1],
-                                             height=0.5,
-                                             **kwargs)
-            ax.add_patch(rect)
-
-    if len(levels) > 0:
-        ax.set_ylim(-0.5,spacing*(len(levels)-1)+0.5)
+        # get the colors of the regions
+        kwargs = {**kwargs,
+                  'facecolor':color(norm(intervals[:,4].astype(float)))}
+
+    rectangles = draw_rectangles(ax,intervals[:,1],spacing*rows-0.25,
+                                 intervals[:,2]-intervals[:,1],0.5,kwargs,
+                                 previous.get('rectangles'))
+
+    if n_rows > 0:
+        ax.set_ylim(-0.5,spacing*(n_rows-1)+0.5)
     else:
         logging.warning('No regions found!')
+        ax.set_ylim(-0.5,0.5)
 
     ax.set_ylabel(label,fontsize=fontsize)
 
@@ -234,54 +870,77 @@ def draw_bed(ax:plt.Axes,chromosome:str,start:int,end:int,
 
     if not frame:
         hide_frame(ax)
+    return remove_replaced(artists,{'rectangles':rectangles})
 
-def draw_boxes(ax:plt.Axes,chromosome:str,start:int,end:int,
-               bed:pd.DataFrame,fontsize:int=7,
+@profiling.profiled
+def draw_boxes(ax:mpl.axes.Axes,chromosome:str,start:int,end:int,
+               bed:Union[pd.DataFrame,BedIndex],fontsize:int=7,
                ylabel:Optional[dict]=None,vmin:Optional[float]=None,
-               vmax:Optional[float]=None,kwargs:Optional[dict]=None) -> None:
+               vmax:Optional[float]=None,kwargs:Optional[dict]=None,
+               mode:str='auto',density_threshold:int=10000,
+               summary:str='max') -> None:
     """Draws genomics regions defined using the BED format.
 
     Score defines the height. Does not take into account strand
-    information at the moment.
+    information at the moment. In the density mode, the regions are
+    summarized in a bin per pixel and drawn as a single filled profile.
 
     Args:
-        ax (plt.Axes): Axes to be used.
+        ax (mpl.axes.Axes): Axes to be used.
         chromosome (str): Chromosome of interest.
         start (int): Start coordinate.
         end (int): End coordinate.
-        bed (pd.DataFrame): Data in Browser Extensible Data (BED) format.
+        bed (Union[pd.DataFrame,BedIndex]): Data in Browser Extensible
+            Data (BED) format or an index built from it. Other sources
+            with a query method, e.g. raesymatto.tabix.TabixBed, are also
+            accepted.
         fontsize (int): Font size.
         ylabel (Optional[str]): Y axis label.
         vmin (Optional[float]): Minimum score.
         vmax (Optional[float]): Maximum score.
         kwargs (Optional[dict]): Additional arguments passed
-            to mpl.patches.Rectangle.
+            to mpl.collections.PolyCollection.
+        mode (str): 'full' (a box per region), 'density', or 'auto'
+            (density above density_threshold regions).
+        density_threshold (int): Number of regions above which the auto
+            mode draws the density.
+        summary (str): Density summary; 'max' or 'sum' of the scores, or
+            'coverage' (number of regions overlapping a pixel).
 
     """
+    from raesymatto.intervals import get_intervals
+
     if kwargs is None:
         kwargs = {'facecolor':'gray',
                   'edgecolor':'gray',
                   'alpha':1.0,
                   'lw':0.0}
 
-    intervals = (bed[(bed.iloc[:,0] == chromosome) &
-                     (((bed.iloc[:,1] >= start) &
-                       (bed.iloc[:,1] <= end)) |
-                      ((bed.iloc[:,2] >= start) &
-                       (bed.iloc[:,2] <= end)) |
-                      ((start >= bed.iloc[:,[1,2]].min(axis=1)) &
-                       (end <= bed.iloc[:,[1,2]].max(axis=1))))])
-
-    for _,interval in intervals.iterrows():
-        rect = mpl.patches.Rectangle(xy=(interval.iloc[1],0),
-                                     width=(interval.iloc[2]-
-                                            interval.iloc[1]),
-                                     height=interval.iloc[4],
-                                     **kwargs)
-        ax.add_patch(rect)
+    intervals = get_intervals(bed,chromosome,start,end)
+    profiling.mark('query',intervals.shape[0])
+
+    if mode == 'auto':
+        mode = ('density' if intervals.shape[0] > density_threshold
+                else 'full')
+    if mode not in ('full','density'):
+        raise ValueError('Unknown mode: %s'%mode)
+
+    if mode == 'density':
+        values,_ = draw_interval_density(
+            ax,start,end,intervals.iloc[:,1].values,
+            intervals.iloc[:,2].values,
+            intervals.iloc[:,4].values if summary != 'coverage' else None,
+            summary,kwargs)
+        if np.nanmax(values,initial=0) > 0:
+            ax.set_ylim(bottom=0,top=np.nanmax(values,initial=0))
+    else:
+        draw_rectangles(ax,intervals.iloc[:,1].values,0,
+                        intervals.iloc[:,2].values-
+                        intervals.iloc[:,1].values,
+                        intervals.iloc[:,4].values,kwargs)
 
-    if intervals.shape[0] > 0:
-        ax.set_ylim(bottom=0,top=intervals.iloc[:,4].max())
+        if intervals.shape[0] > 0:
+            ax.set_ylim(bottom=0,top=intervals.iloc[:,4].max())
 
     ax.set_ylabel(ylabel,fontsize=fontsize)
 
@@ -292,19 +951,31 @@ def draw_boxes(ax:plt.Axes,chromosome:str,start:int,end:int,
     ax.spines['right'].set_color('none')
     ax.spines['top'].set_color('none')
 
-def draw_loops(ax:plt.Axes,chromosome:str,start:int,end:int,
-               bed:pd.DataFrame,fontsize:int=7,
+@profiling.profiled
+def draw_loops(ax:mpl.axes.Axes,chromosome:str,start:int,end:int,
+               bed:Union[pd.DataFrame,BedIndex,BedpeIndex],fontsize:int=7,
                ymin:float=1,ymax:float=10,flip:bool=False,
                frame:bool=True,ylabel:Optional[str]=None,
-               kwargs:Optional[dict]=None) -> None:
+               kwargs:Optional[dict]=None,anchors:str='any',
+               score:Optional[Union[int,str]]=None,top:Optional[int]=None,
+               min_length:float=0) -> None:
     """Draws loops.
 
+    Loops are given either as BED intervals from the start to the end of
+    each loop, or as BEDPE pairs (BedpeIndex) whose arcs join the centers
+    of the anchors. Interchromosomal pairs are not drawn. The height of
+    an arc is proportional to its length, or to its score if score is
+    given. Drawing only the top loops bounds the cost in wide windows.
+
     Args:
-        ax (plt.Axes): Axes to be used.
+        ax (mpl.axes.Axes): Axes to be used.
         chromosome (str): Chromosome of interest.
         start (int): Start coordinate.
         end (int): End coordinate.
-        bed (pd.DataFrame): Data in Browser Extensible Data (BED) format.
+        bed (Union[pd.DataFrame,BedIndex,BedpeIndex]): Data in Browser
+            Extensible Data (BED) format or an index built from it, or an
+            index of BEDPE data. Other sources with a query method, e.g.
+            raesymatto.tabix.TabixBed, are also accepted.
         fontsize: Font size.
         ymin (float): Minimum loop height.
         ymax (float): Maximum loop height.
@@ -313,38 +984,78 @@ def draw_loops(ax:plt.Axes,chromosome:str,start:int,end:int,
         ylabel (Optional[str]): Y axis label.
         kwargs (Optional[dict]): Additional arguments passed
             to mpl.patches.PathPatch.
+        anchors (str): BEDPE pairs drawn; 'any' (either anchor in the
+            region), 'both', or 'span', see BedpeIndex.query_positions.
+        score (Optional[Union[int,str]]): Column (position or label) of
+            the scores. Loops without a numeric score are not drawn.
+        top (Optional[int]): Maximum number of loops. The loops with the
+            highest scores, or the longest loops without scores, are drawn.
+        min_length (float): Minimum loop length.
 
     """
+    import pandas as pd
+
+    from raesymatto.intervals import BedpeIndex, get_intervals
+
     if kwargs is None:
         kwargs = {'lw':0.5,
                   'ec':'red',
                   'fc': 'none',
                   'alpha':1.0}
 
-    intervals = bed[(bed.iloc[:,0] == chromosome) &
-                    (((bed.iloc[:,1] >= start) &
-                      (bed.iloc[:,1] <= end)) |
-                     ((bed.iloc[:,2] >= start) &
-                      (bed.iloc[:,2] <= end)) |
-                     ((start >= bed.iloc[:,[1,2]].min(axis=1)) &
-                      (end <= bed.iloc[:,[1,2]].max(axis=1))))].values
-
-    length_max = (intervals[:,2]-intervals[:,1]).max()
-
-    Path = mpl.path.Path
-    for interval in intervals:
-        pp = (mpl.patches
-              .PathPatch(Path([(interval[1],0),
-                               ((interval[1]+interval[2])/2,
-                                max([ymin,2.0*ymax*
-                                     (interval[2]-interval[1])/
-                                     length_max])),
-                               (interval[2],0)],[Path.MOVETO,
-                                                 Path.CURVE3,
-                                                 Path.CURVE3]),
-                         transform=ax.transData,
-                         **kwargs))
-        ax.add_patch(pp)
+    if isinstance(bed,BedpeIndex):
+        loops = bed.query(chromosome,start,end,anchors)
+        loops = loops[loops.iloc[:,0].values == loops.iloc[:,3].values]
+        centers = [0.5*(loops.iloc[:,column].values.astype(float)+
+                        loops.iloc[:,column+1].values.astype(float))
+                   for column in (1,4)]
+        loop_start = np.minimum(*centers)
+        loop_end = np.maximum(*centers)
+    else:
+        loops = get_intervals(bed,chromosome,start,end)
+        loop_start = loops.iloc[:,1].values.astype(float)
+        loop_end = loops.iloc[:,2].values.astype(float)
+    profiling.mark('query',loops.shape[0])
+
+    values = loop_end-loop_start
+    selected = values >= min_length
+    if score is not None:
+        values = pd.to_numeric(loops[score] if isinstance(score,str)
+                               else loops.iloc[:,score],
+                               errors='coerce').values.astype(float)
+        selected &= ~np.isnan(values)
+    selected = np.flatnonzero(selected)
+    if top is not None and selected.shape[0] > max(top,0):
+        # the top loops in linear time
+        selected = (selected[np.argpartition(-values[selected],
+                                             top-1)[:top]]
+                    if top > 0 else selected[:0])
+    loop_start = loop_start[selected]
+    loop_end = loop_end[selected]
+    values = values[selected]
+    profiling.mark('layout')
+
+    if selected.shape[0] > 0:
+        value_max = values.max()
+        heights = (np.maximum(ymin,2.0*ymax*values/value_max)
+                   if value_max > 0 else np.full(values.shape[0],ymin))
+
+        # all the loops as a single compound path of quadratic curves
+        vertices = np.stack([np.column_stack((loop_start,
+                                              np.zeros_like(loop_start))),
+                             np.column_stack(((loop_start+loop_end)/2,
+                                              heights)),
+                             np.column_stack((loop_end,
+                                              np.zeros_like(loop_end)))],
+                            axis=1).reshape(-1,2)
+        Path = mpl.path.Path
+        codes = np.tile([Path.MOVETO,Path.CURVE3,Path.CURVE3],
+                        selected.shape[0])
+        # the limits are set below, add_patch would compute the extents
+        # of the curves one by one
+        ax.add_artist(mpl.patches.PathPatch(Path(vertices,codes),
+                                            transform=ax.transData,
+                                            **kwargs))
 
     ax.set_ylabel(ylabel,fontsize=fontsize)
 
@@ -359,19 +1070,204 @@ def draw_loops(ax:plt.Axes,chromosome:str,start:int,end:int,
     if not frame:
         hide_frame(ax)
 
-def draw_gene_models(ax:plt.Axes,chromosome:str,start:int,end:int,
-                     genes:pd.DataFrame,min_height:int=None,
+def draw_strand_arrows(ax:mpl.axes.Axes,y:np.ndarray,left:np.ndarray,
+                       right:np.ndarray,strands:np.ndarray,
+                       step:float,width:float,height:float=0.125,
+                       kwargs:Optional[dict]=None,
+                       collection:Optional[mpl.collections.LineCollection]
+                       =None) -> mpl.collections.LineCollection:
+    """Draws arrow heads representing the strands as a single collection.
+
+    Arrow heads are placed every step starting at left+step and ending
+    at right.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        y (np.ndarray): Vertical positions.
+        left (np.ndarray): Left limits.
+        right (np.ndarray): Right limits.
+        strands (np.ndarray): Strands ('+' or '-'). Others are skipped.
+        step (float): Distance between arrow heads.
+        width (float): Width of an arrow head.
+        height (float): Half of the height of an arrow head.
+        kwargs (Optional[dict]): Additional arguments passed
+            to mpl.collections.LineCollection.
+        collection (Optional[mpl.collections.LineCollection]): Collection
+            of the axes drawn earlier, which is updated in place.
+
+    """
+    if kwargs is None:
+        kwargs = {'lw':0.1,
+                  'colors':'k'}
+
+    y = np.asarray(y,dtype=float)
+    left = np.asarray(left,dtype=float)+step
+    right = np.asarray(right,dtype=float)
+    direction = np.select([np.asarray(strands) == '+',
+                           np.asarray(strands) == '-'],[-1.0,1.0],0.0)
+
+    counts = np.where((right >= left) & (direction != 0),
+                      np.floor((right-left)/step)+1,0).astype(int)
+    owners = np.repeat(np.arange(len(counts)),counts)
+    positions = (left[owners]+
+                 step*(np.arange(counts.sum())-
+                       np.repeat(np.cumsum(counts)-counts,counts)))
+    offsets = positions+direction[owners]*width
+
+    segments = np.stack([np.column_stack((offsets,y[owners]+height)),
+                         np.column_stack((positions,y[owners])),
+                         np.column_stack((offsets,y[owners]-height))],
+                        axis=1)
+
+    if collection is None:
+        collection = mpl.collections.LineCollection(segments,**kwargs)
+        ax.add_collection(collection)
+    else:
+        collection.set_segments(segments)
+        collection.set(**kwargs)
+
+    return collection
+
+def get_visible_labels(ax:mpl.axes.Axes,x:np.ndarray,y:np.ndarray,
+                       labels:np.ndarray,fontsize:float) -> np.ndarray:
+    """Returns which labels can be drawn without overlaps.
+
+    Labels are considered from the bottom to the top and a label is kept
+    if it does not overlap the labels kept so far. The extents of the
+    labels are estimated from the font size. Labels outside the axes,
+    including those on the top edge, are not kept. The axes limits and
+    the layout of the figure have to be final, see GeneLabels.
+
+    Args:
+        ax (mpl.axes.Axes): Axes to be used.
+        x (np.ndarray): Horizontal positions of the label centers.
+        y (np.ndarray): Vertical positions of the label centers.
+        labels (np.ndarray): Labels.
+        fontsize (float): Font size in points.
+
+    Returns:
+        np.ndarray: Boolean mask of the labels to be drawn.
+
+    """
+    visible = np.zeros(len(labels),dtype=bool)
+    if len(labels) == 0:
+        return visible
+
+    scale = ax.figure.dpi/72
+    height = fontsize*scale
+    widths = np.array([len(str(label)) for label in labels])*0.6*height
+    centers = ax.transData.transform(np.column_stack((x,y)))
+    extent = ax.get_window_extent()
+
+    kept = [] # (bottom, left, right) of the kept labels
+    for idx in np.argsort(centers[:,1],kind='stable'):
+        center_x,center_y = centers[idx]
+        # half-open within half a pixel, so that a label on the bottom
+        # edge is kept and a label of a clipped row on the top edge is not
+        if not extent.y0-0.5 <= center_y < extent.y1-0.5:
+            continue
+        bottom = center_y-0.5*height
+        left = center_x-0.5*widths[idx]
+        right = center_x+0.5*widths[idx]
+        # the labels have the same height, only the kept labels reaching
+        # above the bottom of the current label can overlap it
+        overlaps = False
+        for kept_bottom,kept_left,kept_right in reversed(kept):
+            if kept_bottom+height <= bottom:
+                break
+            if kept_left < right and left < kept_right:
+                overlaps = True
+                break
+        if not overlaps:
+            kept.append((bottom,left,right))
+            visible[idx] = True
+
+    return visible
+
+class GeneLabels(mpl.artist.Artist):
+    """Gene names of which only the non-overlapping ones are drawn.
+
+    The visible names are chosen using get_visible_labels whenever the
+    names are drawn, so that they follow the final layout of the figure
+    (e.g. after tight_layout). The names are ignored by the layout.
+
+    Args:
+        x (np.ndarray): Horizontal positions of the name centers.
+        y (np.ndarray): Vertical positions of the name centers.
+        labels (np.ndarray): Names.
+        fontsize (float): Font size in points used to estimate overlaps.
+        kwargs (dict): Additional arguments passed to mpl.text.Text.
+
+    """
+    def __init__(self,x:np.ndarray,y:np.ndarray,labels:np.ndarray,
+                 fontsize:float,kwargs:dict) -> None:
+        """
+        """
+        super().__init__()
+        self.x = np.asarray(x,dtype=float)
+        self.y = np.asarray(y,dtype=float)
+        self.labels = np.asarray(labels,dtype=object)
+        self.fontsize = fontsize
+        self.kwargs = kwargs
+        self.set_in_layout(False)
+
+    def set_data(self,x:np.ndarray,y:np.ndarray,labels:np.ndarray) -> None:
+        """Replaces the names.
+
+        Args:
+            x (np.ndarray): Horizontal positions of the name centers.
+            y (np.ndarray): Vertical positions of the name centers.
+            labels (np.ndarray): Names.
+
+        """
+        self.x = np.asarray(x,dtype=float)
+        self.y = np.asarray(y,dtype=float)
+        self.labels = np.asarray(labels,dtype=object)
+        self.stale = True
+
+    @mpl.artist.allow_rasterization
+    def draw(self,renderer) -> None:
+        """Draws the names visible in the current layout."""
+        if not self.get_visible():
+            return
+        visible = get_visible_labels(self.axes,self.x,self.y,self.labels,
+                                     self.fontsize)
+        for n in np.flatnonzero(visible):
+            text = mpl.text.Text(self.x[n],self.y[n],str(self.labels[n]),
+                                 **{'clip_on':False,**self.kwargs})
+            text.set_figure(self.figure)
+            text.axes = self.axes
+            text.set_transform(self.axes.transData)
+            text.draw(renderer)
+        self.stale = False
+
+@profiling.profiled
+def draw_gene_models(ax:mpl.axes.Axes,chromosome:str,start:int,end:int,
+                     genes:Union[pd.DataFrame,GeneModelIndex],
+                     min_height:int=None,
                      gene_name_field:str='gene_id',fontsize:int=7,
-                     frame:bool=True,kwargs:Optional[dict]=None) -> None:
+                     frame:bool=True,kwargs:Optional[dict]=None,
+                     mode:str='auto',collapse_threshold:float=500,
+                     density_threshold:float=5000,
+                     artists:Optional[dict]=None) -> dict:
     """Draws gene models.
 
+    The level of detail depends on the mode. In the auto mode, it is
+    chosen based on the number of base pairs per pixel, so that wide
+    windows are drawn using a few artists. Exons and CDSs closer than
+    a pixel are merged, and gene names which would overlap other names
+    are not drawn.
+
     Args:
-        ax (plt.Axes): Axes to be used.
+        ax (mpl.axes.Axes): Axes to be used.
         chromosome (str): Chromosome of interest.
         start (int): Start coordinate.
         end (int): End coordinate.
-        genes (pd.DataFrame): Gene definitions in General Transfer
-            Format (GTF).
+        genes (Union[pd.DataFrame,GeneModelIndex]): Gene definitions in
+            General Transfer Format (GTF) or an index built from them.
+            A GTF DataFrame is scanned on each call, an index is queried
+            without scanning. Other sources with a query method, e.g.
+            raesymatto.tabix.TabixGenes, are also accepted.
         min_height (Optional[int]): Minimum number of gene tracks.
             This can be used to have predictable gene heights.
         gene_name_field (str): Name of the column to be used
@@ -379,161 +1275,217 @@ def draw_gene_models(ax:plt.Axes,chromosome:str,start:int,end:int,
         fontsize (int): Font size.
         frame (bool): Draw spines.
         kwargs (Optional[dict]): Additional arguments passed to Axes.text.
+        mode (str): Level of detail; 'full' (a row per transcript),
+            'collapsed' (the transcripts of each gene merged and the genes
+            packed into rows), 'density' (number of genes
+            overlapping each pixel), or 'auto'.
+        collapse_threshold (float): Number of base pairs per pixel above
+            which the auto mode collapses the transcripts of each gene.
+        density_threshold (float): Number of base pairs per pixel above
+            which the auto mode draws the gene density.
+        artists (Optional[dict]): Artists returned by a previous call with
+            the same options on the same axes. They are updated in place
+            where possible and removed otherwise.
+
+    Returns:
+        dict: Drawn artists by role; 'arrows', 'rectangles', and 'labels',
+            or 'density'.
 
     """
-    if kwargs is None:
-        kwargs = {'ha':'center',
-                      'va':'center',
-                      'fontsize':fontsize,
-                      'style':'italic'}
+    import pandas as pd
 
-    def draw_name(ax:plt.Axes,position:Tuple[float,float],
-                  name:str,kwargs:Optional[dict]=None) -> None:
-        """Draws gene name.
+    from raesymatto.genes import GeneModelIndex, get_transcripts
+    from raesymatto.intervals import merge_intervals, pack_intervals
 
-        Args:
-            ax (matplotlib.pyplot.axis): Axes to be used.
-            position (Tuple[float,float]): Position.
-            name (str): Name.
-            kwargs (dict): Additional arguments passed to Axes.text.
+    previous = artists or {}
 
-        """
-        if kwargs is None:
-            kwargs = {'ha':'center',
+    if kwargs is None:
+        kwargs = {'ha':'center',
                       'va':'center',
                       'fontsize':fontsize,
                       'style':'italic'}
 
-        ax.text(position[0],position[1],
-                name,**kwargs)
-
-    def draw_rectangle(ax:plt.Axes,xy:Tuple[float,float],
-                       width:float,height:float,
-                       kwargs:Optional[dict]=None) -> None:
-        """Draws rectangle.
+    if isinstance(genes,pd.DataFrame):
+        # only the transcripts of the region are indexed, pass
+        # a GeneModelIndex when drawing many regions
+        genes = GeneModelIndex(get_transcripts(genes,chromosome,start,end))
+    elif not isinstance(genes,GeneModelIndex):
+        # region-query readers such as raesymatto.tabix.TabixGenes
+        genes = GeneModelIndex(genes.query(chromosome,start,end))
+
+    bp_per_pixel = (end-start)/get_pixel_width(ax)
+    if mode == 'auto':
+        if bp_per_pixel > density_threshold:
+            mode = 'density'
+        elif bp_per_pixel > collapse_threshold:
+            mode = 'collapsed'
+        else:
+            mode = 'full'
+    if mode not in ('full','collapsed','density'):
+        raise ValueError('Unknown mode: %s'%mode)
 
-        Args:
-            ax (plt.Axes): Axes to be used.
-            xy (Tuple[float,float]): The anchor point.
-            width (float): Width of the rectangle.
-            height (float): Height of the rectangle.
-            kwargs (Optional[dict]): Additional arguments
-                passed to mpl.patch.Rectangle.
+    transcripts = genes.query(chromosome,start,end)
+    first_rows = genes.genes.take(genes.offsets[transcripts])
+    profiling.mark('query',len(transcripts))
 
-        """
-        if kwargs is None:
-            kwargs = {'linewidth':0,
-                      'edgecolor':'k',
-                      'facecolor':'k'}
-
-        rectangle = mpl.patches.Rectangle(xy=xy,
-                                          width=width,
-                                          height=height,
-                                          **kwargs)
-        ax.add_patch(rectangle)
-
-    tmp = (genes[['transcript_id','seqname','start','end']]
-           .groupby(['transcript_id','seqname'])
-           .agg({'start':'min','end':'max'})
-           .reset_index())
-
-    # transcripts completely within in the region of interest
-    tmp = tmp[(tmp['seqname']== chromosome) &
-              ((start >= tmp['start']) &
-               (end <= tmp['end']))]['transcript_id'].values
-
-    # transcripts partially within in the region of interest
-    tmp2 = genes[(genes['seqname'] == chromosome) &
-            (((genes['start'] >= start) &
-              (genes['start'] <= end)) |
-             ((genes['end'] >= start) &
-              (genes['end'] <= end)))]['transcript_id'].values
-
-    transcript_ids = np.union1d(tmp,tmp2)
-
-    for n,transcript_id in enumerate(transcript_ids):
-
-        pieces = genes[genes['transcript_id'] == transcript_id]
-        tmp = genes[genes['transcript_id'] == transcript_id]
-
-        draw_rectangle(ax,(tmp['start'].min(),n-0.025),
-                       tmp['start'].max()-tmp['start'].min(),
-                       0.05)
-
-        # draw arrow heads to represent the directionality
-        current_position = (max(tmp['start'].min(),start)+
-                            0.01*(end-start))
-        while current_position <= min(end,tmp['start'].max()):
-            if tmp['strand'].iloc[0] == '+':
-                ax.plot([current_position-0.002*(end-start),
-                         current_position,
-                         current_position-0.002*(end-start)],
-                        [n+0.125,n,n-0.125],
-                        lw=0.1,c='k')
-            elif tmp['strand'].iloc[0] == '-':
-                ax.plot([current_position+0.002*(end-start),
-                         current_position,
-                         current_position+0.002*(end-start)],
-                        [n+0.125,n,n-0.125],
-                        lw=0.1,c='k')
-            current_position += 0.01*(end-start)
-
-        # draw gene name
-        # fits the region of interest
-        if tmp['start'].min() > start and tmp['end'].max() < end:
-            draw_name(ax,((tmp['end'].max()+tmp['start'].min())*0.5,
-                          n-0.5),
-                      pieces[gene_name_field].iloc[0],kwargs)
-        else: # does not fit the region of interest
-            if tmp['strand'].iloc[0] == '+':
-                if (tmp['start'].min() <= start and
-                    tmp['end'].max() >= end):
-                    draw_name(ax,((end+start)*0.5,n-0.5),
-                              pieces[gene_name_field].iloc[0],kwargs)
-                elif tmp['start'].min() <= start:
-                    draw_name(ax,((tmp['end'].max()+start)*0.5,n-0.5),
-                              pieces[gene_name_field].iloc[0],kwargs)
-                elif tmp['start'].max() >= end:
-                    draw_name(ax,((end+tmp['start'].min())*0.5,n-0.5),
-                              pieces[gene_name_field].iloc[0],kwargs)
-            else:
-                if (tmp['end'].min() <= start and
-                    tmp['start'].max() >= end):
-                    draw_name(ax,((end+start)*0.5,n-0.5),
-                              pieces[gene_name_field].iloc[0],kwargs)
-                elif tmp['start'].max() < end:
-                    draw_name(ax,((tmp['start'].max()+start)*0.5,n-0.5),
-                              pieces[gene_name_field].iloc[0],kwargs)
-                elif tmp['end'].min() > start:
-                    draw_name(ax,((end+tmp['end'].min())*0.5,n-0.5),
-                              pieces[gene_name_field].iloc[0],kwargs)
-
-        # draw exons and CDSs
-        for _,piece in pieces.iterrows():
-            if piece['feature'] == 'exon':
-                draw_rectangle(ax,(piece['start'],n-0.125),
-                               piece['end']-piece['start'],
-                               0.25)
-            elif piece['feature'] == 'CDS':
-                draw_rectangle(ax,(piece['start'],n-0.25),
-                               piece['end']-piece['start'],
-                               0.5)
+    # a row per transcript or per gene
+    if mode == 'full':
+        rows = np.arange(len(transcripts))
+    else:
+        gene_field = ('gene_id' if 'gene_id' in first_rows.columns
+                      else gene_name_field)
+        rows = pd.factorize(first_rows[gene_field],use_na_sentinel=False)[0]
+    spans = (genes.transcripts.take(transcripts)
+             .groupby(rows)
+             .agg({'start':'min','start_max':'max','end':'max',
+                   'end_min':'min','strand':'first'}))
+    names = first_rows[gene_name_field].groupby(rows).first().values
+    if mode == 'collapsed' and spans.shape[0] > 0:
+        # pack the genes into as few rows as possible
+        order = np.argsort(spans['start'].values,kind='stable')
+        packed = np.zeros(spans.shape[0],dtype=int)
+        packed[order] = pack_intervals(
+            spans['start'].values[order],
+            np.maximum(spans['end'].values,
+                       spans['start_max'].values)[order])
+    else:
+        packed = np.arange(spans.shape[0])
+    n_rows = packed.max()+1 if packed.shape[0] > 0 else 0
+    profiling.mark('layout')
+
+    if mode == 'density':
+        nbins = get_pixel_width(ax)
+        edges = np.linspace(start,end,nbins+1)
+        # genes starting before the end of a bin minus those ending
+        # before its start
+        counts = (np.searchsorted(np.sort(spans['start'].values),
+                                  edges[1:],side='left')-
+                  np.searchsorted(np.sort(spans['end'].values),
+                                  edges[:-1],side='left'))
+        profile = previous.get('density')
+        if profile is not None and hasattr(profile,'set_data'):
+            profile.set_data(edges,np.append(counts,counts[-1]),0)
+        else:
+            profile = ax.fill_between(edges,np.append(counts,counts[-1]),
+                                      step='post',linewidth=0,
+                                      facecolor='k')
+
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_xlim(start,end)
+        ax.set_ylim(0,max(counts.max(),1))
+
+        if not frame:
+            hide_frame(ax)
+        return remove_replaced(artists,{'density':profile})
+
+    # draw arrow heads to represent the directionality
+    arrows = draw_strand_arrows(ax,packed,
+                                np.maximum(spans['start'].values,start),
+                                np.minimum(spans['start_max'].values,end),
+                                spans['strand'].values,
+                                0.01*(end-start),0.002*(end-start),
+                                collection=previous.get('arrows'))
+
+    # draw backbones, exons and CDSs as a single collection,
+    # exons and CDSs closer than a pixel are merged
+    lengths = genes.offsets[transcripts+1]-genes.offsets[transcripts]
+    pieces = np.concatenate([np.arange(genes.offsets[transcript],
+                                       genes.offsets[transcript+1])
+                             for transcript in transcripts]+
+                            [np.zeros(0,dtype=int)])
+    piece_rows = np.repeat(packed[rows],lengths)
+    exons = genes.feature[pieces] == 'exon'
+    cdss = genes.feature[pieces] == 'CDS'
+
+    piece_start = genes.start[pieces]
+    piece_end = genes.end[pieces]
+    exon_rows,exon_start,exon_end = merge_intervals(
+        piece_rows[exons],piece_start[exons],piece_end[exons],bp_per_pixel)
+    cds_rows,cds_start,cds_end = merge_intervals(
+        piece_rows[cdss],piece_start[cdss],piece_end[cdss],bp_per_pixel)
+
+    backbone_start = spans['start'].values
+    backbone_end = spans['start_max'].values
+
+    rectangles = draw_rectangles(
+        ax,
+        np.concatenate((backbone_start,exon_start,cds_start)),
+        np.concatenate((packed-0.025,
+                        exon_rows-0.125,
+                        cds_rows-0.25)),
+        np.concatenate((backbone_end-backbone_start,
+                        exon_end-exon_start,
+                        cds_end-cds_start)),
+        np.concatenate((np.full(packed.shape[0],0.05),
+                        np.full(exon_rows.shape[0],0.25),
+                        np.full(cds_rows.shape[0],0.5))),
+        {'linewidth':0,
+         'edgecolor':'k',
+         'facecolor':'k'},
+        previous.get('rectangles'))
 
     ax.set_xticks([])
     ax.set_yticks([])
     ax.set_xlim(start,end)
     if min_height is not None:
-        if min_height < len(transcript_ids):
+        if min_height < n_rows:
             logging.warning(('%d genes would not be visible due '
                              'to min_height=%d, discard min_height.'),
-                            len(transcript_ids)-min_height,min_height)
-            ax.set_ylim(-0.5,min(len(transcript_ids),1)-0.5)
+                            n_rows-min_height,min_height)
+            ax.set_ylim(-0.5,min(n_rows,1)-0.5)
         else:
-            ax.set_ylim(-(min_height-len(transcript_ids))-0.5,
-                        len(transcript_ids)-0.5)
+            ax.set_ylim(-(min_height-n_rows)-0.5,
+                        n_rows-0.5)
+    else:
+        ax.set_ylim(-0.5,min(n_rows,1)-0.5)
+
+    # gene names
+    positions = []
+    for n,(strand,start_min,start_max,end_min,end_max) in enumerate(
+            zip(spans['strand'].values,spans['start'].values,
+                spans['start_max'].values,spans['end_min'].values,
+                spans['end'].values)):
+
+        # fits the region of interest
+        if start_min > start and end_max < end:
+            positions.append((end_max+start_min)*0.5)
+        else: # does not fit the region of interest
+            if strand == '+':
+                if start_min <= start and end_max >= end:
+                    positions.append((end+start)*0.5)
+                elif start_min <= start:
+                    positions.append((end_max+start)*0.5)
+                elif start_max >= end:
+                    positions.append((end+start_min)*0.5)
+                else:
+                    positions.append(np.nan)
+            else:
+                if end_min <= start and start_max >= end:
+                    positions.append((end+start)*0.5)
+                elif start_max < end:
+                    positions.append((start_max+start)*0.5)
+                elif end_min > start:
+                    positions.append((end+end_min)*0.5)
+                else:
+                    positions.append(np.nan)
+
+    positions = np.array(positions,dtype=float)
+    labeled = np.flatnonzero(~np.isnan(positions))
+    # the visible names are chosen when drawn, after the final layout
+    labels = previous.get('labels')
+    if labels is not None:
+        labels.set_data(positions[labeled],packed[labeled]-0.5,
+                        names[labeled])
     else:
-        ax.set_ylim(-0.5,min(len(transcript_ids),1)-0.5)
+        labels = ax.add_artist(GeneLabels(positions[labeled],
+                                          packed[labeled]-0.5,
+                                          names[labeled],
+                                          kwargs.get('fontsize',fontsize),
+                                          kwargs))
 
     if not frame:
         hide_frame(ax)
+    return remove_replaced(artists,{'arrows':arrows,'rectangles':rectangles,
+                                    'labels':labels})
         
\ No newline at end of file
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 """Raesymatto."""
 import os
-from distutils.core import setup
+from setuptools import setup
 
 import raesymatto
 
@@ -30,5 +30,8 @@ setup(name='raesymatto',
            '"Revised" License (BSD-3-Clause)'),
           'Programming Language :: Python :: 3'],
       packages=['raesymatto'],
-      install_requires=install_requires
+      install_requires=install_requires,
+      # clustered row order of bigWig heatmaps, and YAML layouts
+      extras_require={'cluster':['scipy'],'yaml':['PyYAML']},
+      entry_points={'console_scripts':['raesymatto=raesymatto.cli:main']}
 )
@@ -0,0 +1,90 @@
+"""Tests of raesymatto.bigwig."""
+import numpy as np
+import pyBigWig
+import pytest
+
+from raesymatto.bigwig import BigWigSource
+from raesymatto.visualizations import get_bw_bins
+
+LENGTH = 300000
+
+@pytest.fixture
+def bw_path(tmp_path) -> str:
+    """Writes a sparse bigWig file with intervals of varying lengths.
+
+    The file has no zoom levels, so that the summaries are exact.
+
+    """
+    rng = np.random.default_rng(0)
+    starts = np.sort(rng.choice(LENGTH-1000,500,replace=False))
+    starts = starts[np.diff(starts,append=LENGTH) > 1000]
+    ends = starts+rng.integers(1,1000,starts.shape[0])
+    path = str(tmp_path/'sparse.bw')
+    bw = pyBigWig.open(path,'w')
+    bw.addHeader([('chr1',LENGTH)],maxZooms=0)
+    bw.addEntries(['chr1']*starts.shape[0],starts.tolist(),
+                  ends=ends.tolist(),values=rng.gamma(1.0,5.0,
+                                                      starts.shape[0])
+                  .tolist())
+    bw.close()
+    return path
+
+def test_mean_is_weighted_by_coverage(tmp_path):
+    """Partially covered fine bins do not dilute the mean."""
+    path = str(tmp_path/'partial.bw')
+    bw = pyBigWig.open(path,'w')
+    bw.addHeader([('chr1',100000)])
+    bw.addEntries(['chr1','chr1'],[0,16384],ends=[16384,16385],
+                  values=[10.0,0.0])
+    bw.close()
+    with BigWigSource(path) as source:
+        _,values = source.get_bins('chr1',0,32767,1,'mean')
+    assert values[0,0] == pytest.approx(10.0*16384/16385)
+
+@pytest.mark.parametrize('summary',['mean','max','min'])
+def test_bins_match_pybigwig(bw_path,summary):
+    """Bins match the exact summaries of pyBigWig."""
+    exact = pyBigWig.open(bw_path)
+    with BigWigSource(bw_path) as source:
+        # bins summarized from the intervals, and from aligned fine bins
+        for start,end,nbins in [(12345,98765,777),(1,LENGTH-1,1000),
+                                (0,6144*40,40),(1<<13,(1<<13)+6144*30,30)]:
+            edges,values = source.get_bins('chr1',start,end,nbins,summary)
+            _,expected = get_bw_bins(exact,'chr1',start,end,nbins,summary)
+            np.testing.assert_array_equal(edges,
+                                          np.linspace(start,end,nbins+1))
+            np.testing.assert_allclose(values,expected,rtol=1e-6)
+    exact.close()
+
+def test_straddling_fine_bins_are_split(bw_path):
+    """Means of bins unaligned to the fine bins are close to exact."""
+    exact = pyBigWig.open(bw_path)
+    with BigWigSource(bw_path) as source:
+        _,values = source.get_bins('chr1',12345,LENGTH-54321,77,'mean')
+    _,expected = get_bw_bins(exact,'chr1',12345,LENGTH-54321,77,'mean')
+    exact.close()
+    # the coverage of a split fine bin is assumed to be uniform
+    both = ~np.isnan(values) & ~np.isnan(expected)
+    assert both.sum() >= 60
+    np.testing.assert_allclose(values[both],expected[both],rtol=0.1)
+    assert np.median(np.abs(values[both]/expected[both]-1)) < 1e-3
+
+def test_values_are_cached_per_tile(bw_path):
+    """Per-base values match pyBigWig and overlapping windows hit."""
+    exact = pyBigWig.open(bw_path)
+    with BigWigSource(bw_path,values_tile=1<<12) as source:
+        for start in range(1000,20000,3000):
+            np.testing.assert_array_equal(
+                source.values('chr1',start,start+5000),
+                np.array(exact.values('chr1',start,start+5000),
+                         dtype=np.float32))
+        info = source.cache_info()
+        assert info['entries'] == -(-24000//(1<<12))
+        assert info['hits'] > info['misses']
+        np.testing.assert_array_equal(
+            source.values('chr1',LENGTH-10,LENGTH),
+            np.array(exact.values('chr1',LENGTH-10,LENGTH),
+                     dtype=np.float32))
+        with pytest.raises(RuntimeError):
+            source.values('chr1',LENGTH-10,LENGTH+10)
+    exact.close()
@@ -0,0 +1,109 @@
+"""Tests of raesymatto.cache."""
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from raesymatto import render
+from raesymatto.cache import load_bed, open_index, save_index
+from raesymatto.intervals import BedIndex
+
+@pytest.fixture
+def bed_path(tmp_path) -> str:
+    """Writes a BED file."""
+    rng = np.random.default_rng(0)
+    starts = np.sort(rng.integers(0,1000000,5000))
+    bed = pd.DataFrame({0:rng.choice(['chr1','chr2'],5000),1:starts,
+                        2:starts+rng.integers(1,5000,5000),
+                        3:['name%d'%idx for idx in range(5000)]})
+    path = str(tmp_path/'regions.bed')
+    bed.to_csv(path,sep='\t',header=False,index=False)
+    return path
+
+def _query(path:str) -> list:
+    """Loads a BED file using the cache and queries a region."""
+    return list(load_bed(path).query('chr1',100000,200000)[3])
+
+def test_load_bed(bed_path):
+    """The cached index returns the same rows as a fresh index."""
+    expected = BedIndex(pd.read_csv(bed_path,sep='\t',header=None))
+    for _ in range(2):
+        index = load_bed(bed_path)
+        assert os.path.isdir(bed_path+'.raesymatto')
+        pd.testing.assert_frame_equal(
+            index.query('chr2',5000,90000).reset_index(drop=True),
+            expected.query('chr2',5000,90000).reset_index(drop=True),
+            check_dtype=False)
+
+def test_save_index_replaces_outdated(tmp_path):
+    """An existing cache with a different manifest is replaced."""
+    directory = str(tmp_path/'cache')
+    first = BedIndex(pd.DataFrame({0:['chr1'],1:[0],2:[10]}))
+    second = BedIndex(pd.DataFrame({0:['chr2'],1:[0],2:[10]}))
+    save_index(first,directory,{'version':1})
+    save_index(second,directory,{'version':2})
+    assert len(open_index(directory).query('chr2',0,10)) == 1
+    assert sorted(os.listdir(tmp_path)) == ['cache']
+
+def test_save_index_keeps_identical(tmp_path):
+    """An existing cache with the same manifest is kept as such."""
+    directory = str(tmp_path/'cache')
+    first = BedIndex(pd.DataFrame({0:['chr1'],1:[0],2:[10]}))
+    second = BedIndex(pd.DataFrame({0:['chr2'],1:[0],2:[10]}))
+    save_index(first,directory,{'version':1})
+    save_index(second,directory,{'version':1})
+    assert len(open_index(directory).query('chr1',0,10)) == 1
+    assert sorted(os.listdir(tmp_path)) == ['cache']
+
+def test_concurrent_builders(bed_path):
+    """Concurrent builders neither fail nor leave temporary files."""
+    expected = _query(bed_path)
+    shutil.rmtree(bed_path+'.raesymatto')
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(_query,[bed_path]*8))
+    assert all(result == expected for result in results)
+    assert sorted(os.listdir(os.path.dirname(bed_path))) == [
+        'regions.bed','regions.bed.raesymatto']
+
+def test_render_uses_cache(bed_path):
+    """The render path loads BED files using the cache."""
+    render.close_sources()
+    try:
+        index = render.open_source('bed',bed_path)
+        assert os.path.isdir(bed_path+'.raesymatto')
+        assert isinstance(index.index['chr1']['start'],np.memmap)
+    finally:
+        render.close_sources()
+
+def test_edit_keeping_the_size(tmp_path):
+    """Edits in the middle of a file invalidate the cache."""
+    # larger than the parts of a file a partial comparison would read
+    n = 150000
+    starts = np.arange(n)*100
+    path = str(tmp_path/'large.bed')
+    pd.DataFrame({0:'chr1',1:starts,2:starts+50,3:100}).to_csv(
+        path,sep='\t',header=False,index=False)
+    load_bed(path)
+    mtime = os.stat(path).st_mtime_ns
+
+    with open(path,'r+b') as f:
+        f.seek(f.read().index(b'\t%d\t%d\t100\n'%(starts[n//2],
+                                                    starts[n//2]+50)))
+        f.write(b'\t%d\t%d\t111\n'%(starts[n//2],starts[n//2]+50))
+    os.utime(path,ns=(mtime+10**9,mtime+10**9))
+
+    scores = load_bed(path).query('chr1',starts[n//2],starts[n//2]+10)[3]
+    assert list(scores) == [111]
+
+def test_extension_arrays_are_mapped(tmp_path):
+    """String columns are saved as .npy files rather than pickled."""
+    index = BedIndex(pd.DataFrame({0:['chr1'],1:[0],2:[10]}))
+    index.names = pd.array(['a'])
+    directory = str(tmp_path/'cache')
+    save_index(index,directory)
+    names = open_index(directory).names
+    assert isinstance(names,np.memmap)
+    assert list(names) == ['a']
@@ -0,0 +1,52 @@
+"""Tests of raesymatto.cli and the deferred imports."""
+import builtins
+import subprocess
+import sys
+
+import pytest
+
+from raesymatto import cli, render
+
+def test_render_defers_imports():
+    """Importing render imports neither pandas nor pyBigWig."""
+    code = ('import sys, raesymatto.render; '
+            'print(sorted(set(sys.modules) & {"pandas","pyBigWig",'
+            '"raesymatto.cache","raesymatto.tabix","raesymatto.store"}))')
+    output = subprocess.run([sys.executable,'-c',code],check=True,
+                            capture_output=True,text=True).stdout
+    assert output.strip() == '[]'
+
+@pytest.mark.parametrize('option',[['--prefetch','2'],['--profile']])
+def test_worker_options_are_rejected(option):
+    """Options handled by the current process require -j 1."""
+    with pytest.raises(SystemExit) as error:
+        cli.main(['render','layout.json','chr1:0-100','-j','2',*option])
+    assert error.value.code == 2
+
+def test_render_regions_rejects_prefetch_with_workers(tmp_path):
+    """Prefetching is not silently ignored with worker processes."""
+    with pytest.raises(ValueError):
+        render.render_regions({'tracks':[]},[('chr1',0,100)],
+                              str(tmp_path),workers=2,prefetch=2)
+
+def test_yaml_layout(tmp_path):
+    """Sources of YAML layouts are resolved against their directory."""
+    pytest.importorskip('yaml')
+    path = tmp_path/'layout.yaml'
+    path.write_text('tracks:\n- type: bed\n  source: regions.bed\n',
+                    encoding='utf-8')
+    layout = cli.read_layout(str(path))
+    assert layout['tracks'][0]['source'] == str(tmp_path/'regions.bed')
+
+def test_yaml_layout_without_pyyaml(tmp_path,monkeypatch):
+    """YAML layouts without PyYAML fail with an informative error."""
+    real_import = builtins.__import__
+    def blocking_import(name,*args,**kwargs):
+        if name == 'yaml':
+            raise ImportError('No module named %s'%name)
+        return real_import(name,*args,**kwargs)
+    monkeypatch.setattr(builtins,'__import__',blocking_import)
+    path = tmp_path/'layout.yml'
+    path.write_text('tracks: []\n',encoding='utf-8')
+    with pytest.raises(ImportError,match=r'raesymatto\[yaml\]'):
+        cli.read_layout(str(path))
@@ -0,0 +1,76 @@
+"""Tests of draw_gene_models."""
+import io
+import re
+
+import matplotlib.figure
+import numpy as np
+import pandas as pd
+import pytest
+
+from raesymatto import genes as genes_module
+from raesymatto.genes import GeneModelIndex, get_transcripts
+from raesymatto.visualizations import draw_gene_models
+
+def make_genes(spans:list) -> pd.DataFrame:
+    """Returns GTF rows of single-exon transcripts, a gene each."""
+    return pd.DataFrame({'seqname':'chr1','feature':'exon',
+                         'start':[start for start,_ in spans],
+                         'end':[end for _,end in spans],'strand':'+',
+                         'gene_id':['g%d'%idx for idx in range(len(spans))],
+                         'transcript_id':['t%d'%idx
+                                          for idx in range(len(spans))]})
+
+def draw(genes,start:int,end:int,**kwargs) -> tuple:
+    """Draws gene models and returns the axes and the drawn names."""
+    fig = matplotlib.figure.Figure(figsize=(8,2))
+    ax = fig.add_subplot()
+    draw_gene_models(ax,'chr1',start,end,genes,**kwargs)
+    fig.tight_layout()
+    svg = io.StringIO()
+    fig.savefig(svg,format='svg')
+    return ax,re.findall(r'<!-- (g\d+) -->',svg.getvalue())
+
+def test_clipped_labels_are_not_drawn():
+    """Names of the rows outside the axes are not drawn at the edges."""
+    genes = make_genes([(1000,2000),(4000,5000),(7000,8000)])
+    _,names = draw(genes,0,10000,mode='full')
+    assert names == ['g0']
+    _,names = draw(genes,0,10000,mode='full',min_height=3)
+    assert sorted(names) == ['g0','g1','g2']
+
+def test_collapsed_mode_packs_genes():
+    """Collapsed genes which do not overlap share rows."""
+    genes = make_genes([(1000,2000),(1500,3000),(4000,5000),(7000,8000)])
+    ax,names = draw(genes,0,10000,mode='collapsed',min_height=3)
+    assert ax.get_ylim() == pytest.approx((-1.5,1.5))
+    assert sorted(names) == ['g0','g1','g2','g3']
+
+def test_data_frames_are_indexed_by_region(monkeypatch):
+    """Only the transcripts of the region are indexed for data frames."""
+    genes = make_genes([(idx*1000,idx*1000+500) for idx in range(100)])
+    sizes = []
+    class RecordingIndex(GeneModelIndex):
+        def __init__(self,genes):
+            sizes.append(len(genes))
+            super().__init__(genes)
+    monkeypatch.setattr(genes_module,'GeneModelIndex',RecordingIndex)
+    _,names = draw(genes,10200,12800,mode='full',min_height=3)
+    assert sizes == [3]
+    assert sorted(names) == ['g10','g11','g12']
+
+def test_get_transcripts():
+    """Transcripts spanning the region by an intron are returned."""
+    genes = pd.concat([make_genes([(1000,2000),(5000,6000)]),
+                       make_genes([(10000,11000)])])
+    genes['transcript_id'] = ['t0','t1','t0']
+    np.testing.assert_array_equal(
+        get_transcripts(genes,'chr1',3000,4000)['transcript_id'],
+        ['t0','t0'])
+    assert len(get_transcripts(genes,'chr2',0,20000)) == 0
+
+def test_index_arrays_are_ndarrays():
+    """The columns of the index are ndarrays, also for string columns."""
+    index = GeneModelIndex(make_genes([(1000,2000),(4000,5000)]))
+    for array in (index.feature,index.start,index.end,index.offsets):
+        assert type(array) is np.ndarray
+    assert list(index.feature) == ['exon','exon']
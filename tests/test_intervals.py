@@ -0,0 +1,213 @@
+"""Tests of raesymatto.intervals."""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from raesymatto.intervals import (BedIndex, BedpeIndex, bin_intervals,
+                                  get_intervals, pack_intervals)
+
+SUMMARIES = ['coverage','sum','max']
+
+def naive_bins(starts:np.ndarray,ends:np.ndarray,edges:np.ndarray,
+               scores:np.ndarray,summary:str) -> np.ndarray:
+    """Summarizes the intervals overlapping each bin one bin at a time."""
+    result = []
+    for lower,upper in zip(edges[:-1],edges[1:]):
+        overlapping = (starts < upper) & (ends > lower)
+        if summary == 'coverage':
+            result.append(overlapping.sum())
+        elif summary == 'sum':
+            result.append(scores[overlapping].sum())
+        else:
+            result.append(scores[overlapping].max()
+                          if overlapping.any() else np.nan)
+    return np.array(result,dtype=float)
+
+@pytest.mark.parametrize('summary',SUMMARIES)
+def test_random_intervals(summary):
+    """Intervals of all lengths, also outside the edges, match."""
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = int(rng.integers(1,200))
+        starts = rng.integers(-1000,11000,n)
+        ends = starts+rng.choice([0,1,10,100,1000,20000],n)
+        scores = rng.normal(0,1,n)
+        edges = np.unique(np.concatenate(
+            ([0,10000],rng.integers(0,10000,int(rng.integers(0,30))))))
+        np.testing.assert_allclose(
+            bin_intervals(starts,ends,edges,scores,summary),
+            naive_bins(starts,ends,edges,scores,summary),atol=1e-9)
+
+@pytest.mark.parametrize('summary',SUMMARIES)
+def test_edge_cases(summary):
+    """Touching, zero-length, and outside intervals match."""
+    edges = np.array([0,10,20,30])
+    starts = np.array([-20,-5,10,15,15,20,30,35,0])
+    ends = np.array([-10,0,10,15,25,20,40,50,30])
+    scores = np.array([1.0,2.0,3.0,4.0,-5.0,6.0,7.0,8.0,-9.0])
+    np.testing.assert_allclose(
+        bin_intervals(starts,ends,edges,scores,summary),
+        naive_bins(starts,ends,edges,scores,summary))
+
+@pytest.mark.parametrize('summary',SUMMARIES)
+def test_empty_input(summary):
+    """Bins without intervals are zero, or NaN for the maximum."""
+    edges = np.array([0,10,20])
+    result = bin_intervals(np.zeros(0),np.zeros(0),edges,np.zeros(0),
+                           summary)
+    expected = np.full(2,np.nan) if summary == 'max' else np.zeros(2)
+    np.testing.assert_array_equal(result,expected)
+
+    # none of the intervals overlap the bins
+    result = bin_intervals(np.array([30,-10]),np.array([40,0]),edges,
+                           np.array([1.0,2.0]),summary)
+    np.testing.assert_array_equal(result,expected)
+
+def test_unknown_summary():
+    """Unknown summaries are rejected."""
+    with pytest.raises(ValueError):
+        bin_intervals([0],[1],[0,1],[1.0],'median')
+
+def naive_rows(starts:np.ndarray,ends:np.ndarray,
+               max_rows:Optional[int]=None) -> np.ndarray:
+    """Places each interval into the first row it fits, row by row."""
+    levels = []
+    rows = []
+    for start,end in zip(starts,ends):
+        for row,last_end in enumerate(levels):
+            if last_end < start:
+                levels[row] = end
+                rows.append(row)
+                break
+        else:
+            if max_rows is not None and len(levels) >= max_rows-1:
+                rows.append(max_rows-1)
+            else:
+                rows.append(len(levels))
+                levels.append(end)
+    return np.array(rows,dtype=int)
+
+def test_pack_intervals_matches_first_fit():
+    """Rows are those of the first-fit layout, also when overflowing."""
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = int(rng.integers(0,300))
+        starts = np.sort(rng.integers(0,10000,n))
+        ends = starts+rng.choice([0,1,10,100,1000],n)
+        for max_rows in [None,1,2,5]:
+            np.testing.assert_array_equal(
+                pack_intervals(starts,ends,max_rows),
+                naive_rows(starts,ends,max_rows))
+
+def test_pack_intervals_overflow():
+    """Overflowing intervals share the last row, which is not reused."""
+    starts = np.array([0,0,0,0,20])
+    ends = np.array([10,10,10,10,30])
+    np.testing.assert_array_equal(pack_intervals(starts,ends),
+                                  [0,1,2,3,0])
+    np.testing.assert_array_equal(pack_intervals(starts,ends,2),
+                                  [0,1,1,1,0])
+    np.testing.assert_array_equal(pack_intervals(starts,ends,1),
+                                  [0,0,0,0,0])
+    # touching intervals do not share a row
+    np.testing.assert_array_equal(pack_intervals([0,10],[10,20]),[0,1])
+    with pytest.raises(ValueError):
+        pack_intervals(starts,ends,0)
+
+def random_bed(rng:np.random.Generator,n:int) -> pd.DataFrame:
+    """Returns intervals of all lengths, some reversed, on two chromosomes.
+
+    One long interval on chr1 starts well before the query windows.
+
+    """
+    starts = rng.integers(0,100000,n)
+    ends = starts+rng.choice([0,1,10,100,1000],n)
+    reversed_ = rng.random(n) < 0.1
+    starts[reversed_],ends[reversed_] = ends[reversed_],starts[reversed_]
+    bed = pd.DataFrame({0:rng.choice(['chr1','chr2'],n),1:starts,2:ends})
+    long = pd.DataFrame({0:['chr1'],1:[-50000],2:[90000]})
+    return pd.concat([bed,long],ignore_index=True).sample(
+        frac=1,random_state=0)
+
+def test_bed_index_matches_mask():
+    """BedIndex returns the same rows as the DataFrame filter."""
+    rng = np.random.default_rng(0)
+    for n in [0,1,10,500]:
+        bed = random_bed(rng,n)
+        index = BedIndex(bed)
+        windows = [(int(lower),int(lower+rng.choice([0,1,100,5000])))
+                   for lower in rng.integers(-1000,101000,30)]
+        # windows touching the bounds of the intervals
+        windows += [(int(bed.iloc[idx,2]),int(bed.iloc[idx,2])+100)
+                    for idx in range(min(n,10))]
+        windows += [(int(bed.iloc[idx,1])-100,int(bed.iloc[idx,1]))
+                    for idx in range(min(n,10))]
+        windows += [(90000,95000),(-60000,-50000)]
+        for chromosome in ['chr1','chr2','chr3']:
+            for start,end in windows:
+                expected = get_intervals(bed,chromosome,start,end)
+                result = index.query(chromosome,start,end)
+                np.testing.assert_array_equal(result.index,expected.index)
+
+def test_bed_index_empty():
+    """Empty BED data and unknown chromosomes give no intervals."""
+    bed = pd.DataFrame({0:pd.Series([],dtype=str),
+                        1:pd.Series([],dtype=int),
+                        2:pd.Series([],dtype=int)})
+    index = BedIndex(bed)
+    assert len(index) == 0
+    assert index.query('chr1',0,1000).shape == (0,3)
+    index = BedIndex(pd.DataFrame({0:['chr1'],1:[100],2:[200]}))
+    assert index.query('chr2',0,1000).shape == (0,3)
+    assert list(index.query('chr1',200,300).index) == [0]
+    assert list(index.query('chr1',0,100).index) == [0]
+    assert index.query('chr1',201,300).shape == (0,3)
+
+def random_bedpe(rng:np.random.Generator,n:int) -> pd.DataFrame:
+    """Returns pairs within and between two chromosomes."""
+    chromosomes = rng.choice(['chr1','chr2'],(n,2),p=[0.8,0.2])
+    starts = rng.integers(0,100000,(n,2))
+    ends = starts+rng.choice([0,10,1000],(n,2))
+    return pd.DataFrame({0:chromosomes[:,0],1:starts[:,0],2:ends[:,0],
+                         3:chromosomes[:,1],4:starts[:,1],5:ends[:,1],
+                         6:rng.normal(0,1,n)})
+
+def naive_pairs(bedpe:pd.DataFrame,chromosome:str,start:int,end:int,
+                anchors:str) -> np.ndarray:
+    """Returns the row positions of the pairs using masks."""
+    first,second = ((bedpe.iloc[:,column].values == chromosome) &
+                    (bedpe.iloc[:,column+1].values <= end) &
+                    (bedpe.iloc[:,column+2].values >= start)
+                    for column in (0,3))
+    if anchors == 'any':
+        return np.flatnonzero(first | second)
+    if anchors == 'both':
+        return np.flatnonzero(first & second)
+    lower = np.minimum(bedpe.iloc[:,1].values,bedpe.iloc[:,4].values)
+    upper = np.maximum(bedpe.iloc[:,2].values,bedpe.iloc[:,5].values)
+    return np.flatnonzero((bedpe.iloc[:,0].values == chromosome) &
+                          (bedpe.iloc[:,3].values == chromosome) &
+                          (lower <= end) & (upper >= start))
+
+@pytest.mark.parametrize('anchors',['any','both','span'])
+def test_bedpe_index_matches_masks(anchors):
+    """Pairs of each anchor query match the masks."""
+    rng = np.random.default_rng(0)
+    for n in [0,1,10,500]:
+        bedpe = random_bedpe(rng,n)
+        index = BedpeIndex(bedpe)
+        for lower in rng.integers(-1000,101000,30):
+            start,end = int(lower),int(lower+rng.choice([0,100,20000]))
+            for chromosome in ['chr1','chr2','chr3']:
+                np.testing.assert_array_equal(
+                    index.query_positions(chromosome,start,end,anchors),
+                    naive_pairs(bedpe,chromosome,start,end,anchors))
+        assert index.query('chr1',0,100000,anchors).shape[1] == 7
+
+def test_bedpe_index_unknown_anchors():
+    """Unknown anchor queries are rejected."""
+    index = BedpeIndex(random_bedpe(np.random.default_rng(0),10))
+    with pytest.raises(ValueError):
+        index.query_positions('chr1',0,1000,'either')
@@ -0,0 +1,79 @@
+"""Tests of draw_loops."""
+import matplotlib.figure
+import numpy as np
+import pandas as pd
+import pytest
+
+from raesymatto.intervals import BedIndex, BedpeIndex, get_intervals
+from raesymatto.visualizations import draw_loops
+
+def random_bedpe(n:int) -> pd.DataFrame:
+    """Returns pairs with distinct scores, some between chromosomes."""
+    rng = np.random.default_rng(0)
+    chromosomes = rng.choice(['chr1','chr2'],(n,2),p=[0.9,0.1])
+    starts = rng.integers(0,100000,(n,2))
+    ends = starts+rng.integers(0,5000,(n,2))
+    scores = rng.permutation(n).astype(object)
+    scores[::17] = '.'
+    return pd.DataFrame({0:chromosomes[:,0],1:starts[:,0],2:ends[:,0],
+                         3:chromosomes[:,1],4:starts[:,1],5:ends[:,1],
+                         'score':scores})
+
+def drawn_loops(bed,start:int,end:int,**kwargs) -> set:
+    """Draws the loops and returns the (start, end) of the arcs."""
+    fig = matplotlib.figure.Figure()
+    ax = fig.add_subplot()
+    draw_loops(ax,'chr1',start,end,bed,**kwargs)
+    if not ax.patches:
+        return set()
+    vertices = ax.patches[0].get_path().vertices.reshape(-1,3,2)
+    return set(zip(vertices[:,0,0],vertices[:,2,0]))
+
+def reference_loops(bedpe:pd.DataFrame,start:int,end:int,top:int,
+                    min_length:float) -> set:
+    """Selects the loops of the BEDPE pairs one at a time."""
+    candidates = []
+    for row in bedpe.itertuples(index=False):
+        chrom1,start1,end1,chrom2,start2,end2,score = row
+        in_region = [chrom == 'chr1' and lower <= end and upper >= start
+                     for chrom,lower,upper in [(chrom1,start1,end1),
+                                               (chrom2,start2,end2)]]
+        if chrom1 != chrom2 or not any(in_region) or score == '.':
+            continue
+        centers = sorted([(start1+end1)/2,(start2+end2)/2])
+        if centers[1]-centers[0] >= min_length:
+            candidates.append((score,tuple(centers)))
+    candidates.sort(reverse=True)
+    return {centers for _,centers in candidates[:top]}
+
+@pytest.mark.parametrize('top,min_length',[(None,0),(10,0),(10,20000),
+                                           (0,0),(1000,5000)])
+def test_bedpe_loops_match_reference(top,min_length):
+    """The loops with the highest scores above min_length are drawn."""
+    bedpe = random_bedpe(300)
+    index = BedpeIndex(bedpe)
+    for start,end in [(0,100000),(20000,30000),(99000,200000)]:
+        expected = reference_loops(bedpe,start,end,
+                                   len(bedpe) if top is None else top,
+                                   min_length)
+        assert drawn_loops(index,start,end,score='score',top=top,
+                           min_length=min_length) == expected
+
+def test_bed_loops_are_selected_by_length():
+    """BED loops are queried by region, and the longest are drawn."""
+    rng = np.random.default_rng(1)
+    starts = rng.integers(0,100000,200)
+    bed = pd.DataFrame({0:rng.choice(['chr1','chr2'],200),1:starts,
+                        2:starts+rng.permutation(200)*100})
+    for source in [bed,BedIndex(bed)]:
+        loops = get_intervals(bed,'chr1',20000,40000)
+        lengths = (loops.iloc[:,2]-loops.iloc[:,1]).values
+        loops = loops.iloc[np.argsort(-lengths)[:5]]
+        assert (loops.iloc[:,2]-loops.iloc[:,1]).min() >= 1000
+        expected = set(zip(loops.iloc[:,1].astype(float),
+                           loops.iloc[:,2].astype(float)))
+        assert drawn_loops(source,20000,40000,top=5,
+                           min_length=1000) == expected
+        # the loops shorter than min_length are not drawn
+        assert len(drawn_loops(source,20000,40000,
+                               min_length=10000)) == (lengths >= 10000).sum()
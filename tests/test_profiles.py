@@ -0,0 +1,109 @@
+"""Tests of raesymatto.profiles."""
+import numpy as np
+import pandas as pd
+import pyBigWig
+import pytest
+
+from raesymatto import profiles
+from raesymatto.profiles import compute_matrix
+
+LENGTHS = {'chr1':200000,'chr2':50000}
+
+@pytest.fixture
+def bw_path(tmp_path) -> str:
+    """Writes a bigWig file of intervals separated by gaps."""
+    rng = np.random.default_rng(0)
+    path = str(tmp_path/'signal.bw')
+    bw = pyBigWig.open(path,'w')
+    bw.addHeader(list(LENGTHS.items()),maxZooms=0)
+    for chromosome,length in LENGTHS.items():
+        starts = np.sort(rng.choice(length-100,length//200,replace=False))
+        starts = starts[np.diff(starts,append=length) > 100]
+        ends = starts+rng.integers(1,100,starts.shape[0])
+        bw.addEntries([chromosome]*starts.shape[0],starts.tolist(),
+                      ends=ends.tolist(),
+                      values=rng.gamma(1.0,5.0,starts.shape[0]).tolist())
+    bw.close()
+    return path
+
+@pytest.fixture
+def regions() -> pd.DataFrame:
+    """Returns regions on both strands, also at the chromosome ends."""
+    rng = np.random.default_rng(1)
+    chromosomes = rng.choice(['chr1','chr2','chr3'],40,p=[0.6,0.3,0.1])
+    starts = np.array([rng.integers(0,LENGTHS.get(chromosome,1000))
+                       for chromosome in chromosomes])
+    starts[:2] = [0,LENGTHS['chr1']-500]
+    chromosomes[:2] = 'chr1'
+    ends = starts+rng.integers(1,20000,starts.shape[0])
+    return pd.DataFrame({0:chromosomes,1:starts,2:ends,3:'.',4:0,
+                         5:rng.choice(['+','-'],starts.shape[0])})
+
+def naive_matrix(path:str,regions:pd.DataFrame,mode:str,reference:str,
+                 upstream:int,downstream:int,body_length:int,
+                 bin_size:int) -> np.ndarray:
+    """Bins the per-base values of one region at a time.
+
+    The flanks are expected to be multiples of bin_size.
+
+    """
+    bw = pyBigWig.open(path)
+    n_body = body_length//bin_size
+    rows = []
+    for chromosome,start,end,strand in regions.iloc[:,[0,1,2,5]].values:
+        minus = strand == '-'
+        left,right = (downstream,upstream) if minus else (upstream,
+                                                          downstream)
+        if mode == 'reference-point':
+            if reference == 'center':
+                point = (start+end)//2
+            else:
+                point = end if minus == (reference == 'start') else start
+            edges = np.arange(point-left,point+right+1,bin_size)
+        else:
+            edges = np.concatenate((
+                np.arange(start-left,start,bin_size),
+                start+np.rint((end-start)*np.arange(n_body+1)/n_body),
+                np.arange(end+bin_size,end+right+1,bin_size)))
+        length = bw.chroms(chromosome) or 0
+        edges = np.clip(edges,0,length).astype(int)
+        row = []
+        for lower,upper in zip(edges[:-1],edges[1:]):
+            values = (np.array(bw.values(chromosome,int(lower),int(upper)))
+                      if upper > lower else np.zeros(0))
+            values = values[~np.isnan(values)]
+            row.append(values.mean() if values.shape[0] > 0 else np.nan)
+        rows.append(row[::-1] if minus else row)
+    bw.close()
+    return np.array(rows)
+
+@pytest.mark.parametrize('mode,reference',[('reference-point','center'),
+                                           ('reference-point','start'),
+                                           ('reference-point','end'),
+                                           ('scale-regions','center')])
+def test_matrix_matches_values(bw_path,regions,mode,reference,
+                               monkeypatch):
+    """The binned signal matches the per-base values of each region."""
+    # several chunks per chromosome
+    monkeypatch.setattr(profiles,'CHUNK_SIZE',7)
+    kwargs = {'mode':mode,'reference':reference,'upstream':3000,
+              'downstream':1000,'body_length':2000,'bin_size':100}
+    matrix,relative = compute_matrix([bw_path,bw_path],regions,**kwargs)
+    expected = naive_matrix(bw_path,regions,**kwargs)
+    assert matrix.shape == (2,)+expected.shape
+    assert relative.shape[0] == expected.shape[1]+1
+    assert np.isnan(expected).any() and not np.isnan(expected).all()
+    for sample in matrix:
+        np.testing.assert_allclose(sample,expected,rtol=1e-5)
+
+def test_workers_match_serial(bw_path,regions,monkeypatch):
+    """Chunks processed by worker processes give the same matrix."""
+    monkeypatch.setattr(profiles,'CHUNK_SIZE',7)
+    for mode in ['reference-point','scale-regions']:
+        serial,_ = compute_matrix([bw_path],regions,mode=mode)
+        parallel,_ = compute_matrix([bw_path],regions,mode=mode,workers=2)
+        np.testing.assert_array_equal(parallel,serial)
+    bw = pyBigWig.open(bw_path)
+    with pytest.raises(ValueError):
+        compute_matrix([bw],regions,workers=2)
+    bw.close()
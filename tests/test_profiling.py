@@ -0,0 +1,91 @@
+"""Tests of raesymatto.profiling."""
+import matplotlib.figure
+import numpy as np
+import pandas as pd
+import pyBigWig
+import pytest
+
+from raesymatto import profiling, render
+from raesymatto.intervals import get_intervals
+from raesymatto.visualizations import draw_bw
+
+@pytest.fixture
+def layout(tmp_path) -> dict:
+    """Returns a layout of a bigWig, BED, and gene model track."""
+    path = str(tmp_path/'signal.bw')
+    bw = pyBigWig.open(path,'w')
+    bw.addHeader([('chr1',100000)])
+    starts = np.arange(0,100000,100)
+    bw.addEntries(['chr1']*starts.shape[0],starts.tolist(),
+                  ends=(starts+100).tolist(),
+                  values=np.linspace(0,1,starts.shape[0]).tolist())
+    bw.close()
+    bed_starts = np.arange(0,100000,700)
+    bed = pd.DataFrame({0:'chr1',1:bed_starts,2:bed_starts+1000})
+    genes = pd.DataFrame({'seqname':'chr1','feature':'exon',
+                          'start':[1000,5000,30000],'end':[2000,9000,31000],
+                          'strand':'+','gene_id':['g0','g1','g2'],
+                          'transcript_id':['t0','t1','t2']})
+    return {'tracks':[{'type':'bw','source':path},
+                      {'type':'bed','source':bed},
+                      {'type':'gene_models','source':genes}],
+            'dpi':50}
+
+def test_render_region_phases(layout,tmp_path):
+    """The phases, features, and artists of each track are recorded."""
+    try:
+        with profiling.profile() as profiler:
+            render.render_region(layout,'chr1',0,20000,
+                                 str(tmp_path/'region.png'))
+    finally:
+        render.close_sources()
+    records = {record['name']:record for record in profiler.records}
+    # the profiled fetch_bw called by fetch_layout is recorded once
+    assert sorted(record['name'] for record in profiler.records) == [
+        'draw_bed','draw_bw','draw_gene_models','fetch_bw','figure']
+
+    bed = records['draw_bed']
+    assert set(bed['phases']) == {'query','layout','build'}
+    n_intervals = get_intervals(layout['tracks'][1]['source'],'chr1',0,
+                                20000).shape[0]
+    assert bed['features'] == n_intervals
+    assert bed['artists'] > 0
+    assert records['draw_gene_models']['features'] == 2
+    assert set(records['fetch_bw']['phases']) == {'query'}
+    assert set(records['figure']['phases']) == {'layout','render'}
+    for record in profiler.records:
+        assert sum(record['phases'].values()) == pytest.approx(
+            record['seconds'])
+        assert record['chromosome'] == 'chr1'
+        assert (record['start'],record['end']) == (0,20000)
+
+    summary = profiler.summary()
+    assert summary.loc['draw_bed','features'] == n_intervals
+    assert (summary['calls'] == 1).all()
+
+def test_nested_calls_are_not_double_counted(layout):
+    """Calls within a profiled call are a part of its phases."""
+    ax = matplotlib.figure.Figure().add_subplot()
+    bw = pyBigWig.open(layout['tracks'][0]['source'])
+    with profiling.profile() as profiler:
+        with profiling.track('outer',None,'chr1',0,20000,'render'):
+            draw_bw(ax,'chr1',0,20000,bw,nbins=100)
+            profiling.mark('build')
+    bw.close()
+    assert [record['name'] for record in profiler.records] == ['outer']
+    # the checkpoints of draw_bw are not those of the outer call
+    record = profiler.records[0]
+    assert set(record['phases']) == {'build','render'}
+    assert record['features'] is None
+    assert sum(record['phases'].values()) == pytest.approx(
+        record['seconds'])
+
+def test_nothing_is_recorded_outside_profile(layout):
+    """Calls are only recorded while a profiler is active."""
+    ax = matplotlib.figure.Figure().add_subplot()
+    bw = pyBigWig.open(layout['tracks'][0]['source'])
+    with profiling.profile() as profiler:
+        pass
+    draw_bw(ax,'chr1',0,20000,bw,nbins=100)
+    bw.close()
+    assert profiler.records == []
@@ -0,0 +1,69 @@
+"""Tests of rasterize_dense and the rasterization policy of layouts."""
+import matplotlib as mpl
+import matplotlib.figure
+import numpy as np
+import pandas as pd
+import pytest
+
+from raesymatto import render
+from raesymatto.visualizations import (MAX_ARTISTS, MAX_VERTICES,
+                                       rasterize_dense)
+
+def new_axes() -> mpl.axes.Axes:
+    """Returns axes with a vector text."""
+    ax = matplotlib.figure.Figure().add_subplot()
+    ax.text(0.5,0.5,'label')
+    return ax
+
+def is_rasterized(ax:mpl.axes.Axes) -> list:
+    """Returns whether the data artists of the axes are rasterized."""
+    return [artist.get_rasterized()
+            for artist in [*ax.collections,*ax.patches,*ax.lines]]
+
+@pytest.mark.parametrize('extra',[0,1])
+def test_vertex_threshold(extra):
+    """Data with more than MAX_VERTICES vertices is rasterized."""
+    ax = new_axes()
+    ax.plot(np.arange(MAX_VERTICES//2),np.zeros(MAX_VERTICES//2))
+    n = MAX_VERTICES-MAX_VERTICES//2+extra
+    ax.add_collection(mpl.collections.LineCollection(
+        np.zeros((n//2+n%2,2,2))))
+    assert rasterize_dense(ax) == bool(extra)
+    assert is_rasterized(ax) == [bool(extra)]*2
+    assert not ax.texts[0].get_rasterized()
+
+@pytest.mark.parametrize('extra',[0,1])
+def test_artist_threshold(extra):
+    """More than MAX_ARTISTS artists are rasterized."""
+    ax = new_axes()
+    for idx in range(MAX_ARTISTS+extra):
+        ax.add_patch(mpl.patches.Rectangle((idx,0),1,1))
+    assert rasterize_dense(ax) == bool(extra)
+    assert is_rasterized(ax) == [bool(extra)]*(MAX_ARTISTS+extra)
+    assert not ax.texts[0].get_rasterized()
+
+def test_sparse_data_is_vector_again():
+    """Artists become vector again when the axes are no longer dense."""
+    ax = new_axes()
+    patches = [ax.add_patch(mpl.patches.Rectangle((idx,0),1,1))
+               for idx in range(20)]
+    assert rasterize_dense(ax,max_artists=10)
+    for patch in patches[10:]:
+        patch.remove()
+    assert not rasterize_dense(ax,max_artists=10)
+    assert is_rasterized(ax) == [False]*10
+
+@pytest.mark.parametrize('policy,rasterized',[({'max_vertices':100},True),
+                                              (True,False),(False,False)])
+def test_layout_policy(tmp_path,policy,rasterized):
+    """Dense tracks of vector exports are embedded as images."""
+    starts = np.arange(0,100000,1000)
+    bed = pd.DataFrame({0:'chr1',1:starts,2:starts+500})
+    layout = {'tracks':[{'type':'region_information'},
+                        {'type':'bed','source':bed,'rasterize':policy}],
+              'format':'svg','dpi':50}
+    path = render.get_path(layout,str(tmp_path),'chr1',0,100000)
+    render.render_region(layout,'chr1',0,100000,path)
+    with open(path,encoding='utf-8') as f:
+        svg = f.read()
+    assert svg.count('<image') == int(rasterized)
@@ -0,0 +1,189 @@
+"""Tests of raesymatto.render."""
+import io
+
+import numpy as np
+import pandas as pd
+import pyBigWig
+import pytest
+
+from raesymatto import render
+
+LENGTH = 400000
+
+@pytest.fixture
+def layout(tmp_path) -> dict:
+    """Returns a layout whose bigWig scale varies between the regions."""
+    rng = np.random.default_rng(0)
+    starts = np.arange(0,LENGTH,100)
+    scales = np.repeat([1.0,1000.0,0.01,50000.0],starts.shape[0]//4)
+    path = str(tmp_path/'signal.bw')
+    bw = pyBigWig.open(path,'w')
+    bw.addHeader([('chr1',LENGTH)])
+    bw.addEntries(['chr1']*starts.shape[0],starts.tolist(),
+                  ends=(starts+100).tolist(),
+                  values=(rng.gamma(1.0,1.0,starts.shape[0])*scales)
+                  .tolist())
+    bw.close()
+
+    bed_starts = np.sort(rng.integers(0,LENGTH,100))
+    bed = pd.DataFrame({0:'chr1',1:bed_starts,
+                        2:bed_starts+rng.integers(100,20000,100),
+                        3:['name%d'%idx for idx in range(100)]})
+    gene_starts = np.arange(0,LENGTH,5000)
+    genes = pd.DataFrame({'seqname':'chr1','feature':'exon',
+                          'start':gene_starts,'end':gene_starts+3000,
+                          'strand':'+',
+                          'gene_id':['g%d'%idx
+                                     for idx in range(gene_starts.shape[0])],
+                          'transcript_id':['t%d'%idx for idx in
+                                           range(gene_starts.shape[0])]})
+    return {'tracks':[{'type':'region_information'},
+                      {'type':'bw','source':path,
+                       'options':{'nbins':'auto'}},
+                      {'type':'bed','source':bed},
+                      {'type':'gene_models','source':genes,
+                       'options':{'mode':'full'}}],
+            'dpi':50}
+
+def get_png(figure:render.GenomeBrowserFigure) -> bytes:
+    """Returns the figure as a PNG image."""
+    output = io.BytesIO()
+    figure.savefig(output,format='png')
+    return output.getvalue()
+
+def test_reused_figure_matches_fresh_figure(layout):
+    """A region is drawn identically regardless of the previous ones."""
+    regions = [('chr1',idx*LENGTH//4,(idx+1)*LENGTH//4) for idx in range(4)]
+    try:
+        fresh = [get_png(render.GenomeBrowserFigure(layout).update(*region))
+                 for region in regions]
+        figure = render.GenomeBrowserFigure(layout)
+        for idx in [3,0,2,1,3,0]:
+            assert get_png(figure.update(*regions[idx])) == fresh[idx]
+    finally:
+        render.close_sources()
+
+def test_artists_are_updated_in_place(layout):
+    """BED and gene model collections are reused between regions."""
+    layout['tracks'] = layout['tracks'][2:]
+    figure = render.GenomeBrowserFigure(layout)
+    figure.update('chr1',0,100000)
+    drawn = {key:dict(artists) for key,artists in figure.drawn.items()}
+    assert sorted(drawn) == [(0,0),(1,0)]
+    assert sorted(drawn[(1,0)]) == ['arrows','labels','rectangles']
+    for start in [10000,20000,200000]:
+        figure.update('chr1',start,start+100000)
+        for key,artists in drawn.items():
+            for role,artist in artists.items():
+                assert figure.drawn[key][role] is artist
+                assert artist in figure.axes[key[0]].get_children()
+
+def test_layout_is_reused(layout,monkeypatch):
+    """The layout is computed again only when the decorations change."""
+    layouts = []
+    def recording_layout(fig):
+        layouts.append(fig)
+        real_layout(fig)
+    real_layout = render.tight_layout
+    monkeypatch.setattr(render,'tight_layout',recording_layout)
+
+    regions = [('chr1',idx*LENGTH//4,idx*LENGTH//4+20000)
+               for idx in range(4)]
+    try:
+        # the tick labels of the bigWig track change between the quarters
+        figure = render.GenomeBrowserFigure(layout)
+        for idx in [0,0,3,3,0]:
+            figure.update(*regions[idx])
+        assert len(layouts) == 3
+
+        # and stay the same with a fixed range
+        layout['tracks'][1]['options'].update(ymin=0,ymax=100)
+        figure = render.GenomeBrowserFigure(layout)
+        for start in range(0,LENGTH-20000,20000):
+            figure.update('chr1',start,start+20000)
+        assert len(layouts) == 4
+        fresh = render.GenomeBrowserFigure(layout).update(*regions[0])
+        assert get_png(figure.update(*regions[0])) == get_png(fresh)
+    finally:
+        render.close_sources()
+
+def test_reused_layout_matches_fresh_layout(layout):
+    """Regions of equal layout extents are drawn as on a new figure."""
+    # the subplot parameters of these regions differ in the last bits
+    regions = [('chr1',start,start+50000) for start in (0,60000,120000)]
+    try:
+        fresh = [get_png(render.GenomeBrowserFigure(layout).update(*region))
+                 for region in regions]
+        figure = render.GenomeBrowserFigure(layout)
+        for idx in [1,2,1,0,2]:
+            assert get_png(figure.update(*regions[idx])) == fresh[idx]
+    finally:
+        render.close_sources()
+
+def read_outputs(results:pd.DataFrame) -> list:
+    """Returns the contents of the rendered files."""
+    outputs = []
+    for path in results['path']:
+        with open(path,'rb') as f:
+            outputs.append(f.read())
+    return outputs
+
+def test_workers_write_regions(layout,tmp_path):
+    """Worker processes write the files of the regions in order."""
+    regions = [('chr1',start,start+50000) for start in range(0,300000,
+                                                              60000)]
+    regions.insert(2,('chrX',0,1000))
+    try:
+        results = render.render_regions(layout,regions,
+                                        str(tmp_path/'workers'),workers=2)
+        serial = render.render_regions(layout,regions,
+                                       str(tmp_path/'serial'))
+    finally:
+        render.close_sources()
+    assert [tuple(row) for row in results.iloc[:,:3].values] == regions
+    failed = results['error'].notna()
+    assert failed.tolist() == [region[0] == 'chrX' for region in regions]
+    assert results.loc[failed,'path'].isna().all()
+    written = results[~failed]
+    assert written['path'].tolist() == [
+        render.get_path(layout,str(tmp_path/'workers'),*region)
+        for region in regions if region[0] != 'chrX']
+    assert read_outputs(written) == read_outputs(serial[~failed])
+
+def test_prefetch_matches_serial(layout,tmp_path):
+    """Prefetched regions are rendered in order and as without it."""
+    regions = [('chr1',start,start+50000) for start in range(0,300000,
+                                                              60000)]
+    regions.insert(2,('chrX',0,1000))
+    try:
+        results = render.render_regions(layout,regions,
+                                        str(tmp_path/'prefetch'),prefetch=2)
+        serial = render.render_regions(layout,regions,
+                                       str(tmp_path/'serial'))
+    finally:
+        render.close_sources()
+    assert [tuple(row) for row in results.iloc[:,:3].values] == regions
+    pd.testing.assert_series_equal(results['error'].isna(),
+                                   serial['error'].isna())
+    failed = results['error'].notna()
+    assert failed.sum() == 1
+    assert read_outputs(results[~failed]) == read_outputs(serial[~failed])
+
+def test_prefetch_is_bounded(layout,monkeypatch):
+    """At most prefetch regions are fetched ahead of the consumer."""
+    figure = render.GenomeBrowserFigure(layout)
+    fetched = []
+    monkeypatch.setattr(figure,'fetch',
+                        lambda *region: fetched.append(region) or region)
+    regions = [('chr1',start,start+1000) for start in range(0,20000,1000)]
+    consumed = []
+    for region,data in render.prefetch_regions(figure,regions,prefetch=3):
+        assert data == region
+        consumed.append(region)
+        # the queue, and the region waiting for room in it
+        assert len(fetched) <= len(consumed)+3+1
+        if len(consumed) == 5:
+            break
+    assert consumed == regions[:5]
+    # the producer stopped with the consumer
+    assert len(fetched) <= 5+3+1
@@ -0,0 +1,28 @@
+"""Tests of get_row_order."""
+import builtins
+
+import numpy as np
+import pytest
+
+from raesymatto.visualizations import get_row_order
+
+def test_cluster_order_without_scipy(monkeypatch):
+    """Clustering without scipy fails with an informative error."""
+    real_import = builtins.__import__
+    def blocking_import(name,*args,**kwargs):
+        if name.startswith('scipy'):
+            raise ImportError('No module named %s'%name)
+        return real_import(name,*args,**kwargs)
+    monkeypatch.setattr(builtins,'__import__',blocking_import)
+    with pytest.raises(ImportError,match=r'raesymatto\[cluster\]'):
+        get_row_order(np.random.default_rng(0).random((5,10)),'cluster')
+
+def test_cluster_order():
+    """Clustering orders correlated rows next to each other."""
+    pytest.importorskip('scipy')
+    base = np.random.default_rng(0).random((2,20))
+    matrix = base[[0,1,0,1]]+0.01*np.arange(4)[:,None]
+    order = get_row_order(matrix,'cluster')
+    assert sorted(order) == [0,1,2,3]
+    assert {frozenset(order[:2]),frozenset(order[2:])} == {
+        frozenset((0,2)),frozenset((1,3))}
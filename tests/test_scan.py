@@ -0,0 +1,92 @@
+"""Tests of raesymatto.scan."""
+import numpy as np
+import pandas as pd
+import pyBigWig
+import pytest
+
+from raesymatto import scan
+from raesymatto.scan import scan_windows
+
+LENGTHS = {'chr1':100000,'chr2':25300}
+
+@pytest.fixture
+def bw_paths(tmp_path) -> list:
+    """Writes two bigWig files of intervals separated by gaps."""
+    rng = np.random.default_rng(0)
+    paths = []
+    for sample in range(2):
+        path = str(tmp_path/('sample%d.bw'%sample))
+        bw = pyBigWig.open(path,'w')
+        bw.addHeader(list(LENGTHS.items()),maxZooms=0)
+        for chromosome,length in LENGTHS.items():
+            starts = np.sort(rng.choice(length-100,length//500,
+                                        replace=False))
+            starts = starts[np.diff(starts,append=length) > 100]
+            ends = starts+rng.integers(1,100,starts.shape[0])
+            bw.addEntries([chromosome]*starts.shape[0],starts.tolist(),
+                          ends=ends.tolist(),
+                          values=rng.gamma(1.0,5.0,
+                                           starts.shape[0]).tolist())
+        bw.close()
+        paths.append(path)
+    return paths
+
+def brute_force(paths:list,window:int,step:int,summary:str,
+                score:str) -> pd.DataFrame:
+    """Scores every window of the chromosomes one at a time."""
+    bws = [pyBigWig.open(path) for path in paths]
+    rows = []
+    for chromosome,length in LENGTHS.items():
+        for start in range(0,max(length-window,0)+step,step):
+            end = min(start+window,length)
+            values = []
+            for bw in bws:
+                signal = np.array(bw.values(chromosome,start,end))
+                signal = signal[~np.isnan(signal)]
+                values.append(getattr(signal,summary)()
+                              if signal.shape[0] > 0 else np.nan)
+            values = np.array(values)
+            if score == 'log_fold_change':
+                value = np.log2(values[0]+1.0)-np.log2(values[1]+1.0)
+            elif np.isnan(values).all():
+                value = np.nan
+            else:
+                value = values[~np.isnan(values)].mean()
+            if not np.isnan(value):
+                rows.append((chromosome,start,end,value))
+    for bw in bws:
+        bw.close()
+    rows.sort(key=lambda row:row[3],reverse=True)
+    return pd.DataFrame(rows,columns=['chromosome','start','end','score'])
+
+@pytest.mark.parametrize('window,step,summary,score',
+                         [(1000,None,'mean','mean'),
+                          (1000,300,'max','mean'),
+                          (2500,1000,'mean','log_fold_change')])
+def test_top_windows_match_brute_force(bw_paths,window,step,summary,
+                                       score,monkeypatch):
+    """The top windows and their scores match scoring every window."""
+    # several chunks per chromosome
+    monkeypatch.setattr(scan,'CHUNK_SIZE',16)
+    expected = brute_force(bw_paths,window,step or window,summary,score)
+    scores = {(chromosome,start,end):value for chromosome,start,end,value
+              in expected.itertuples(index=False)}
+    for top in [1,10,None]:
+        result = scan_windows(bw_paths,window,step,score,top,summary,
+                              groups=([0],[1]))
+        reference = expected if top is None else expected.iloc[:top]
+        # the scores of overlapping windows may tie, so the windows
+        # are compared by their brute-force scores
+        np.testing.assert_allclose(result['score'],reference['score'],
+                                   rtol=1e-5,atol=1e-5)
+        np.testing.assert_allclose(
+            result['score'],[scores[key] for key in zip(
+                result['chromosome'],result['start'],result['end'])],
+            rtol=1e-5,atol=1e-5)
+
+def test_workers_match_serial(bw_paths,monkeypatch):
+    """Chunks scanned by worker processes give the same windows."""
+    monkeypatch.setattr(scan,'CHUNK_SIZE',16)
+    serial = scan_windows(bw_paths,1000,500,top=20)
+    parallel = scan_windows(bw_paths,1000,500,top=20,workers=2)
+    pd.testing.assert_frame_equal(parallel,serial)
@@ -0,0 +1,96 @@
+"""Tests of raesymatto.server."""
+import os
+
+import numpy as np
+import pandas as pd
+import pyBigWig
+import pytest
+
+from raesymatto import bigwig, render, server
+
+@pytest.fixture
+def layouts(tmp_path,monkeypatch) -> dict:
+    """Returns two layouts with BED files of their own and a shared one."""
+    rng = np.random.default_rng(0)
+    paths = {}
+    for name in ['first','second','shared']:
+        starts = np.sort(rng.integers(0,100000,50))
+        paths[name] = str(tmp_path/('%s.bed'%name))
+        pd.DataFrame({0:'chr1',1:starts,2:starts+1000}).to_csv(
+            paths[name],sep='\t',header=False,index=False)
+    layouts = {name:{'tracks':[{'type':'bed','source':paths[name]},
+                               {'type':'bed','source':paths['shared']}]}
+               for name in ['first','second']}
+    monkeypatch.setattr(server,'_FIGURES',{})
+    monkeypatch.setattr(server,'_STATS',{})
+    server._init_tile_worker(layouts)
+    render.close_sources()
+    yield layouts
+    render.close_sources()
+
+def test_layouts_keep_their_figures(layouts,monkeypatch):
+    """Alternating layouts reuse their figures and opened files."""
+    opened = []
+    def recording_open(kind,source):
+        opened.append(os.path.basename(source))
+        return real_open(kind,source)
+    real_open = render._open
+    monkeypatch.setattr(render,'_open',recording_open)
+
+    def render_tile(name:str) -> None:
+        server._render_tile(name,server.get_version(layouts[name]),'chr1',
+                            0,50000,64)
+
+    for _ in range(3):
+        for name in ['first','second']:
+            render_tile(name)
+    assert sorted(opened) == ['first.bed','second.bed','shared.bed']
+    figure = server._FIGURES['second'][1]
+
+    # a changed file is reopened only by the layouts using it
+    path = layouts['first']['tracks'][0]['source']
+    with open(path,'a',encoding='utf-8') as f:
+        f.write('chr1\t200000\t201000\n')
+    os.utime(path,ns=(1,1))
+    opened.clear()
+    for name in ['first','second']:
+        render_tile(name)
+    assert opened == ['first.bed']
+    assert server._FIGURES['second'][1] is figure
+
+def write_bigwig(path:str,length:int,value:float) -> None:
+    """Writes a bigWig file of a constant value."""
+    bw = pyBigWig.open(path,'w')
+    bw.addHeader([('chr1',length)])
+    bw.addEntries(['chr1'],[0],ends=[length],values=[value])
+    bw.close()
+
+def test_rewritten_bigwig_is_reopened(tmp_path,monkeypatch):
+    """A new version of a layout reads the rewritten bigWig file."""
+    path = str(tmp_path/'signal.bw')
+    write_bigwig(path,100000,1.0)
+    layouts = {'signal':{'tracks':[{'type':'bw','source':path}]}}
+    monkeypatch.setattr(server,'_FIGURES',{})
+    monkeypatch.setattr(server,'_STATS',{})
+    server._init_tile_worker(layouts)
+    render.close_sources()
+    try:
+        version = server.get_version(layouts['signal'])
+        server._render_tile('signal',version,'chr1',0,50000,64)
+        source = bigwig.open_bigwig(path)
+        assert source.chroms('chr1') == 100000
+
+        # the file is rewritten with a longer chromosome
+        write_bigwig(path,200000,5.0)
+        os.utime(path,ns=(1,1))
+        assert server.get_version(layouts['signal']) != version
+        version = server.get_version(layouts['signal'])
+        server._render_tile('signal',version,'chr1',150000,200000,64)
+        reopened = bigwig.open_bigwig(path)
+        assert reopened is not source
+        assert reopened.chroms('chr1') == 200000
+        _,values = reopened.get_bins('chr1',150000,200000,1,'mean')
+        assert values[0,0] == 5.0
+    finally:
+        render.close_sources()
+    assert path not in bigwig._SOURCES
@@ -0,0 +1,101 @@
+"""Tests of raesymatto.store."""
+import pickle
+
+import matplotlib.figure
+import numpy as np
+import pandas as pd
+import pytest
+
+from raesymatto.genes import GeneModelIndex
+from raesymatto.intervals import BedIndex, get_intervals
+from raesymatto.store import (AnnotationStore, ColumnTable, SharedArray,
+                              map_arrays)
+from raesymatto.visualizations import draw_bed, draw_boxes
+
+@pytest.fixture
+def bed() -> pd.DataFrame:
+    """Returns BED data on two chromosomes."""
+    return pd.DataFrame({'chromosome':['chr1']*4+['chr2']*2,
+                         'start':[100,150,400,1000,100,300],
+                         'end':[200,300,500,1100,200,400],
+                         'name':['a','b','c','d','e','f'],
+                         'score':[1.0,2.0,3.0,4.0,5.0,6.0]})
+
+def test_attached_index_queries(bed):
+    """Attached indices return the same rows as the original ones."""
+    index = BedIndex(bed)
+    with AnnotationStore() as store:
+        attached = pickle.loads(pickle.dumps(store.add(index)))
+        for region in [('chr1',120,450),('chr2',0,1000),('chr3',0,10)]:
+            expected = index.query(*region)
+            result = get_intervals(attached,*region)
+            pd.testing.assert_frame_equal(
+                result.reset_index(drop=True),
+                expected.reset_index(drop=True),check_dtype=False)
+
+def test_data_frames_are_indexed(bed):
+    """Data frames are added as BED indices."""
+    with AnnotationStore() as store:
+        attached = store.add(bed)
+        assert isinstance(attached,BedIndex)
+        assert list(attached.query('chr1',0,250)['name']) == ['a','b']
+
+def test_column_tables_are_rejected(bed):
+    """Bare column tables cannot be queried and are rejected."""
+    with AnnotationStore() as store:
+        with pytest.raises(TypeError):
+            store.add(ColumnTable.from_dataframe(bed))
+
+@pytest.mark.parametrize('draw',[draw_bed,draw_boxes])
+def test_draw_from_attached_store(bed,draw):
+    """The draw functions accept attached indices."""
+    with AnnotationStore() as store:
+        attached = pickle.loads(pickle.dumps(store.add(bed)))
+        fig = matplotlib.figure.Figure()
+        ax = fig.add_subplot()
+        draw(ax,'chr1',0,1200,attached)
+        fig.canvas.draw()
+        expected = matplotlib.figure.Figure()
+        expected_ax = expected.add_subplot()
+        draw(expected_ax,'chr1',0,1200,BedIndex(bed))
+        assert np.allclose(ax.get_ylim(),expected_ax.get_ylim())
+        assert len(ax.get_children()) == len(expected_ax.get_children())
+
+def get_arrays(value,path:str='index') -> list:
+    """Returns the arrays of an index and the paths of its attributes."""
+    if isinstance(value,(np.ndarray,pd.api.extensions.ExtensionArray)):
+        return [(path,value)]
+    if isinstance(value,ColumnTable):
+        return get_arrays(value.columns,path+'.columns')
+    if isinstance(value,dict):
+        return [item for key,child in value.items()
+                for item in get_arrays(child,'%s[%r]'%(path,key))]
+    if isinstance(value,tuple):
+        return [item for idx,child in enumerate(value)
+                for item in get_arrays(child,'%s[%d]'%(path,idx))]
+    if hasattr(value,'__dict__'):
+        return [item for key,child in vars(value).items()
+                for item in get_arrays(child,'%s.%s'%(path,key))]
+    return []
+
+def test_gene_models_are_shared():
+    """Every array of a stored gene model index is in shared memory."""
+    genes = pd.DataFrame({'seqname':['chr1']*3,
+                          'feature':['transcript','exon','exon'],
+                          'start':[100,100,400],'end':[500,200,500],
+                          'strand':['+']*3,'gene_id':['g1']*3,
+                          'transcript_id':['t1']*3})
+    with AnnotationStore() as store:
+        attached = store.add(GeneModelIndex(genes))
+        arrays = get_arrays(attached)
+        assert arrays
+        for path,array in arrays:
+            assert isinstance(array,SharedArray),path
+        assert list(attached.feature) == ['transcript','exon','exon']
+
+def test_extension_arrays_are_converted():
+    """Extension arrays are converted into plain arrays."""
+    with AnnotationStore() as store:
+        shared = map_arrays(pd.array(['a','b']),store.add_array)
+        assert isinstance(shared,SharedArray)
+        assert list(shared) == ['a','b']
@@ -0,0 +1,136 @@
+"""Tests of raesymatto.tabix.
+
+tests/data/htslib.bed.gz and its index were written by htslib (bgzip and
+tabix -p bed, through pysam 0.24.1) from 5000 sorted BED records on two
+chromosomes, some of them spanning up to 2 Mb.
+"""
+import gzip
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from raesymatto.intervals import BedIndex, get_intervals
+from raesymatto.tabix import (BGZF_BLOCK_SIZE, BgzfReader, TabixBed,
+                              TabixFile, TabixIndex, bgzip, build_index,
+                              reg2bin, reg2bins)
+
+DATA = os.path.join(os.path.dirname(__file__),'data')
+
+def read_records(path:str) -> pd.DataFrame:
+    """Reads the records of a (block-)gzipped BED file."""
+    with gzip.open(path,'rt') as f:
+        return pd.read_csv(f,sep='\t',header=None,comment='#')
+
+def expected_names(bed:pd.DataFrame,chromosome:str,start:int,
+                   end:int) -> list:
+    """Returns the names of the records overlapping the region."""
+    return list(bed[(bed[0] == chromosome) & (bed[1] < end) &
+                    (bed[2] > start)][3])
+
+def fetched_names(path:str,chromosome:str,start:int,end:int,
+                  index:str=None) -> list:
+    """Returns the names of the records fetched from the region."""
+    with TabixFile(path,index) as tabix:
+        return [fields[3] for fields in tabix.fetch(chromosome,start,end)]
+
+def get_regions(bed:pd.DataFrame,n:int=200) -> list:
+    """Returns random regions, including long and empty ones."""
+    rng = np.random.default_rng(0)
+    regions = [('chr1',0,1),('chr1',0,6000000),('chr2',2999999,3000000),
+               ('chr3',0,100),('chr1',16383,16385),('chr2',1<<17,1<<20)]
+    for _ in range(n):
+        chromosome = rng.choice(['chr1','chr2'])
+        start = int(rng.integers(0,5000000))
+        length = int(rng.choice([1,100,10000,1<<17,1<<21]))
+        regions.append((str(chromosome),start,start+length))
+    return regions
+
+@pytest.fixture(scope='module')
+def htslib_bed() -> pd.DataFrame:
+    """Returns the records of the file written by htslib."""
+    return read_records(os.path.join(DATA,'htslib.bed.gz'))
+
+@pytest.fixture
+def bed_path(tmp_path,htslib_bed) -> str:
+    """Writes the records as an uncompressed BED file."""
+    path = str(tmp_path/'regions.bed')
+    htslib_bed.to_csv(path,sep='\t',header=False,index=False)
+    return path
+
+def test_reg2bins_contains_reg2bin():
+    """The bin of an interval is among the bins overlapping it."""
+    rng = np.random.default_rng(0)
+    for _ in range(1000):
+        start = int(rng.integers(0,1<<29))
+        end = start+int(rng.integers(1,1<<22))
+        assert reg2bin(start,end) in reg2bins(start,end)
+
+def test_bgzip_round_trip(bed_path):
+    """Compressed files decompress into the original bytes."""
+    output = bgzip(bed_path)
+    with open(bed_path,'rb') as f:
+        data = f.read()
+    with gzip.open(output,'rb') as f:
+        assert f.read() == data
+    assert len(data) > 2*BGZF_BLOCK_SIZE
+
+    # lines are yielded whole across the block boundaries
+    with BgzfReader(output) as reader:
+        lines = [line for _,_,line in reader.lines()]
+    assert b'\n'.join(lines).rstrip(b'\n') == data.rstrip(b'\n')
+
+def test_htslib_file(htslib_bed):
+    """Files written by htslib are queried correctly."""
+    path = os.path.join(DATA,'htslib.bed.gz')
+    for region in get_regions(htslib_bed):
+        assert fetched_names(path,*region) == expected_names(htslib_bed,
+                                                             *region)
+
+def test_index_of_htslib_file(tmp_path,htslib_bed):
+    """Indices built for htslib files agree with the htslib indices."""
+    path = str(tmp_path/'htslib.bed.gz')
+    shutil.copy(os.path.join(DATA,'htslib.bed.gz'),path)
+    build_index(path)
+    ours = TabixIndex(path+'.tbi')
+    theirs = TabixIndex(os.path.join(DATA,'htslib.bed.gz.tbi'))
+    assert ours.names == theirs.names
+    for region in get_regions(htslib_bed):
+        assert fetched_names(path,*region) == expected_names(htslib_bed,
+                                                             *region)
+
+def test_build_index_round_trip(bed_path,htslib_bed):
+    """bgzip and build_index produce files which are queried correctly."""
+    path = bgzip(bed_path)
+    build_index(path)
+    for region in get_regions(htslib_bed):
+        assert fetched_names(path,*region) == expected_names(htslib_bed,
+                                                             *region)
+
+def test_unsorted_files_are_rejected(tmp_path):
+    """Indexing unsorted files fails."""
+    path = str(tmp_path/'unsorted.bed')
+    with open(path,'w',encoding='utf-8') as f:
+        f.write('chr1\t100\t200\ta\nchr1\t50\t60\tb\n')
+    with pytest.raises(ValueError):
+        build_index(bgzip(path))
+
+def test_numeric_chromosome_names(tmp_path):
+    """Chromosome names and names of records stay strings."""
+    path = str(tmp_path/'numeric.bed')
+    with open(path,'w',encoding='utf-8') as f:
+        f.write('1\t100\t200\t7\t0.5\t+\n'
+                '1\t150\t300\t8\t.\t-\n'
+                '2\t100\t200\t9\t1\t+\n')
+    path = bgzip(path)
+    build_index(path)
+    records = TabixBed(path).query('1',0,1000)
+    assert records[0].tolist() == ['1','1']
+    assert records[3].tolist() == ['7','8']
+    assert records[1].tolist() == [100,150]
+    assert records[2].tolist() == [200,300]
+    # the records match string chromosome queries
+    assert len(get_intervals(records,'1',0,1000)) == 2
+    assert len(BedIndex(records).query('1',0,1000)) == 2